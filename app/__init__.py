@@ -3,11 +3,35 @@ Blood Bridge Flask application factory.
 Uses DynamoDB for persistence (boto3).
 """
 import os
-from flask import Flask
+from flask import Flask, g
 from flask_cors import CORS
 
-from config import SECRET_KEY, LOG_DIR, AWS_REGION
+from config import (
+    SECRET_KEY,
+    LOG_DIR,
+    AWS_REGION,
+    REQUEST_DEADLINE_MS,
+    NOTIFY_CHANNEL,
+    NOTIFY_WORKERS,
+    BATCH_WORKERS,
+    SINGLEFLIGHT_SHARED,
+)
 from app.services.dynamodb_client import get_dynamodb_tables
+from app.services.deadline import start_request_deadline, InvalidCursor
+from app.services.derived_views import register_derived_views
+from app.services.donor_index import register_donor_index
+from app.services.donation_slots import register_slot_bookings
+from app.services.allocation import register_allocation_engine
+from app.services.inventory_ledger import register_inventory_ledger
+from app.services.shortage_alerts import register_shortage_monitor
+from app.services.demand_forecast import DemandForecaster
+from app.services.notifications import build_channel, register_notifications
+from app.services.etags import register_view_versions
+from app.services.live_feed import register_live_feed
+from app.services.batch import BatchRunner
+from app.services.singleflight import SingleFlight
+from app.services.resilience import DatabaseUnavailable
+from app.services.responses import json_response
 
 
 def create_app(config_overrides=None):
@@ -38,7 +62,45 @@ def create_app(config_overrides=None):
         methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
     )
 
+    app.config.setdefault("REQUEST_DEADLINE_MS", REQUEST_DEADLINE_MS)
     app.extensions["dynamodb"] = get_dynamodb_tables(app)
+    register_derived_views(app.extensions["dynamodb"])
+    register_donor_index(app.extensions["dynamodb"])
+    register_slot_bookings(app.extensions["dynamodb"])
+    app.extensions["inventory_ledger"] = register_inventory_ledger(app.extensions["dynamodb"])
+    app.extensions["allocation"] = register_allocation_engine(app.extensions["dynamodb"])
+    app.extensions["shortage_monitor"] = register_shortage_monitor(app.extensions["dynamodb"])
+    app.extensions["demand_forecast"] = DemandForecaster(app.extensions["dynamodb"])
+    app.extensions["notifications"] = register_notifications(
+        app.extensions["dynamodb"],
+        build_channel(app.config.get("NOTIFY_CHANNEL", NOTIFY_CHANNEL)),
+        workers=app.config.get("NOTIFY_WORKERS", NOTIFY_WORKERS),
+    )
+    app.extensions["live_feed"] = register_live_feed(
+        app.extensions["dynamodb"], app.extensions["shortage_monitor"]
+    )
+    # Last, so a version only moves once every view of that change is written.
+    register_view_versions(app.extensions["dynamodb"])
+    app.extensions["singleflight"] = SingleFlight(
+        app.extensions["dynamodb"], shared=app.config.get("SINGLEFLIGHT_SHARED", SINGLEFLIGHT_SHARED)
+    )
+    app.extensions["batch"] = BatchRunner(app, workers=app.config.get("BATCH_WORKERS", BATCH_WORKERS))
+
+    @app.before_request
+    def request_deadline():
+        # Batch sub-requests already carry what is left of the batch's deadline.
+        if "deadline" not in g:
+            start_request_deadline(app.config["REQUEST_DEADLINE_MS"])
+
+    @app.errorhandler(DatabaseUnavailable)
+    def database_unavailable(e):
+        # Fail fast and visibly instead of rendering empty dashboards.
+        app.logger.warning("DynamoDB unavailable: %s", e)
+        return json_response(False, "Service temporarily unavailable. Please try again shortly.", None, 503)
+
+    @app.errorhandler(InvalidCursor)
+    def invalid_cursor(e):
+        return json_response(False, "Invalid cursor; start again without one.", None, 400)
 
     # Ensure log directory exists
     LOG_DIR.mkdir(parents=True, exist_ok=True)
@@ -52,12 +114,14 @@ def create_app(config_overrides=None):
     from app.routes.admin_auth import admin_auth_bp
     from app.routes.admin import admin_bp
     from app.routes.pages import pages_bp
+    from app.routes.batch import batch_bp
 
     app.register_blueprint(auth_bp, url_prefix="/api/auth")
     app.register_blueprint(donors_bp, url_prefix="/api/donors")
     app.register_blueprint(requests_bp, url_prefix="/api/requests")
     app.register_blueprint(matching_bp, url_prefix="/api/matching")
     app.register_blueprint(health_bp, url_prefix="/api")
+    app.register_blueprint(batch_bp, url_prefix="/api")
     app.register_blueprint(admin_auth_bp, url_prefix="/api/admin")
     app.register_blueprint(admin_bp, url_prefix="/api/admin")
     app.register_blueprint(pages_bp)
@@ -1,6 +1,7 @@
 """
 Donation (donor) model and serialization for DynamoDB items.
 """
+from config import DEFAULT_SITE_ID
 
 
 class Donation:
@@ -20,6 +21,9 @@ class Donation:
             "location": doc.get("location", ""),
             "time_slot": doc.get("time_slot", ""),
             "status": doc.get("status", "Scheduled"),
+            "site_id": doc.get("site_id") or DEFAULT_SITE_ID,
+            "lat": doc.get("lat"),
+            "lon": doc.get("lon"),
         }
 
     @staticmethod
@@ -3,6 +3,8 @@ Blood request model and serialization for DynamoDB items.
 """
 from datetime import datetime
 
+from config import DEFAULT_REQUEST_URGENCY, DEFAULT_SITE_ID
+
 
 def _format_timestamp(ts):
     if ts is None:
@@ -29,7 +31,11 @@ class BloodRequest:
             "units": doc.get("units"),
             "hospital": doc.get("hospital", "N/A"),
             "status": doc.get("status", "pending"),
+            "urgency": doc.get("urgency") or DEFAULT_REQUEST_URGENCY,
+            "site_id": doc.get("site_id") or DEFAULT_SITE_ID,
             "timestamp": _format_timestamp(doc.get("timestamp")),
+            "lat": doc.get("lat"),
+            "lon": doc.get("lon"),
         }
         if extra:
             out.update(extra)
@@ -1,6 +1,7 @@
 """
 User model and serialization for DynamoDB items.
 """
+from app.services.resilience import DatabaseUnavailable
 
 
 class User:
@@ -18,6 +19,7 @@ class User:
             "role": doc.get("role"),
             "current_role": doc.get("current_role"),
             "blood_group": doc.get("blood_group"),
+            "site_id": doc.get("site_id"),
         }
 
     @staticmethod
@@ -26,5 +28,7 @@ class User:
         try:
             r = db.users.get_item(Key={"id": str(user_id)})
             return r.get("Item")
+        except DatabaseUnavailable:
+            raise
         except Exception:
             return None
@@ -1,22 +1,20 @@
 """
-Admin-only APIs: dashboard, users, requests, donations, inventory, user delete.
+Admin-only APIs: dashboard, users, requests, donations, inventory (network and per site),
+user delete, blood bank site assignment, donation slot capacity, shortage thresholds,
+demand forecast.
 Protected by admin session (admin_id in session).
 """
-from flask import Blueprint, jsonify, session, current_app
+from flask import Blueprint, request, session, current_app
 
 from app.routes.admin_auth import require_admin_session
 from app.services.admin_service import AdminService
+from app.services.streaming import stream_list, streamed
+from app.services.responses import json_response
+from app.services.validation import validate_shortage_thresholds, validate_site_assignment, validate_slot_capacity
 
 admin_bp = Blueprint("admin", __name__)
 
 
-def json_response(success, message, data=None, status_code=200):
-    out = {"success": success, "message": message}
-    if data is not None:
-        out["data"] = data
-    return jsonify(out), status_code
-
-
 def admin_required(f):
     """Alias for require_admin_session for readability in this module."""
     return require_admin_session(f)
@@ -31,11 +29,11 @@ def dashboard():
 
 
 @admin_bp.route("/users", methods=["GET"])
+@streamed
 @admin_required
 def users():
     svc = AdminService(current_app)
-    data = {"users": svc.list_users()}
-    return json_response(True, "OK", data)
+    return stream_list("users", svc.iter_users())
 
 
 @admin_bp.route("/users/<user_id>/delete", methods=["POST", "DELETE"])
@@ -47,26 +45,89 @@ def delete_user(user_id):
     return json_response(success, message, None, status)
 
 
+@admin_bp.route("/users/<user_id>/site", methods=["PUT", "POST"])
+@admin_required
+def assign_site(user_id):
+    data = request.get_json(silent=True) or request.form.to_dict()
+    v = validate_site_assignment(data)
+    if not v["valid"]:
+        return json_response(False, v["error"], None, 400)
+    svc = AdminService(current_app)
+    success, message = svc.assign_site(user_id, data["site_id"].strip())
+    status = 200 if success else 404
+    return json_response(success, message, None, status)
+
+
 @admin_bp.route("/requests", methods=["GET"])
+@streamed
 @admin_required
 def requests():
     svc = AdminService(current_app)
-    data = {"requests": svc.list_requests()}
-    return json_response(True, "OK", data)
+    return stream_list("requests", svc.iter_requests())
 
 
 @admin_bp.route("/donations", methods=["GET"])
+@streamed
 @admin_required
 def donations():
     svc = AdminService(current_app)
-    data = {"donations": svc.list_donations()}
-    return json_response(True, "OK", data)
+    return stream_list("donations", svc.iter_donations())
 
 
 @admin_bp.route("/inventory", methods=["GET"])
 @admin_required
 def inventory():
     svc = AdminService(current_app)
-    data = {"inventory": svc.get_inventory()}
+    data = {"inventory": svc.get_inventory(), "sites": svc.get_inventory_by_site()}
     return json_response(True, "OK", data)
 
+
+
+@admin_bp.route("/slots/capacity", methods=["PUT", "POST"])
+@admin_required
+def slot_capacity():
+    data = request.get_json(silent=True) or request.form.to_dict()
+    v = validate_slot_capacity(data)
+    if not v["valid"]:
+        return json_response(False, v["error"], None, 400)
+    svc = AdminService(current_app)
+    time_slots = svc.set_slot_capacity(
+        data["location"].strip(),
+        data["date"].strip(),
+        int(data["capacity"]),
+        time_slot=(data.get("time_slot") or "").strip() or None,
+    )
+    return json_response(True, "Slot capacity updated.", {"time_slots": time_slots})
+
+
+@admin_bp.route("/forecast", methods=["GET"])
+@admin_required
+def forecast():
+    try:
+        horizon = int(request.args["horizon"]) if request.args.get("horizon") else None
+    except ValueError:
+        return json_response(False, "horizon must be a number of days.", None, 400)
+    svc = AdminService(current_app)
+    return json_response(True, "OK", svc.get_forecast(horizon))
+
+
+@admin_bp.route("/shortages", methods=["GET"])
+@admin_required
+def shortages():
+    svc = AdminService(current_app)
+    return json_response(True, "OK", svc.get_shortages())
+
+
+@admin_bp.route("/shortages/thresholds", methods=["PUT", "POST"])
+@admin_required
+def shortage_thresholds():
+    data = request.get_json(silent=True) or {}
+    v = validate_shortage_thresholds(data)
+    if not v["valid"]:
+        return json_response(False, v["error"], None, 400)
+    overrides = {bg: {k: int(val) for k, val in t.items()} for bg, t in data["groups"].items()}
+    svc = AdminService(current_app)
+    success, message = svc.set_shortage_thresholds(overrides)
+    if not success:
+        return json_response(False, message, None, 409)
+    return json_response(True, message, svc.get_shortages())
@@ -2,20 +2,14 @@
 Admin auth API: login, logout, session.
 Uses separate Admins table and admin_* session keys.
 """
-from flask import Blueprint, request, jsonify, session, current_app
+from flask import Blueprint, request, session, current_app
 
 from app.services.admin_auth_service import AdminAuthService
+from app.services.responses import json_response
 
 admin_auth_bp = Blueprint("admin_auth", __name__)
 
 
-def json_response(success, message, data=None, status_code=200):
-    out = {"success": success, "message": message}
-    if data is not None:
-        out["data"] = data
-    return jsonify(out), status_code
-
-
 def require_admin_session(f):
     """Decorator: require admin_id in session."""
     from functools import wraps
@@ -2,20 +2,14 @@
 Auth API: register, login, logout, session, choose-role.
 All responses JSON.
 """
-from flask import Blueprint, request, jsonify, session, current_app
+from flask import Blueprint, request, session, current_app
 
 from app.services.auth_service import AuthService
+from app.services.responses import json_response
 
 auth_bp = Blueprint("auth", __name__)
 
 
-def json_response(success, message, data=None, status_code=200):
-    out = {"success": success, "message": message}
-    if data is not None:
-        out["data"] = data
-    return jsonify(out), status_code
-
-
 def require_session(f):
     """Decorator: require user_id in session; return 401 JSON if not."""
     from functools import wraps
@@ -53,6 +47,7 @@ def login():
     session["user_email"] = sess.get("user_email", "")
     session["role"] = sess.get("role")
     session["current_role"] = sess.get("current_role")
+    session["site_id"] = sess.get("site_id")
     return json_response(True, message, {"user": data_out})
 
 
@@ -72,6 +67,7 @@ def get_session():
         "user_email": session.get("user_email"),
         "role": session.get("role"),
         "current_role": session.get("current_role"),
+        "site_id": session.get("site_id"),
     }
     return json_response(True, "OK", data)
 
@@ -0,0 +1,25 @@
+"""
+Batch API: several API calls in one round trip (see services/batch).
+POST /api/batch {"requests": [{"id", "method", "path", "body", "headers"}]}
+returns {"responses": [{"id", "status", "body", "etag"}]} in request order.
+Each sub-request is authorized on its own, with the batch's session.
+"""
+from flask import Blueprint, request, current_app
+
+from app.services.batch import in_batch
+from app.services.validation import validate_batch
+from app.services.responses import json_response
+
+batch_bp = Blueprint("batch", __name__)
+
+
+@batch_bp.route("/batch", methods=["POST"])
+def batch():
+    if in_batch():
+        return json_response(False, "Batches cannot be nested.", None, 400)
+    data = request.get_json(silent=True)
+    v = validate_batch(data)
+    if not v["valid"]:
+        return json_response(False, v["error"], None, 400)
+    responses = current_app.extensions["batch"].run(data["requests"])
+    return json_response(True, "OK", {"responses": responses})
@@ -1,27 +1,29 @@
 """
-Donors API: my-donations, schedule donation.
+Donors API: my-donations, schedule donation (capacity-checked per slot), slot occupancy
+heatmap, donation status and bulk check-in (blood bank).
 All responses JSON.
 """
-from flask import Blueprint, request, jsonify, session, current_app
+from flask import Blueprint, request, session, current_app
 
 from app.services.database_service import (
     get_db,
     create_donation,
     get_donations_by_donor,
 )
-from app.services.validation import validate_donation_slot
+from app.services.validation import (
+    validate_donation_slot,
+    validate_donation_status,
+    validate_donation_transitions,
+    validate_slot_month,
+)
+from app.services.donation_slots import slot_heatmap
+from app.services.checkin_service import DonationCheckinService, NOT_FOUND
 from app.models.donor import Donation
+from app.services.responses import json_response
 
 donors_bp = Blueprint("donors", __name__)
 
 
-def json_response(success, message, data=None, status_code=200):
-    out = {"success": success, "message": message}
-    if data is not None:
-        out["data"] = data
-    return jsonify(out), status_code
-
-
 def require_session(f):
     from functools import wraps
 
@@ -63,10 +65,64 @@ def schedule():
         location,
         time_slot,
         status="Scheduled",
+        lat=data.get("lat"),
+        lon=data.get("lon"),
+        site_id=(data.get("site_id") or "").strip() or None,
     )
+    if donation_id is None:
+        return json_response(False, "That time slot is fully booked. Please choose another slot.", None, 409)
     return json_response(
         True,
         "Success! Your donation slot has been scheduled.",
         {"donation_id": donation_id},
         201,
     )
+
+
+@donors_bp.route("/slots", methods=["GET"])
+@require_session
+def slots():
+    """Booked / capacity / available per time slot for every day of ?location=&month=YYYY-MM."""
+    args = request.args.to_dict()
+    v = validate_slot_month(args)
+    if not v["valid"]:
+        return json_response(False, v["error"], None, 400)
+    db = get_db(current_app)
+    return json_response(True, "OK", slot_heatmap(db, args["location"].strip(), args["month"].strip()))
+
+
+@donors_bp.route("/donations/<donation_id>/status", methods=["POST"])
+@require_session
+def donation_status(donation_id):
+    """Blood bank: change one donation's status, with the same rules and writes as bulk check-in."""
+    if session.get("role") != "bloodbank":
+        return json_response(False, "Unauthorized.", None, 403)
+    data = request.get_json(silent=True) or request.form.to_dict()
+    v = validate_donation_status(data)
+    if not v["valid"]:
+        return json_response(False, v["error"], None, 400)
+    result, doc = DonationCheckinService(current_app).transition_one(donation_id, data["status"].strip())
+    if not result["success"]:
+        status_code = 404 if result["reason"] == NOT_FOUND else 409
+        return json_response(False, result["message"], result, status_code)
+    return json_response(True, "Donation status updated.", {"donation": Donation.to_serializable(doc)})
+
+
+@donors_bp.route("/donations/status", methods=["POST"])
+@require_session
+def bulk_donation_status():
+    """Blood bank: change many donations' status at once (check-in). Returns a result per update."""
+    if session.get("role") != "bloodbank":
+        return json_response(False, "Unauthorized.", None, 403)
+    data = request.get_json(silent=True) or {}
+    v = validate_donation_transitions(data)
+    if not v["valid"]:
+        return json_response(False, v["error"], None, 400)
+    updates = [{"donation_id": u["donation_id"].strip(), "status": u["status"]} for u in data["updates"]]
+    results = DonationCheckinService(current_app).transition(updates)
+    failed = sum(1 for r in results if not r["success"])
+    return json_response(
+        True,
+        f"{len(results) - failed} of {len(results)} donation(s) updated.",
+        {"results": results, "succeeded": len(results) - failed, "failed": failed},
+    )
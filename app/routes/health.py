@@ -1,30 +1,34 @@
 """
 Health / utility API: health check, contact form.
 """
-from flask import Blueprint, jsonify, request, current_app
+from flask import Blueprint, request, current_app
 
 from app.services.database_service import get_db, create_contact_message
 from app.services.validation import validate_contact
+from app.services.responses import json_response
 
 health_bp = Blueprint("health", __name__)
 
 
-def json_response(success, message, data=None, status_code=200):
-    out = {"success": success, "message": message}
-    if data is not None:
-        out["data"] = data
-    return jsonify(out), status_code
-
-
 @health_bp.route("/health", methods=["GET"])
 def health():
-    from app.services.dynamodb_client import dynamodb_health_check
+    from app.services.dynamodb_client import dynamodb_health_check, dynamodb_guard_status
     db_ok = dynamodb_health_check(current_app)
-    return jsonify({
-        "success": True,
-        "message": "OK",
-        "data": {"database": "ok" if db_ok else "error"},
-    }), 200 if db_ok else 503
+    guard = dynamodb_guard_status(current_app)
+    degraded = any(t["state"] != "closed" for t in guard.values())
+    notifications = current_app.extensions.get("notifications")
+    flights = current_app.extensions.get("singleflight")
+    if not db_ok:
+        database = "error"
+    else:
+        database = "degraded" if degraded else "ok"
+    data = {
+        "database": database,
+        "tables": guard,
+        "notifications": notifications.snapshot() if notifications else None,
+        "singleflight": flights.snapshot() if flights else None,
+    }
+    return json_response(True, "OK", data, 200 if db_ok else 503)
 
 
 @health_bp.route("/contact", methods=["POST"])
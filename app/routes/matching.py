@@ -1,44 +1,46 @@
 """
-Matching / dashboard API: inventory, dashboard payload by role (donor, recipient, bloodbank).
-All responses JSON.
+Matching / dashboard API: inventory, dashboard payload by role (donor, recipient, bloodbank),
+allocation across pending requests, eligible donors for a request, proximity search.
+Blood bank reads (dashboard, shortages) use the bank's own site partition.
+Live inventory / pending request updates for blood banks as Server-Sent Events (/stream).
+All other responses JSON.
 """
 from datetime import datetime
-from flask import Blueprint, jsonify, session, current_app
+from flask import Blueprint, Response, request, session, current_app
 
 from app.services.database_service import (
     get_db,
-    find_user_by_id,
     get_donations_by_donor,
-    get_recent_donations_for_bloodbank,
     get_all_donations_sorted,
     get_blood_requests_by_requester,
-    get_pending_blood_requests,
+    get_site_pending_blood_requests,
     get_all_blood_requests_sorted,
     list_all_users,
     enrich_users_with_blood_group,
-    count_donations_by_blood_group_and_status,
-    count_donors_distinct,
-    count_blood_requests_by_status,
     count_recipients_distinct,
-    count_donations_by_date,
     count_users_by_role,
 )
+from app.services.derived_views import (
+    recent_donations_view,
+    donors_distinct_view,
+    donations_on_date_view,
+    requests_by_status_view,
+)
 from app.services.matching_service import MatchingService
+from app.services.request_scope import session_user
+from app.services.deadline import request_partial
+from app.services.etags import versions_etag, not_modified, with_etag
+from app.services.geo import parse_coordinates
+from app.services.responses import json_response
+from app.services.streaming import streamed
 from app.models.donor import Donation
 from app.models.request import BloodRequest
 from app.models.user import User
-from config import BLOOD_GROUPS
+from config import BLOOD_GROUPS, SITE_IDS, DEFAULT_SITE_ID
 
 matching_bp = Blueprint("matching", __name__)
 
 
-def json_response(success, message, data=None, status_code=200):
-    out = {"success": success, "message": message}
-    if data is not None:
-        out["data"] = data
-    return jsonify(out), status_code
-
-
 def require_session(f):
     from functools import wraps
 
@@ -51,19 +53,102 @@ def require_session(f):
     return wrapped
 
 
+def _site_scope():
+    """Site partition to read: ?site_id= ("network" for all sites), else a blood bank's own site."""
+    site_id = (request.args.get("site_id") or "").strip()
+    if site_id == "network":
+        return None
+    if site_id in SITE_IDS:
+        return site_id
+    return session.get("site_id") if session.get("role") == "bloodbank" else None
+
+
 @matching_bp.route("/inventory", methods=["GET"])
 def inventory():
+    """Usable units per blood group: network-wide, or one site's with ?site_id=. Conditional on ETag."""
+    site_id = _site_scope()
+    etag = versions_etag(get_db(current_app), ("inventory_units",), site_id)
+    unchanged = not_modified(etag)
+    if unchanged:
+        return unchanged
     matching = MatchingService(current_app)
-    inv = matching.get_inventory()
-    return json_response(True, "OK", {"inventory": inv})
+    inv = matching.get_inventory(site_id=site_id)
+    partial = request_partial()
+    return with_etag(
+        json_response(True, "OK", {"inventory": inv, "site_id": site_id, "partial": partial}), etag, partial
+    )
+
+
+# Tables each dashboard view reads (users: the account itself may change or go away).
+DASHBOARD_TABLES = {
+    "donor": ("users", "donations"),
+    "recipient": ("users", "blood_requests", "inventory_units"),
+    "bloodbank": ("users", "blood_requests", "inventory_units", "donations"),
+}
+
+
+def _bloodbank_dashboard(db, site_id):
+    """Blood bank dashboard payload for a site: every read touches only the site's partition
+    (allocation is the network-wide plan)."""
+    today_str = datetime.now().strftime("%Y-%m-%d")
+    matching = MatchingService(current_app)
+    # One read gives stock, pending demand and shortage levels per group.
+    shortages = matching.get_shortages(site_id=site_id)
+    inv_counts = {bg: g["supply"] for bg, g in shortages["groups"].items()}
+    inventory_list = [{"group": bg, "units": inv_counts.get(bg, 0)} for bg in BLOOD_GROUPS]
+    total_units = sum(inv_counts.values())
+    recent_donors_raw = recent_donations_view(db, 5, site_id=site_id)
+    donors = [
+        {"name": d.get("donor_name", "Unknown"), "blood_group": d.get("blood_group", "N/A"), "last_donation": d.get("date", "N/A")}
+        for d in recent_donors_raw
+    ]
+    recent_requests = get_site_pending_blood_requests(db, site_id, limit=10)
+    allocation = matching.get_allocation()
+    stats = {
+        "total_donors": donors_distinct_view(db, site_id=site_id),
+        "pending_requests": requests_by_status_view(db, site_id=site_id)["pending"],
+        "total_units": total_units,
+        "today_donations": donations_on_date_view(db, today_str, site_id=site_id),
+        "allocated_requests": allocation["allocated_requests"],
+        "unallocated_requests": allocation["unallocated_requests"],
+    }
+    return {
+        "view": "bloodbank",
+        "site_id": site_id,
+        "stats": stats,
+        "donors": donors,
+        "inventory": inventory_list,
+        "requests": BloodRequest.list_serializable(
+            recent_requests,
+            extra_fn=lambda req: MatchingService.request_allocation(req, allocation["requests"]),
+        ),
+        "allocation": {k: allocation[k] for k in ("mode", "remaining", "shortfall")},
+        "gap": shortages["groups"],
+        "alerts": shortages["alerts"][:5],
+        "today": datetime.now().strftime("%d %b %Y"),
+        "partial": request_partial(),
+    }
 
 
 @matching_bp.route("/dashboard", methods=["GET"])
 @require_session
 def dashboard():
-    """Return dashboard payload for current user by role."""
+    """Return dashboard payload for current user by role. Conditional on ETag."""
     db = get_db(current_app)
-    user = find_user_by_id(db, session["user_id"])
+    view = "bloodbank" if session.get("role") == "bloodbank" else session.get("current_role")
+    if view == "bloodbank":
+        # Every account of a site gets the same payload (and shares its computation).
+        key = (view, session.get("site_id") or DEFAULT_SITE_ID)
+    else:
+        key = (
+            session["user_id"], session.get("role"), session.get("current_role"), session.get("site_id"),
+            request.args.get("mode"),
+        )
+    etag = versions_etag(db, DASHBOARD_TABLES.get(view, ("users",)), *key)
+    unchanged = not_modified(etag)
+    if unchanged:
+        return unchanged
+    user = session_user(db, session["user_id"])
     if not user:
         session.clear()
         return json_response(False, "User not found.", None, 401)
@@ -75,59 +160,180 @@ def dashboard():
     if role not in ["bloodbank"]:
         if current_role == "donor":
             docs = get_donations_by_donor(db, session["user_id"])
-            return json_response(
+            return with_etag(json_response(
                 True,
                 "OK",
                 {"view": "donor", "donations": Donation.list_serializable(docs)},
-            )
+            ), etag)
         if current_role == "recipient":
             matching = MatchingService(current_app)
-            requests_with_avail = matching.get_recipient_requests_with_availability(session["user_id"])
+            requests_with_avail = matching.get_recipient_requests_with_availability(
+                session["user_id"], mode=request.args.get("mode")
+            )
             inventory_dict = matching.get_inventory()
-            return json_response(
+            partial = request_partial()
+            return with_etag(json_response(
                 True,
                 "OK",
                 {
                     "view": "recipient",
                     "requests": requests_with_avail,
                     "inventory": inventory_dict,
+                    "partial": partial,
                 },
-            )
+            ), etag, partial)
         return json_response(True, "Choose role", {"view": "choose_role"}, 200)
 
-    # Blood bank
+    # Blood bank: one computation per site and data version, however many staff load it.
     if role == "bloodbank":
-        today_str = datetime.now().strftime("%Y-%m-%d")
-        inv_counts = count_donations_by_blood_group_and_status(
-            db, blood_groups=BLOOD_GROUPS, statuses=["Scheduled", "Completed"]
-        )
-        inventory_list = [{"group": bg, "units": inv_counts.get(bg, 0)} for bg in BLOOD_GROUPS]
-        total_units = sum(inv_counts.values())
-        recent_donors_raw = get_recent_donations_for_bloodbank(db, 5)
-        donors = [
-            {"name": d.get("donor_name", "Unknown"), "blood_group": d.get("blood_group", "N/A"), "last_donation": d.get("date", "N/A")}
-            for d in recent_donors_raw
-        ]
-        recent_requests = get_pending_blood_requests(db, limit=10)
-        stats = {
-            "total_donors": count_donors_distinct(db),
-            "pending_requests": count_blood_requests_by_status(db, "pending"),
-            "total_units": total_units,
-            "today_donations": count_donations_by_date(db, today_str),
-        }
-        return json_response(
-            True,
-            "OK",
-            {
-                "view": "bloodbank",
-                "stats": stats,
-                "donors": donors,
-                "inventory": inventory_list,
-                "requests": BloodRequest.list_serializable(recent_requests),
-                "today": datetime.now().strftime("%d %b %Y"),
-            },
+        site_id = session.get("site_id") or DEFAULT_SITE_ID
+        data = current_app.extensions["singleflight"].do(
+            ("dashboard", etag),
+            lambda: _bloodbank_dashboard(db, site_id),
+            reusable=lambda d: not d["partial"],
         )
+        return with_etag(json_response(True, "OK", data), etag, data["partial"])
 
     # Admin dashboard is now fully separate under /api/admin, so matching.dashboard
     # should never be used for admin accounts.
     return json_response(False, "Invalid role for user dashboard.", None, 400)
+
+
+@matching_bp.route("/shortages", methods=["GET"])
+@require_session
+def shortages():
+    """Blood bank: pending demand vs usable stock per blood group at its site (or ?site_id=network),
+    shortage levels and recent alerts."""
+    if session.get("role") != "bloodbank":
+        return json_response(False, "Unauthorized.", None, 403)
+    return json_response(True, "OK", MatchingService(current_app).get_shortages(site_id=_site_scope()))
+
+
+@matching_bp.route("/stream", methods=["GET"])
+@streamed
+@require_session
+def stream():
+    """Blood bank: Server-Sent Events with inventory, pending request and shortage alert changes
+    for its site (or ?site_id=network). Resumes from the Last-Event-ID header."""
+    if session.get("role") != "bloodbank":
+        return json_response(False, "Unauthorized.", None, 403)
+    feed = current_app.extensions["live_feed"]
+    subscriber = feed.subscribe(_site_scope(), request.headers.get("Last-Event-ID"))
+    if subscriber is None:
+        return json_response(False, "Too many live connections; try again shortly.", None, 503)
+    return Response(
+        subscriber.stream(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@matching_bp.route("/allocation", methods=["GET"])
+@require_session
+def allocation():
+    """Blood bank: allocation of inventory across every pending request."""
+    if session.get("role") != "bloodbank":
+        return json_response(False, "Unauthorized.", None, 403)
+    return json_response(True, "OK", MatchingService(current_app).get_allocation())
+
+
+@matching_bp.route("/requests/<request_id>/eligible-donors", methods=["GET"])
+@require_session
+def eligible_donors(request_id):
+    """Donors eligible today whose blood is compatible with the request (blood bank or requester)."""
+    try:
+        limit = min(max(int(request.args.get("limit", 10)), 1), 50)
+    except (TypeError, ValueError):
+        limit = 10
+    matching = MatchingService(current_app)
+    req = matching.get_blood_request(request_id)
+    if not req:
+        return json_response(False, "Request not found.", None, 404)
+    if session.get("role") != "bloodbank" and req.get("requester_id") != session["user_id"]:
+        return json_response(False, "Unauthorized.", None, 403)
+    donors = matching.get_eligible_donors_for_request(req, limit=limit, mode=request.args.get("mode"))
+    return json_response(True, "OK", {"request_id": request_id, "donors": donors})
+
+
+@matching_bp.route("/requests/<request_id>/ranked-donors", methods=["GET"])
+@require_session
+def ranked_donors(request_id):
+    """Eligible compatible donors ranked for outreach (blood bank or requester)."""
+    try:
+        limit = min(max(int(request.args.get("limit", 10)), 1), 100)
+    except (TypeError, ValueError):
+        limit = 10
+    matching = MatchingService(current_app)
+    req = matching.get_blood_request(request_id)
+    if not req:
+        return json_response(False, "Request not found.", None, 404)
+    if session.get("role") != "bloodbank" and req.get("requester_id") != session["user_id"]:
+        return json_response(False, "Unauthorized.", None, 403)
+    result = matching.rank_donors_for_request(
+        req, limit=limit, mode=request.args.get("mode"), include_donors=session.get("role") == "bloodbank"
+    )
+    return json_response(True, "OK", dict(result, request_id=request_id))
+
+
+def _nearby_args():
+    """(radius_km, limit) from the query string, with defaults."""
+    try:
+        radius_km = float(request.args.get("radius_km", 10))
+    except (TypeError, ValueError):
+        radius_km = 10.0
+    try:
+        limit = min(max(int(request.args.get("limit", 20)), 1), 50)
+    except (TypeError, ValueError):
+        limit = 20
+    return radius_km, limit
+
+
+@matching_bp.route("/nearby", methods=["GET"])
+@require_session
+def nearby():
+    """Compatible stock and donor counts within radius_km of lat/lon; blood banks also see donors and requests."""
+    coords = parse_coordinates(request.args.get("lat"), request.args.get("lon"))
+    if coords is None:
+        return json_response(False, "Valid lat and lon are required.", None, 400)
+    blood_group = (request.args.get("blood_group") or "").strip() or None
+    if blood_group and blood_group not in BLOOD_GROUPS:
+        return json_response(False, "Invalid blood group.", None, 400)
+    radius_km, limit = _nearby_args()
+    is_bloodbank = session.get("role") == "bloodbank"
+    result = MatchingService(current_app).find_nearby(
+        coords[0],
+        coords[1],
+        radius_km,
+        blood_group=blood_group,
+        mode=request.args.get("mode"),
+        limit=limit,
+        include_requests=is_bloodbank,
+        include_donors=is_bloodbank,
+    )
+    return json_response(True, "OK", result)
+
+
+@matching_bp.route("/requests/<request_id>/nearby", methods=["GET"])
+@require_session
+def request_nearby(request_id):
+    """Compatible stock and donors near the request's hospital (blood bank or requester)."""
+    matching = MatchingService(current_app)
+    req = matching.get_blood_request(request_id)
+    if not req:
+        return json_response(False, "Request not found.", None, 404)
+    if session.get("role") != "bloodbank" and req.get("requester_id") != session["user_id"]:
+        return json_response(False, "Unauthorized.", None, 403)
+    coords = parse_coordinates(req.get("lat"), req.get("lon"))
+    if coords is None:
+        return json_response(False, "This request has no hospital coordinates.", None, 400)
+    radius_km, limit = _nearby_args()
+    result = matching.find_nearby(
+        coords[0],
+        coords[1],
+        radius_km,
+        blood_group=req.get("blood_group"),
+        mode=request.args.get("mode"),
+        limit=limit,
+        include_donors=session.get("role") == "bloodbank",
+    )
+    return json_response(True, "OK", dict(result, request_id=request_id))
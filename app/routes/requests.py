@@ -1,30 +1,31 @@
 """
-Blood requests API: create, my requests, pending (for donors view), admin list.
+Blood requests API: create, my requests, pending (for donors view), admin list,
+reserve / fulfil / release (blood bank).
 All responses JSON.
 """
-from flask import Blueprint, request, jsonify, session, current_app
+from flask import Blueprint, request, session, current_app
 
 from app.services.database_service import (
     get_db,
     create_blood_request,
     get_blood_requests_by_requester,
     get_pending_blood_requests,
-    get_all_blood_requests_sorted,
+    get_site_pending_blood_requests,
+    iter_blood_requests_newest_first,
 )
 from app.services.validation import validate_blood_request
 from app.services.matching_service import MatchingService
+from app.services.fulfilment_service import FulfilmentService, NOT_FOUND, TOO_LARGE
+from app.services.deadline import request_partial
+from app.services.etags import versions_etag, not_modified, with_etag
+from app.services.streaming import stream_list, streamed
+from app.services.responses import json_response
 from app.models.request import BloodRequest
+from config import SITE_IDS
 
 requests_bp = Blueprint("requests", __name__)
 
 
-def json_response(success, message, data=None, status_code=200):
-    out = {"success": success, "message": message}
-    if data is not None:
-        out["data"] = data
-    return jsonify(out), status_code
-
-
 def require_session(f):
     from functools import wraps
 
@@ -51,6 +52,20 @@ def require_admin(f):
     return wrapped
 
 
+def require_bloodbank(f):
+    from functools import wraps
+
+    @wraps(f)
+    def wrapped(*args, **kwargs):
+        if "user_id" not in session:
+            return json_response(False, "Authentication required.", None, 401)
+        if session.get("role") != "bloodbank":
+            return json_response(False, "Unauthorized.", None, 403)
+        return f(*args, **kwargs)
+
+    return wrapped
+
+
 @requests_bp.route("", methods=["POST"])
 @require_session
 def create_request():
@@ -67,6 +82,10 @@ def create_request():
         data.get("units"),
         (data.get("hospital") or "").strip(),
         status="pending",
+        lat=data.get("lat"),
+        lon=data.get("lon"),
+        urgency=(data.get("urgency") or "").strip().lower() or None,
+        site_id=(data.get("site_id") or "").strip() or None,
     )
     return json_response(
         True,
@@ -79,27 +98,95 @@ def create_request():
 @requests_bp.route("/my", methods=["GET"])
 @require_session
 def my_requests():
+    """The user's requests with availability and allocation, plus inventory. Conditional on ETag."""
+    etag = versions_etag(
+        get_db(current_app), ("blood_requests", "inventory_units"), session["user_id"], request.args.get("mode")
+    )
+    unchanged = not_modified(etag)
+    if unchanged:
+        return unchanged
     matching = MatchingService(current_app)
-    requests_with_avail = matching.get_recipient_requests_with_availability(session["user_id"])
+    requests_with_avail = matching.get_recipient_requests_with_availability(
+        session["user_id"], mode=request.args.get("mode")
+    )
     inventory = matching.get_inventory()
-    return json_response(
+    partial = request_partial()
+    return with_etag(json_response(
         True,
         "OK",
-        {"requests": requests_with_avail, "inventory": inventory},
-    )
+        {"requests": requests_with_avail, "inventory": inventory, "partial": partial},
+    ), etag, partial)
+
+
+def _site_scope():
+    """Site partition to read: ?site_id= ("network" for all sites), else a blood bank's own site."""
+    site_id = (request.args.get("site_id") or "").strip()
+    if site_id == "network":
+        return None
+    if site_id in SITE_IDS:
+        return site_id
+    return session.get("site_id") if session.get("role") == "bloodbank" else None
 
 
 @requests_bp.route("/pending", methods=["GET"])
 @require_session
 def pending():
+    """Pending requests, most urgent first; one bounded Query of ?limit= (default 50) per page.
+
+    Blood banks see their own site's queue unless they ask for ?site_id=network.
+    """
+    try:
+        limit = min(max(int(request.args.get("limit", 50)), 1), 100)
+    except (TypeError, ValueError):
+        limit = 50
     db = get_db(current_app)
-    docs = get_pending_blood_requests(db)
-    return json_response(True, "OK", {"requests": BloodRequest.list_serializable(docs)})
+    site_id = _site_scope()
+    if site_id:
+        docs = get_site_pending_blood_requests(db, site_id, limit=limit, cursor=request.args.get("cursor"))
+    else:
+        docs = get_pending_blood_requests(db, limit=limit, cursor=request.args.get("cursor"))
+    return json_response(
+        True,
+        "OK",
+        {
+            "requests": BloodRequest.list_serializable(docs),
+            "partial": docs.partial,
+            "cursor": docs.cursor,
+            "site_id": site_id,
+        },
+    )
 
 
 @requests_bp.route("/all", methods=["GET"])
+@streamed
 @require_admin
 def all_requests():
     db = get_db(current_app)
-    docs = get_all_blood_requests_sorted(db, sort_timestamp=-1)
-    return json_response(True, "OK", {"requests": BloodRequest.list_serializable(docs)})
+    docs = iter_blood_requests_newest_first(db)
+    return stream_list("requests", (BloodRequest.to_serializable(d) for d in docs))
+
+
+def _fulfilment_response(result):
+    success, message, data = result
+    if success:
+        return json_response(True, message, data)
+    status_code = {NOT_FOUND: 404, TOO_LARGE: 400}.get(data["reason"], 409)
+    return json_response(False, message, data, status_code)
+
+
+@requests_bp.route("/<request_id>/reserve", methods=["POST"])
+@require_bloodbank
+def reserve(request_id):
+    return _fulfilment_response(FulfilmentService(current_app).reserve(request_id))
+
+
+@requests_bp.route("/<request_id>/fulfil", methods=["POST"])
+@require_bloodbank
+def fulfil(request_id):
+    return _fulfilment_response(FulfilmentService(current_app).fulfil(request_id))
+
+
+@requests_bp.route("/<request_id>/release", methods=["POST"])
+@require_bloodbank
+def release(request_id):
+    return _fulfilment_response(FulfilmentService(current_app).release(request_id))
@@ -1,28 +1,47 @@
 """
-Admin-facing business logic: dashboard stats, users, requests, donations, inventory.
+Admin-facing business logic: dashboard stats, users, requests, donations, inventory
+(network-wide and per site), blood bank site assignment, donation slot capacity,
+shortage thresholds, demand forecast.
+
+The user, request and donation lists are generators over the paged reads, for
+streamed responses (see streaming).
 """
 from datetime import datetime
+from itertools import islice
 
-from config import BLOOD_GROUPS
+from config import BLOOD_GROUPS, SITE_IDS, DONATION_TIME_SLOTS
+from app.services.deadline import request_partial
+from app.services.etags import versions_etag
 from app.services.database_service import (
     get_db,
-    list_all_users,
+    iter_table_items,
     enrich_users_with_blood_group,
-    get_all_blood_requests_sorted,
-    get_all_donations_sorted,
-    count_donors_distinct,
-    count_recipients_distinct,
-    count_users_by_role,
-    count_blood_requests_by_status,
-    count_donations_by_blood_group_and_status,
-    count_donations_by_date,
+    iter_blood_requests_newest_first,
+    iter_donations_newest_first,
     delete_user_by_id,
     find_user_by_id,
+    set_user_site,
+    set_slot_capacity,
+)
+from app.services.derived_views import (
+    inventory_view,
+    donations_total_view,
+    donations_on_date_view,
+    donors_distinct_view,
+    recipients_distinct_view,
+    requests_by_status_view,
+    users_by_role_view,
 )
+from app.services.shortage_alerts import shortage_status, set_shortage_thresholds
 from app.models.user import User
 from app.models.donor import Donation
 from app.models.request import BloodRequest
 
+# Users enriched with a blood group per batch while streaming.
+USER_BATCH = 100
+# Tables the dashboard stats are derived from.
+DASHBOARD_TABLES = ("users", "blood_requests", "donations", "inventory_units")
+
 
 class AdminService:
     """Service providing admin-only views and aggregations."""
@@ -33,42 +52,50 @@ class AdminService:
 
     # ----- Dashboard -----
     def get_dashboard_stats(self):
-        """Aggregated system stats for admin dashboard."""
+        """Aggregated system stats for admin dashboard, computed once per data version for concurrent admins."""
+        key = ("admin_dashboard", versions_etag(self.db, DASHBOARD_TABLES))
+        return self.app.extensions["singleflight"].do(
+            key, self._dashboard_stats, reusable=lambda d: not d["partial"]
+        )
+
+    def _dashboard_stats(self):
         db = self.db
-        users = list_all_users(db)
-        users = enrich_users_with_blood_group(db, users)
-        blood_requests = get_all_blood_requests_sorted(db, sort_timestamp=-1)
-        all_donations = get_all_donations_sorted(db, sort_timestamp=-1)
+        users_by_role = users_by_role_view(db)
+        requests_by_status = requests_by_status_view(db)
 
-        inv_counts = count_donations_by_blood_group_and_status(
-            db, blood_groups=BLOOD_GROUPS, statuses=["Scheduled", "Completed"]
-        )
+        inv_counts = self._inventory_counts()
         inventory_list = [{"group": bg, "units": inv_counts.get(bg, 0)} for bg in BLOOD_GROUPS]
         today_str = datetime.now().strftime("%Y-%m-%d")
 
         stats = {
-            "total_users": len(users),
-            "donors_count": count_donors_distinct(db),
-            "recipients_count": count_recipients_distinct(db),
-            "banks_count": count_users_by_role(db, "bloodbank"),
-            "total_requests": len(blood_requests),
-            "pending_requests": count_blood_requests_by_status(db, "pending"),
-            "completed_requests": count_blood_requests_by_status(db, "fulfilled"),
-            "total_donations": len(all_donations),
-            "today_donations": count_donations_by_date(db, today_str),
+            "total_users": sum(users_by_role.values()),
+            "donors_count": donors_distinct_view(db),
+            "recipients_count": recipients_distinct_view(db),
+            "banks_count": users_by_role["bloodbank"],
+            "total_requests": sum(requests_by_status.values()),
+            "pending_requests": requests_by_status["pending"],
+            "completed_requests": requests_by_status["fulfilled"],
+            "total_donations": donations_total_view(db),
+            "today_donations": donations_on_date_view(db, today_str),
             "total_inventory": sum(inv_counts.values()),
         }
 
         return {
             "stats": stats,
             "inventory": inventory_list,
+            "partial": request_partial(),
         }
 
     # ----- Users -----
-    def list_users(self):
-        users = list_all_users(self.db)
-        users = enrich_users_with_blood_group(self.db, users)
-        return [User.to_serializable(u) for u in users]
+    def iter_users(self):
+        """Every user, serialized, a batch at a time."""
+        users = iter_table_items(self.db, "users")
+        while True:
+            batch = list(islice(users, USER_BATCH))
+            if not batch:
+                return
+            for user in enrich_users_with_blood_group(self.db, batch):
+                yield User.to_serializable(user)
 
     def delete_user(self, user_id):
         if not find_user_by_id(self.db, user_id):
@@ -76,21 +103,62 @@ class AdminService:
         delete_user_by_id(self.db, user_id)
         return True, "User removed successfully."
 
+    def assign_site(self, user_id, site_id):
+        """Assign a blood bank account to a site (takes effect at its next login). Returns (success, message)."""
+        if not set_user_site(self.db, user_id, site_id):
+            return False, "Blood bank user not found."
+        return True, "Site assigned."
+
     # ----- Requests -----
-    def list_requests(self):
-        reqs = get_all_blood_requests_sorted(self.db, sort_timestamp=-1)
-        return BloodRequest.list_serializable(reqs)
+    def iter_requests(self):
+        """Every blood request, serialized, newest first."""
+        return (BloodRequest.to_serializable(r) for r in iter_blood_requests_newest_first(self.db))
 
     # ----- Donations -----
-    def list_donations(self, limit=None):
-        donations = get_all_donations_sorted(self.db, sort_timestamp=-1, limit=limit)
-        return Donation.list_serializable(donations)
+    def iter_donations(self):
+        """Every donation, serialized, newest first."""
+        return (Donation.to_serializable(d) for d in iter_donations_newest_first(self.db))
 
     # ----- Inventory -----
-    def get_inventory(self):
-        db = self.db
-        inv_counts = count_donations_by_blood_group_and_status(
-            db, blood_groups=BLOOD_GROUPS, statuses=["Scheduled", "Completed"]
-        )
+    def _inventory_counts(self, site_id=None):
+        ledger = self.app.extensions.get("inventory_ledger")
+        if ledger:
+            ledger.sweep_if_due()
+        return inventory_view(self.db, blood_groups=BLOOD_GROUPS, site_id=site_id)
+
+    def get_inventory(self, site_id=None):
+        inv_counts = self._inventory_counts(site_id)
         return [{"group": bg, "units": inv_counts.get(bg, 0)} for bg in BLOOD_GROUPS]
 
+    def get_inventory_by_site(self):
+        """Usable units per site and blood group (one counter read per site)."""
+        return {site: {"inventory": self.get_inventory(site)} for site in SITE_IDS}
+
+
+    # ----- Donation slots -----
+    def set_slot_capacity(self, location, date, capacity, time_slot=None):
+        """Override capacity of one time slot, or of every configured slot that day. Returns the slots set."""
+        time_slots = [time_slot] if time_slot else DONATION_TIME_SLOTS
+        for slot in time_slots:
+            set_slot_capacity(self.db, location, date, slot, capacity)
+        return time_slots
+
+    # ----- Demand forecast -----
+    def get_forecast(self, horizon=None):
+        """Demand and donation forecast per blood group for the next `horizon` days (see demand_forecast)."""
+        forecaster = self.app.extensions["demand_forecast"]
+        return forecaster.forecast(horizon) if horizon else forecaster.forecast()
+
+    # ----- Shortage alerts -----
+    def get_shortages(self):
+        """Supply-demand gap, thresholds and level per blood group, plus recent alerts."""
+        return shortage_status(self.db)
+
+    def set_shortage_thresholds(self, overrides):
+        """Store per-group threshold overrides and re-evaluate every group. Returns (success, message)."""
+        if not set_shortage_thresholds(self.db, overrides):
+            return False, "Thresholds were changed concurrently; please retry."
+        monitor = self.app.extensions.get("shortage_monitor")
+        if monitor:
+            monitor.evaluate()
+        return True, "Shortage thresholds updated."
@@ -0,0 +1,439 @@
+"""
+Global allocation of inventory across all pending blood requests.
+
+Requests are served in priority order (most urgent, then oldest first). Each one is either fully
+allocated or left unallocated; units are never double-counted across requests.
+Allocation runs on the 8x8 donor -> recipient group graph:
+  - "exact": a request only draws on its own group, so this is plain greedy.
+  - "compatible": each request is placed with min-cost augmenting paths, so
+    earlier requests can be re-routed to other compatible groups to make room.
+    Same-group units cost nothing; substitutes cost by how widely the donor
+    group is usable, so O- is kept for the recipients that need it.
+
+AllocationEngine keeps the pending set in memory, fed by the change stream:
+a new request that sorts last is placed incrementally, and new stock retries
+only the unallocated requests. Anything else triggers a full recompute from
+memory. All of it runs on one background thread, which publishes an immutable
+snapshot for requests to read; no request waits on a table read or the engine.
+The thread also polls the shared version counters (etags.VIEW_VERSIONS) every
+ALLOCATION_POLL_SECONDS, so changes made by other workers are picked up within
+a poll, not at the next full resync (every ALLOCATION_RESYNC_SECONDS). A read
+that comes back partial is published as partial and retried after
+ALLOCATION_PARTIAL_RETRY_SECONDS.
+"""
+import logging
+import threading
+import time
+
+from app.services.change_stream import INSERT
+from app.services.compatibility import COMPATIBILITY, COMPATIBLE, EXACT, GROUP_INDEX, MODES
+from app.services.database_service import get_pending_blood_requests, get_stat_item, local_version_bumps, urgency_rank
+from app.services.deadline import current_deadline, remaining_request_time
+from app.services.derived_views import inventory_view
+from app.services.etags import VIEW_VERSIONS
+from config import (
+    BLOOD_GROUPS,
+    AVAILABILITY_MODE,
+    ALLOCATION_RESYNC_SECONDS,
+    ALLOCATION_POLL_SECONDS,
+    ALLOCATION_PARTIAL_RETRY_SECONDS,
+    ALLOCATION_WAIT_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+_N = len(BLOOD_GROUPS)
+_INF = float("inf")
+
+# Substitution cost of donor group d for recipient group r: 0 for the same group,
+# otherwise the number of recipient groups d can serve.
+SUBSTITUTION_COST = [
+    [0 if r == d else int(COMPATIBILITY[:, d].sum()) for d in range(_N)]
+    for r in range(_N)
+]
+
+
+def priority_key(req):
+    """Sort key for serving order: most urgent first, then oldest; id breaks ties."""
+    return (urgency_rank(req.get("urgency")), req.get("timestamp") or "", req.get("id") or "")
+
+
+def _units(req):
+    try:
+        return int(req.get("units") or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+class GroupAllocator:
+    """Flow of units from donor groups to recipient groups under a supply vector."""
+
+    def __init__(self, supply, mode=COMPATIBLE):
+        self.supply = [int(s) for s in supply]
+        self.flow = [[0] * _N for _ in range(_N)]  # flow[r][d]
+        if mode == EXACT:
+            self.edges = [[r == d for d in range(_N)] for r in range(_N)]
+        else:
+            self.edges = [[bool(COMPATIBILITY[r, d]) for d in range(_N)] for r in range(_N)]
+
+    def used(self, d):
+        return sum(self.flow[r][d] for r in range(_N))
+
+    def remaining(self, d):
+        return self.supply[d] - self.used(d)
+
+    def _shortest_path(self, r0):
+        """Bellman-Ford from recipient r0 to the sink over the residual graph.
+
+        Nodes 0.._N-1 are recipient groups, _N..2*_N-1 donor groups. Returns
+        (donor, parents) for the cheapest donor with spare units, or None.
+        """
+        dist = [_INF] * (2 * _N)
+        parent = [None] * (2 * _N)
+        dist[r0] = 0
+        for _ in range(2 * _N):
+            changed = False
+            for r in range(_N):
+                if dist[r] == _INF:
+                    continue
+                for d in range(_N):
+                    if self.edges[r][d] and dist[r] + SUBSTITUTION_COST[r][d] < dist[_N + d]:
+                        dist[_N + d] = dist[r] + SUBSTITUTION_COST[r][d]
+                        parent[_N + d] = r
+                        changed = True
+            for d in range(_N):
+                if dist[_N + d] == _INF:
+                    continue
+                for r in range(_N):
+                    # Residual back edge: move units of r off donor d.
+                    if self.flow[r][d] > 0 and dist[_N + d] - SUBSTITUTION_COST[r][d] < dist[r]:
+                        dist[r] = dist[_N + d] - SUBSTITUTION_COST[r][d]
+                        parent[r] = _N + d
+                        changed = True
+            if not changed:
+                break
+        best = None
+        for d in range(_N):
+            if self.remaining(d) > 0 and dist[_N + d] < _INF:
+                if best is None or dist[_N + d] < dist[_N + best]:
+                    best = d
+        return None if best is None else (best, parent)
+
+    def place(self, r, units):
+        """Route `units` for recipient group r; all or nothing. Returns True if placed."""
+        if units <= 0:
+            return False
+        saved = [row[:] for row in self.flow]
+        need = units
+        while need:
+            found = self._shortest_path(r)
+            if found is None:
+                self.flow = saved
+                return False
+            d, parent = found
+            # Walk back to r: alternating forward (r'->d') and back (d'->r') edges.
+            path = []
+            node = _N + d
+            while node != r and len(path) <= 2 * _N:
+                prev = parent[node]
+                path.append((prev, node))
+                node = prev
+            if node != r:
+                self.flow = saved
+                return False
+            push = min(need, self.remaining(d))
+            for a, b in path:
+                if a < _N:  # forward r -> d
+                    continue
+                push = min(push, self.flow[b][a - _N])
+            for a, b in path:
+                if a < _N:
+                    self.flow[a][b - _N] += push
+                else:
+                    self.flow[b][a - _N] -= push
+            need -= push
+        return True
+
+
+class AllocationEngine:
+    """Allocation of current inventory to pending requests, kept up to date off the request path.
+
+    A background thread (started by the first snapshot) does every table read and
+    computation and publishes the result; snapshot() only returns the last one.
+    """
+
+    name = "allocation"
+    tables = ("blood_requests", "inventory_units")
+
+    def __init__(
+        self,
+        db,
+        mode=AVAILABILITY_MODE,
+        resync_seconds=ALLOCATION_RESYNC_SECONDS,
+        poll_seconds=ALLOCATION_POLL_SECONDS,
+        partial_retry_seconds=ALLOCATION_PARTIAL_RETRY_SECONDS,
+        wait_seconds=ALLOCATION_WAIT_SECONDS,
+    ):
+        self.db = db
+        self.mode = mode if mode in MODES else COMPATIBLE
+        self.resync_seconds = resync_seconds
+        self.poll_seconds = poll_seconds
+        self.partial_retry_seconds = partial_retry_seconds
+        self.wait_seconds = wait_seconds
+        self._lock = threading.RLock()
+        self._wake = threading.Event()
+        self._ready = threading.Event()
+        self._thread = None
+        self._pending = {}
+        self._order = []
+        self._allocated = set()
+        self._allocator = None
+        self._loaded_at = None
+        self._partial = False
+        self._stale = True
+        self._supply_dirty = False
+        self._changed = False
+        # Events that arrive while a full read is running, replayed on its result.
+        self._resyncing = False
+        self._missed = []
+        # (shared version counters, this process's bumps) at the last check.
+        self._versions = None
+        self._published = None
+
+    # ----- change stream -----
+    def apply(self, event):
+        with self._lock:
+            if self._resyncing:
+                self._missed.append(event)
+            elif self._allocator is not None:
+                self._apply(event)
+        self._wake.set()
+
+    def _apply(self, event):
+        if event.table == "inventory_units":
+            self._supply_dirty = True
+            return
+        new = event.new_image if (event.new_image or {}).get("status", "pending") == "pending" else None
+        self._changed = True
+        if event.event_name == INSERT and new and not self._stale and self._is_last(new):
+            self._pending[new["id"]] = new
+            self._order.append(new["id"])
+            self._try_place(new)
+            return
+        if new:
+            self._pending[new["id"]] = new
+        else:
+            self._pending.pop(event.key, None)
+        self._stale = True
+
+    def _is_last(self, req):
+        return not self._order or priority_key(req) > priority_key(self._pending[self._order[-1]])
+
+    # ----- computation -----
+    def _try_place(self, req):
+        g = GROUP_INDEX.get(req.get("blood_group") or "")
+        if g is not None and self._allocator.place(g, _units(req)):
+            self._allocated.add(req["id"])
+
+    def _recompute(self, supply):
+        self._order = sorted(self._pending, key=lambda i: priority_key(self._pending[i]))
+        self._allocated = set()
+        self._allocator = GroupAllocator(supply, self.mode)
+        for request_id in self._order:
+            self._try_place(self._pending[request_id])
+        self._stale = False
+        self._changed = True
+
+    def _read_supply(self):
+        inventory = inventory_view(self.db, blood_groups=BLOOD_GROUPS)
+        return [int(inventory.get(bg, 0) or 0) for bg in BLOOD_GROUPS]
+
+    def _resync(self):
+        """Full read of pending requests and supply (no lock held while reading)."""
+        with self._lock:
+            self._resyncing = True
+            self._missed = []
+        pending = supply = None
+        try:
+            pending = get_pending_blood_requests(self.db)
+            supply = self._read_supply()
+        finally:
+            with self._lock:
+                self._resyncing = False
+                if supply is not None:
+                    self._pending = {r["id"]: r for r in pending}
+                    self._stale = True
+                    self._loaded_at = time.monotonic()
+                    # A partial read is kept, and retried after partial_retry_seconds.
+                    self._partial = pending.partial
+                if self._allocator is not None or supply is not None:
+                    for event in self._missed:
+                        self._apply(event)
+                self._missed = []
+                if supply is not None:
+                    self._recompute(supply)
+
+    def _check_versions(self):
+        """Catch changes made by other workers, which this one's stream never sees.
+
+        Compares how far the shared per-table write counters (etags.VIEW_VERSIONS)
+        moved since the last check with the bumps this process made. Returns True
+        when requests changed elsewhere (a full read is needed); stock changed
+        elsewhere re-reads the supply.
+        """
+        # Own bumps first: one landing between the two reads only looks remote (an extra resync).
+        own = local_version_bumps()
+        versions = get_stat_item(self.db, VIEW_VERSIONS)
+        with self._lock:
+            seen, self._versions = self._versions, (versions, own)
+            if seen is None:
+                return False
+            seen_versions, seen_own = seen
+            if versions.get("epoch") != seen_versions.get("epoch"):
+                return True
+            resync = False
+            for table in self.tables:
+                moved = int(versions.get(table) or 0) - int(seen_versions.get(table) or 0)
+                remote = moved - (own[table] - seen_own[table])
+                if remote > 0 and table == "inventory_units":
+                    self._supply_dirty = True
+                elif remote > 0:
+                    resync = True
+            return resync
+
+    def _refresh(self):
+        """One round of the background thread: bring the allocation up to date and publish it."""
+        resync = self._check_versions()
+        age_limit = self.partial_retry_seconds if self._partial else self.resync_seconds
+        if resync or self._loaded_at is None or time.monotonic() - self._loaded_at > age_limit:
+            self._resync()
+        else:
+            with self._lock:
+                supply_dirty, self._supply_dirty = self._supply_dirty, False
+            supply = self._read_supply() if supply_dirty else None
+            with self._lock:
+                if supply is not None:
+                    if all(s >= old for s, old in zip(supply, self._allocator.supply)) and not self._stale:
+                        # Stock only grew: keep placements and retry the unallocated requests.
+                        self._allocator.supply = supply
+                        for request_id in self._order:
+                            if request_id not in self._allocated:
+                                self._try_place(self._pending[request_id])
+                        self._changed = True
+                    else:
+                        self._recompute(supply)
+                if self._stale:
+                    self._recompute(self._allocator.supply)
+        with self._lock:
+            if self._changed:
+                self._publish()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+            try:
+                self._refresh()
+            except Exception:
+                logger.exception("Allocation refresh failed")
+                time.sleep(self.poll_seconds)
+
+    def _start(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="allocation", daemon=True)
+                    self._thread.start()
+
+    # ----- results -----
+    def _request_sources(self):
+        """Split each recipient group's flow across its allocated requests in serving order."""
+        left = [row[:] for row in self._allocator.flow]
+        out = {}
+        for request_id in self._order:
+            if request_id not in self._allocated:
+                continue
+            req = self._pending[request_id]
+            r = GROUP_INDEX[req["blood_group"]]
+            need = _units(req)
+            sources = {}
+            for d in sorted(range(_N), key=lambda d: SUBSTITUTION_COST[r][d]):
+                take = min(need, left[r][d])
+                if take:
+                    sources[BLOOD_GROUPS[d]] = take
+                    left[r][d] -= take
+                    need -= take
+            out[request_id] = sources
+        return out
+
+    def _publish(self):
+        """Freeze the current allocation into the snapshot requests read (lock held)."""
+        sources = self._request_sources()
+        requests = {}
+        shortfall = {bg: 0 for bg in BLOOD_GROUPS}
+        for request_id in self._order:
+            req = self._pending[request_id]
+            allocated = request_id in self._allocated
+            requests[request_id] = {
+                "allocated": allocated,
+                "allocated_units": _units(req) if allocated else 0,
+                "allocated_from": sources.get(request_id, {}),
+                "queue_position": len(requests) + 1,
+            }
+            if not allocated and req.get("blood_group") in shortfall:
+                shortfall[req["blood_group"]] += _units(req)
+        allocator = self._allocator
+        self._published = {
+            "mode": self.mode,
+            "requests": requests,
+            "supply": {bg: allocator.supply[d] for d, bg in enumerate(BLOOD_GROUPS)},
+            "allocated": {bg: allocator.used(d) for d, bg in enumerate(BLOOD_GROUPS)},
+            "remaining": {bg: allocator.remaining(d) for d, bg in enumerate(BLOOD_GROUPS)},
+            "shortfall": shortfall,
+            "allocated_requests": len(self._allocated),
+            "unallocated_requests": len(self._order) - len(self._allocated),
+            "partial": self._partial,
+        }
+        self._changed = False
+        self._ready.set()
+
+    def _empty(self):
+        zeros = {bg: 0 for bg in BLOOD_GROUPS}
+        return {
+            "mode": self.mode,
+            "requests": {},
+            "supply": dict(zeros),
+            "allocated": dict(zeros),
+            "remaining": dict(zeros),
+            "shortfall": dict(zeros),
+            "allocated_requests": 0,
+            "unallocated_requests": 0,
+            "partial": True,
+        }
+
+    def snapshot(self):
+        """Current allocation: per-request results plus per-group supply, use and shortfall.
+
+        Never reads the tables. Until the first allocation is published, waits for it up
+        to wait_seconds (or what is left of the request's deadline), then returns an empty,
+        partial one. A partial allocation marks the request partial.
+        """
+        self._start()
+        published = self._published
+        if published is None:
+            self._wake.set()
+            remaining = remaining_request_time()
+            self._ready.wait(self.wait_seconds if remaining is None else min(self.wait_seconds, remaining))
+            published = self._published or self._empty()
+        deadline = current_deadline()
+        if published["partial"] and deadline is not None:
+            deadline.mark_partial(self.name, None)
+        return published
+
+
+def register_allocation_engine(db):
+    """Create the engine and subscribe it to request and donation events."""
+    engine = AllocationEngine(db)
+    for table in engine.tables:
+        db.events.subscribe(table, engine.apply, name=engine.name)
+    return engine
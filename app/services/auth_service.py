@@ -11,7 +11,9 @@ from app.services.database_service import (
     find_admin_by_email,
     create_admin,
     get_db,
+    site_of,
 )
+from app.services.request_scope import session_user
 from app.services.validation import validate_registration, validate_login, validate_choose_role
 
 
@@ -73,6 +75,8 @@ class AuthService:
             "user_email": user.get("email", ""),
             "role": user.get("role"),
             "current_role": user.get("current_role"),
+            # Blood banks read their own site's partition of inventory and requests.
+            "site_id": site_of(user) if user.get("role") == "bloodbank" else None,
         }
         return True, "Login successful.", out
 
@@ -95,4 +99,4 @@ class AuthService:
         user_id = session_dict.get("user_id")
         if not user_id:
             return None
-        return find_user_by_id(self.db, user_id)
+        return session_user(self.db, user_id)
@@ -0,0 +1,151 @@
+"""
+Batch API: run several API calls from one HTTP request, in-process.
+
+Each sub-request ({"id", "method", "path", "body", "headers"}) is dispatched
+through the app like a normal request, but it shares the batch's context:
+  - the session, decoded once from the batch's cookie (so a sub-request that
+    signs out or changes role is seen by the ones after it);
+  - the request scope, so e.g. the signed-in user is read once for all of them;
+  - the deadline: every sub-request gets what is left of the batch's budget.
+
+Consecutive GET sub-requests do not change anything and run in parallel on a
+pool of BATCH_WORKERS threads. Any other method runs alone, in order, once the
+GETs before it have finished; it clears the request scope, since it may have
+changed what was memoized. Results come back in request order, each with its
+own status and JSON body.
+
+Only calls answered with a JSON envelope can be batched. Streamed views
+(exports, the live feed; see streaming.streamed) are refused before they run:
+reading a live stream to the end would never finish, and an export would sit
+whole in memory. They, and any call whose response turns out to be streamed or
+not JSON, get a 400 of their own; the rest of the batch still runs.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import g, has_request_context, request, session
+from werkzeug.exceptions import HTTPException
+from werkzeug.test import EnvironBuilder
+
+from app.services.deadline import current_deadline, start_request_deadline
+from app.services.request_scope import current_scope
+from config import BATCH_WORKERS
+
+logger = logging.getLogger(__name__)
+
+# Marks the WSGI environ of a sub-request.
+BATCH_ENVIRON_KEY = "bloodbridge.batch"
+# Headers a sub-request may set; the rest (cookie, encodings) come from the batch.
+# Sub-responses are always JSON; the batch response itself is negotiated.
+SUB_REQUEST_HEADERS = ("If-None-Match",)
+PARALLEL_METHODS = ("GET",)
+
+
+class NotBatchable(Exception):
+    """A sub-request whose response cannot be carried in a batch (streamed, or not a JSON envelope)."""
+
+
+class BatchRunner:
+    """Dispatches batched sub-requests through the app on a shared thread pool."""
+
+    def __init__(self, app, workers=BATCH_WORKERS):
+        self.app = app
+        self.workers = workers
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch") if workers > 0 else None
+
+    def run(self, sub_requests):
+        """Results [{"id", "status", "body", "etag"?}] for validated sub-requests, in order."""
+        context = self._context()
+        results = []
+        wave = []
+        for sub in sub_requests:
+            if sub["method"] in PARALLEL_METHODS:
+                wave.append(sub)
+                continue
+            results.extend(self._run_parallel(wave, context))
+            wave = []
+            results.append(self._dispatch(sub, context))
+            context["scope"].clear()
+        results.extend(self._run_parallel(wave, context))
+        return results
+
+    def _context(self):
+        return {
+            "environ": request.environ,
+            "session": session._get_current_object(),
+            "scope": current_scope(),
+            "deadline": current_deadline(),
+        }
+
+    def _run_parallel(self, subs, context):
+        if len(subs) <= 1 or self._pool is None:
+            return [self._dispatch(sub, context) for sub in subs]
+        return list(self._pool.map(lambda sub: self._dispatch(sub, context), subs))
+
+    def _dispatch(self, sub, context):
+        result = {"id": sub["id"]}
+        try:
+            response = self._call(sub, context)
+        except NotBatchable as e:
+            result.update(status=400, body={"success": False, "message": str(e)})
+            return result
+        except Exception:
+            logger.exception("Batch sub-request %s %s failed", sub["method"], sub["path"])
+            result.update(status=500, body={"success": False, "message": "Internal error."})
+            return result
+        result["status"] = response.status_code
+        result["body"] = response.get_json(silent=True)
+        etag, _weak = response.get_etag()
+        if etag:
+            result["etag"] = etag
+        return result
+
+    def _call(self, sub, context):
+        parent = context["environ"]
+        path, _, query = sub["path"].partition("?")
+        headers = {k: v for k, v in (sub.get("headers") or {}).items() if k in SUB_REQUEST_HEADERS}
+        builder = EnvironBuilder(
+            path=path,
+            query_string=query,
+            method=sub["method"],
+            json=sub.get("body"),
+            headers=headers,
+            base_url=f"{parent.get('wsgi.url_scheme', 'http')}://{parent.get('HTTP_HOST', 'localhost')}",
+            environ_overrides={"REMOTE_ADDR": parent.get("REMOTE_ADDR"), BATCH_ENVIRON_KEY: True},
+        )
+        environ = builder.get_environ()
+        if self._streamed_view(environ):
+            raise NotBatchable(f"{sub['path']} streams its response; call it on its own.")
+        # A fresh app context per sub-request: its own g, holding the shared scope.
+        with self.app.app_context():
+            g.request_scope = context["scope"]
+            if context["deadline"] is not None:
+                start_request_deadline(context["deadline"].remaining() * 1000)
+            ctx = self.app.request_context(environ)
+            ctx.session = context["session"]
+            with ctx:
+                response = self.app.full_dispatch_request()
+                if response.is_json and not response.is_streamed:
+                    return response
+                response.close()
+                if response.status_code >= 300:
+                    # A 304, or an error page (404 / 405 from routing): keep the status, not the body.
+                    response.set_data(b"")
+                    return response
+                if response.is_streamed:
+                    raise NotBatchable(f"{sub['path']} streams its response; call it on its own.")
+                raise NotBatchable(f"{sub['path']} does not answer with JSON; call it on its own.")
+
+    def _streamed_view(self, environ):
+        """True when environ routes to a view marked streaming.streamed."""
+        try:
+            endpoint, _args = self.app.url_map.bind_to_environ(environ).match()
+        except HTTPException:
+            # 404 / 405: dispatched as usual, to get the app's own error response.
+            return False
+        return getattr(self.app.view_functions.get(endpoint), "streamed", False)
+
+
+def in_batch():
+    """True while handling a sub-request of a batch."""
+    return has_request_context() and request.environ.get(BATCH_ENVIRON_KEY) is True
@@ -0,0 +1,150 @@
+"""
+Local change-data-capture stream that mimics DynamoDB Streams.
+
+database_service write functions publish a ChangeEvent (INSERT / MODIFY / REMOVE
+with new and old images) after each successful write. Consumers subscribe per
+table and maintain derived views off the request path.
+
+Buses are pluggable (EVENT_BUS in config):
+  - "local": events are sharded by item key onto a pool of worker threads, so
+    events for one item are applied in order (like a Streams shard).
+  - "inline": handlers run synchronously in the publisher (scripts, tests).
+
+A failed handler is retried with the same event, so by default handlers must be
+idempotent (puts, conditional writes, recomputes). Handlers that are not (ADD
+counters: a retry after a partial apply would count twice) subscribe with
+retry=False and run once; the reconciler repairs what a failure leaves behind.
+"""
+import itertools
+import logging
+import queue
+import threading
+import time
+import zlib
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+INSERT = "INSERT"
+MODIFY = "MODIFY"
+REMOVE = "REMOVE"
+
+
+class ChangeEvent:
+    """One item-level change. Images are plain dicts (already de-Decimalized) or None."""
+
+    __slots__ = ("table", "event_name", "key", "new_image", "old_image", "sequence_number", "created_at")
+
+    def __init__(self, table, event_name, new_image=None, old_image=None, sequence_number=None):
+        self.table = table
+        self.event_name = event_name
+        self.new_image = new_image
+        self.old_image = old_image
+        image = new_image or old_image or {}
+        self.key = str(image.get("id", ""))
+        self.sequence_number = sequence_number
+        self.created_at = datetime.utcnow().isoformat() + "Z"
+
+    def __repr__(self):
+        return f"<ChangeEvent {self.table} {self.event_name} {self.key} #{self.sequence_number}>"
+
+
+class EventBus:
+    """Base bus: subscription registry and dispatch with bounded retries."""
+
+    def __init__(self, max_attempts=3):
+        self.max_attempts = max_attempts
+        self._subscribers = {}
+        self._sequence = itertools.count(1)
+
+    def subscribe(self, table, handler, name=None, retry=True):
+        """Call handler(event) for every change on table.
+
+        With retry (the default) a failed handler gets the same event again, so it must
+        tolerate replays; pass retry=False for handlers that are not idempotent.
+        """
+        self._subscribers.setdefault(table, []).append((name or handler.__name__, handler, retry))
+
+    def publish(self, event):
+        event.sequence_number = next(self._sequence)
+        self._enqueue(event)
+
+    def _enqueue(self, event):
+        raise NotImplementedError
+
+    def _dispatch(self, event):
+        for name, handler, retry in self._subscribers.get(event.table, []):
+            attempts = self.max_attempts if retry else 1
+            for attempt in range(1, attempts + 1):
+                try:
+                    handler(event)
+                    break
+                except Exception:
+                    if attempt == attempts:
+                        # Dropped; the reconciler repairs any drift this leaves behind.
+                        logger.exception("Consumer %s failed on %r", name, event)
+                    else:
+                        time.sleep(0.05 * attempt)
+
+    def drain(self, timeout=None):
+        """Block until every published event has been handled."""
+        return True
+
+    def close(self):
+        pass
+
+
+class InlineEventBus(EventBus):
+    """Runs consumers synchronously in the publishing thread."""
+
+    def _enqueue(self, event):
+        self._dispatch(event)
+
+
+class LocalStreamBus(EventBus):
+    """Worker pool with one queue per shard; an item's events always land on the same shard."""
+
+    def __init__(self, workers=4, max_attempts=3):
+        super().__init__(max_attempts=max_attempts)
+        self._shards = [queue.Queue() for _ in range(max(1, workers))]
+        self._threads = []
+        for i, q in enumerate(self._shards):
+            t = threading.Thread(target=self._run, args=(q,), name=f"change-stream-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def _enqueue(self, event):
+        shard = zlib.crc32(f"{event.table}#{event.key}".encode()) % len(self._shards)
+        self._shards[shard].put(event)
+
+    def _run(self, q):
+        while True:
+            event = q.get()
+            try:
+                if event is None:
+                    return
+                self._dispatch(event)
+            finally:
+                q.task_done()
+
+    def drain(self, timeout=None):
+        end = None if timeout is None else time.monotonic() + timeout
+        for q in self._shards:
+            while q.unfinished_tasks:
+                if end is not None and time.monotonic() >= end:
+                    return False
+                time.sleep(0.005)
+        return True
+
+    def close(self):
+        for q in self._shards:
+            q.put(None)
+
+
+def build_event_bus(kind="local", workers=4):
+    """Return the configured bus implementation."""
+    if kind == "inline":
+        return InlineEventBus()
+    if kind == "local":
+        return LocalStreamBus(workers=workers)
+    raise ValueError(f"Unknown event bus: {kind}")
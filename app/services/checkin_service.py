@@ -0,0 +1,127 @@
+"""
+Donation check-in: move one or many donations to new statuses.
+
+Each requested change is validated against DONATION_TRANSITIONS; the valid ones
+are applied DONATIONS_PER_TRANSACTION at a time, each group as one
+TransactWriteItems of conditional updates (the donation must still be in the
+status it was read in). A donation that is completed adds its inventory unit;
+one whose completion is cancelled discards its unit if it is still on the shelf.
+The site and network inventory counters and the daily collected-donations
+rollup move in the same transaction, so stock and counts are right as soon as
+the call returns. Slot bookings and the donor index follow from the change events.
+
+When a transaction is cancelled, the donations that caused it are reported
+and the rest of the group is retried without them.
+"""
+from app.services.database_service import (
+    get_db,
+    get_donations_by_ids,
+    transition_donations,
+    TransactionCancelled,
+)
+from app.services.inventory_ledger import COLLECTED, unit_for_donation
+from config import DONATION_TRANSITIONS
+
+# Per-item failure reasons
+NOT_FOUND = "not_found"
+INVALID_TRANSITION = "invalid_transition"
+CONFLICT = "conflict"
+
+# Donation update, unit write and daily rollup item per donation, plus up to two
+# counter items per (site, shard) touched: 20 donations fit the 100-action limit.
+DONATIONS_PER_TRANSACTION = 20
+
+
+def _result(donation_id, success, status=None, previous_status=None, reason=None, message=None):
+    out = {"donation_id": donation_id, "success": success, "status": status, "previous_status": previous_status}
+    if reason:
+        out["reason"] = reason
+        out["message"] = message
+    return out
+
+
+class DonationCheckinService:
+    """Donation status transitions (single and bulk); requires Flask app for DB and the unit ledger."""
+
+    def __init__(self, app, max_attempts=3):
+        self.app = app
+        self.db = get_db(app)
+        self.ledger = app.extensions["inventory_ledger"]
+        self.max_attempts = max_attempts
+
+    def transition(self, updates):
+        """Apply [{"donation_id", "status"}] changes. Returns one result per update, in order."""
+        return self._transition(updates)[0]
+
+    def transition_one(self, donation_id, status):
+        """Apply one change. Returns (result, the donation as it now is, or None if not found)."""
+        results, donations = self._transition([{"donation_id": donation_id, "status": status}])
+        donation = donations.get(donation_id)
+        if donation and results[0]["success"]:
+            donation = dict(donation, status=results[0]["status"])
+        return results[0], donation
+
+    def _transition(self, updates):
+        donations = get_donations_by_ids(self.db, [u["donation_id"] for u in updates])
+        results = {}
+        changes = []
+        for update in updates:
+            donation_id, status = update["donation_id"], update["status"]
+            donation = donations.get(donation_id)
+            if not donation:
+                results[donation_id] = _result(donation_id, False, reason=NOT_FOUND, message="Donation not found.")
+                continue
+            current = donation.get("status")
+            if current == status:
+                results[donation_id] = _result(donation_id, True, status, current)
+            elif status not in DONATION_TRANSITIONS.get(current, []):
+                results[donation_id] = _result(
+                    donation_id, False, current, current, INVALID_TRANSITION, f"Cannot change {current} to {status}."
+                )
+            else:
+                # Collecting adds the unit; reverting a collection discards it.
+                unit = None
+                if COLLECTED in (status, current):
+                    unit = unit_for_donation(donation, self.ledger.shelf_life_days)
+                changes.append((donation, status, unit))
+        for start in range(0, len(changes), DONATIONS_PER_TRANSACTION):
+            self._apply(changes[start:start + DONATIONS_PER_TRANSACTION], results)
+        return [results[u["donation_id"]] for u in updates], donations
+
+    def _apply(self, changes, results):
+        for _ in range(self.max_attempts):
+            if not changes:
+                return
+            try:
+                transition_donations(self.db, changes)
+            except TransactionCancelled as e:
+                changes = self._without_failures(changes, e.reasons, results)
+                continue
+            for donation, status, _unit in changes:
+                results[donation["id"]] = _result(donation["id"], True, status, donation.get("status"))
+            return
+        for donation, status, _unit in changes:
+            results[donation["id"]] = _result(
+                donation["id"], False, donation.get("status"), donation.get("status"), CONFLICT,
+                "Donations are changing too fast; please retry.",
+            )
+
+    @staticmethod
+    def _without_failures(changes, reasons, results):
+        """Changes left to retry after a cancelled transaction (all of them after a plain conflict)."""
+        unit_reasons = iter(reasons[len(changes):])
+        retry = []
+        for (donation, status, unit), reason in zip(changes, reasons):
+            unit_reason = next(unit_reasons, "None") if unit else "None"
+            if reason == "ConditionalCheckFailed":
+                results[donation["id"]] = _result(
+                    donation["id"], False, None, donation.get("status"), CONFLICT,
+                    "Donation changed while updating; reload and retry.",
+                )
+            elif unit_reason == "ConditionalCheckFailed":
+                # Collecting: the unit exists from an earlier collection, as the ledger would find.
+                # Reverting: the unit is no longer on the shelf (reserved, issued or expired).
+                retry.append((donation, status, None))
+            else:
+                retry.append((donation, status, unit))
+        return retry
@@ -0,0 +1,118 @@
+"""
+ABO/Rh red-cell compatibility engine.
+
+Each blood group is encoded as a 3-bit antigen set (A, B, RhD). A donor can give
+to a recipient when the donor carries no antigen the recipient lacks. From that
+rule an 8x8 donor -> recipient matrix (and a per-recipient donor bitmask) is
+precomputed once at import, so availability for a whole list of requests is a
+couple of NumPy array operations.
+
+Modes:
+  - "exact": only the requested group counts as supply.
+  - "compatible": every compatible donor group counts as supply.
+"""
+import numpy as np
+
+from config import BLOOD_GROUPS
+
+EXACT = "exact"
+COMPATIBLE = "compatible"
+MODES = (EXACT, COMPATIBLE)
+
+_A, _B, _RH = 1, 2, 4
+ANTIGENS = {
+    "O-": 0, "O+": _RH,
+    "A-": _A, "A+": _A | _RH,
+    "B-": _B, "B+": _B | _RH,
+    "AB-": _A | _B, "AB+": _A | _B | _RH,
+}
+
+GROUP_INDEX = {bg: i for i, bg in enumerate(BLOOD_GROUPS)}
+_N = len(BLOOD_GROUPS)
+
+# COMPATIBILITY[r, d] is True when donor group d can give to recipient group r.
+_antigens = np.array([ANTIGENS[bg] for bg in BLOOD_GROUPS], dtype=np.uint8)
+COMPATIBILITY = (_antigens[None, :] & ~_antigens[:, None]) == 0
+COMPATIBILITY.flags.writeable = False
+# DONOR_MASK[r]: bit d set when donor group d can give to recipient group r.
+DONOR_MASK = (COMPATIBILITY.astype(np.uint16) << np.arange(_N, dtype=np.uint16)).sum(axis=1).astype(np.uint16)
+DONOR_MASK.flags.writeable = False
+_EXACT_MATRIX = np.eye(_N, dtype=bool)
+
+
+def can_donate(donor_group, recipient_group):
+    """True if red cells of donor_group are compatible with recipient_group."""
+    d, r = GROUP_INDEX.get(donor_group), GROUP_INDEX.get(recipient_group)
+    if d is None or r is None:
+        return False
+    return bool(DONOR_MASK[r] >> d & 1)
+
+
+def donor_groups_for(recipient_group, mode=COMPATIBLE):
+    """Donor groups that can supply recipient_group, in BLOOD_GROUPS order."""
+    r = GROUP_INDEX.get(recipient_group)
+    if r is None:
+        return []
+    if mode == EXACT:
+        return [recipient_group]
+    return [bg for d, bg in enumerate(BLOOD_GROUPS) if DONOR_MASK[r] >> d & 1]
+
+
+def recipient_groups_for(donor_group):
+    """Recipient groups that donor_group can give to, in BLOOD_GROUPS order."""
+    d = GROUP_INDEX.get(donor_group)
+    if d is None:
+        return []
+    return [bg for r, bg in enumerate(BLOOD_GROUPS) if COMPATIBILITY[r, d]]
+
+
+def inventory_vector(inventory):
+    """dict blood_group -> units as an int64 vector in BLOOD_GROUPS order."""
+    return np.array([int(inventory.get(bg, 0) or 0) for bg in BLOOD_GROUPS], dtype=np.int64)
+
+
+def supply_by_recipient_group(inventory, mode=COMPATIBLE):
+    """Units usable by each recipient group (vector in BLOOD_GROUPS order)."""
+    matrix = COMPATIBILITY if mode == COMPATIBLE else _EXACT_MATRIX
+    return matrix.astype(np.int64) @ inventory_vector(inventory)
+
+
+def encode_requests(requests):
+    """Return (group_index, units) int arrays for request dicts; unknown groups get index -1."""
+    n = len(requests)
+    groups = np.fromiter((GROUP_INDEX.get(r.get("blood_group") or "", -1) for r in requests), dtype=np.int64, count=n)
+    units = np.fromiter((_units(r.get("units")) for r in requests), dtype=np.int64, count=n)
+    return groups, units
+
+
+def evaluate_encoded(groups, units, supply):
+    """Vectorized availability for encoded requests against a supply vector.
+
+    Returns (available_units, is_available) arrays; requests for zero units or an
+    unknown group are never available.
+    """
+    known = groups >= 0
+    available = np.where(known, supply[np.where(known, groups, 0)], 0)
+    return available, known & (units > 0) & (available >= units)
+
+
+def evaluate_availability(requests, inventory, mode=COMPATIBLE):
+    """Availability for a list of request dicts against an inventory dict.
+
+    Returns a list of {"available_units", "is_available"} in request order.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown availability mode: {mode}")
+    groups, units = encode_requests(requests)
+    available, ok = evaluate_encoded(groups, units, supply_by_recipient_group(inventory, mode))
+    return [
+        {"available_units": int(a), "is_available": bool(o)}
+        for a, o in zip(available.tolist(), ok.tolist())
+    ]
+
+
+def _units(value):
+    try:
+        return int(value) if value else 0
+    except (TypeError, ValueError):
+        return 0
@@ -2,16 +2,58 @@
 All database access for Blood Bridge.
 Uses DynamoDB via boto3. No raw DB access in routes.
 """
+import heapq
+import logging
+import threading
 import uuid
+import zlib
 from datetime import datetime
 from decimal import Decimal
 
 from app.models.user import User
 from app.models.donor import Donation
 from app.models.request import BloodRequest
+from app.services.resilience import DatabaseUnavailable
+from app.services.deadline import current_deadline, encode_cursor, decode_cursor, InvalidCursor
+from app.services.change_stream import ChangeEvent, INSERT, MODIFY, REMOVE
+from app.services.geo import geo_attributes
 from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ClientError
 
-from config import BLOOD_GROUPS
+from config import (
+    BLOOD_GROUPS,
+    INVENTORY_COUNTER_SHARDS,
+    GEO_CELL_PRECISION,
+    REQUEST_URGENCIES,
+    DEFAULT_REQUEST_URGENCY,
+    DEFAULT_SITE_ID,
+    DONATION_SLOT_CAPACITY,
+    DONATION_STATUSES,
+    REQUEST_STATUSES,
+)
+
+# DynamoDB limit on the number of actions in one TransactWriteItems call.
+MAX_TRANSACT_ITEMS = 100
+# DynamoDB limit on the number of keys in one BatchGetItem call.
+MAX_BATCH_GET_KEYS = 100
+# Stats item prefix of the sharded usable-inventory counter (inventory#<shard>).
+INVENTORY_COUNTER = "inventory"
+# Per-site counter, same shards (site_inventory#<site>#<shard>); the network counter is their roll-up.
+SITE_INVENTORY_COUNTER = "site_inventory"
+# Collected donations per day and blood group (donations_daily#<date>), moved with the donation's status.
+DONATIONS_DAILY_COUNTER = "donations_daily"
+DONATION_COLLECTED = "Completed"
+# Stats item with one write counter per table, bumped in the write path (see etags).
+VIEW_VERSIONS = "view_versions"
+VERSIONED_TABLES = ("blood_requests", "donations", "inventory_units", "users")
+
+logger = logging.getLogger(__name__)
+
+# Stored with the counters when the item is first created (a rebuild starts a new epoch).
+_versions_epoch = uuid.uuid4().hex
+# Bumps made by this process, so a reader can tell other workers' writes from its own.
+_local_bumps = dict.fromkeys(VERSIONED_TABLES, 0)
+_local_bumps_lock = threading.Lock()
 
 
 def get_db(app):
@@ -36,6 +78,272 @@ def _serialize_item(item):
     return out
 
 
+def _bump_version(db, table):
+    """Move table's write counter, so ETags change before the write's response is sent."""
+    try:
+        bump_stat_version(db, VIEW_VERSIONS, table, _versions_epoch)
+    except Exception:
+        # The write itself succeeded; failing it now would invite a duplicate retry.
+        # The stream's applied counter still moves once the views catch up.
+        logger.exception("Could not bump the %s version", table)
+        return
+    with _local_bumps_lock:
+        _local_bumps[table] += 1
+
+
+def local_version_bumps():
+    """{table: write counter bumps made by this process so far}."""
+    with _local_bumps_lock:
+        return dict(_local_bumps)
+
+
+def _emit(db, table, event_name, new_image=None, old_image=None, bump=True):
+    """Bump the version of a VERSIONED_TABLES table, then publish the write's change event.
+
+    One bump per table is enough for a write that emits several events (bump=False for the rest).
+    """
+    if bump and table in VERSIONED_TABLES:
+        _bump_version(db, table)
+    _publish(db, table, event_name, new_image, old_image)
+
+
+def _publish(db, table, event_name, new_image=None, old_image=None):
+    """Publish a change event for a completed write (no-op when the wrapper has no bus)."""
+    events = getattr(db, "events", None)
+    if events is None:
+        return
+    events.publish(ChangeEvent(
+        table,
+        event_name,
+        new_image=_serialize_item(new_image),
+        old_image=_serialize_item(old_image),
+    ))
+
+
+def _is_conditional_failure(e):
+    return e.response.get("Error", {}).get("Code") == "ConditionalCheckFailedException"
+
+
+class TransactionCancelled(Exception):
+    """A TransactWriteItems call was cancelled; reasons[i] is the code for action i ("None" if it was fine)."""
+
+    def __init__(self, reasons):
+        super().__init__("Transaction cancelled: " + ", ".join(reasons))
+        self.reasons = reasons
+
+
+def _tx_put(db, table, item, condition=None):
+    """A Put action on db.<table> for _transact_write."""
+    put = {"TableName": getattr(db, table).name, "Item": item}
+    if condition:
+        put["ConditionExpression"] = condition
+    return {"Put": put}
+
+
+def _tx_update(db, table, key, update, condition=None, names=None, values=None):
+    """An Update action on db.<table> for _transact_write."""
+    action = {"TableName": getattr(db, table).name, "Key": key, "UpdateExpression": update}
+    if condition:
+        action["ConditionExpression"] = condition
+    if names:
+        action["ExpressionAttributeNames"] = names
+    if values:
+        action["ExpressionAttributeValues"] = values
+    return {"Update": action}
+
+
+def _transact_write(db, actions):
+    """Run actions atomically (TransactWriteItems) through the call guard.
+
+    Raises TransactionCancelled with per-action reason codes when a condition fails
+    or the transaction conflicts with another one. The resource's client serializes
+    plain Python values, like Table calls.
+    """
+    client = db.client.meta.client
+    table = actions[0][next(iter(actions[0]))]["TableName"]
+    try:
+        db.guard.call(table, "transact_write_items", client.transact_write_items, TransactItems=actions)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") != "TransactionCanceledException":
+            raise
+        reasons = [r.get("Code", "None") for r in e.response.get("CancellationReasons", [])]
+        raise TransactionCancelled(reasons or ["Unknown"] * len(actions)) from e
+
+
+def _batch_get(db, table, keys):
+    """BatchGetItem on db.<table> through the call guard; returns de-Decimalized items.
+
+    UnprocessedKeys (throttling) are re-sent after the guard's backoff, within its
+    retry budget and the request deadline; DatabaseUnavailable once those run out.
+    """
+    name = getattr(db, table).name
+    request = {name: {"Keys": list(keys)}}
+    items = []
+    budget_end, attempt = db.guard.budget_end(), 0
+    while True:
+        r = db.guard.call(name, "batch_get_item", db.client.batch_get_item, RequestItems=request)
+        returned = r.get("Responses", {}).get(name, [])
+        items.extend(_serialize_item(i) for i in returned)
+        unprocessed = r.get("UnprocessedKeys") or None
+        if not unprocessed:
+            return items
+        # Consecutive rounds without progress count towards the attempt limit.
+        attempt = 1 if returned else attempt + 1
+        if not db.guard.backoff(attempt, budget_end):
+            raise DatabaseUnavailable(
+                name, f"batch_get_item left {len(unprocessed[name]['Keys'])} key(s) unprocessed"
+            )
+        request = unprocessed
+
+
+def inventory_shard(unit_id):
+    """Counter shard a unit is counted in; fixed per unit so shards can be recomputed."""
+    return zlib.crc32(str(unit_id).encode()) % INVENTORY_COUNTER_SHARDS
+
+
+def site_of(item):
+    """Site an item (donation, request or unit) belongs to; items from before sites use the default."""
+    return (item or {}).get("site_id") or DEFAULT_SITE_ID
+
+
+def _tx_inventory_deltas(db, deltas):
+    """Update actions applying {(site, shard, blood_group): delta} to the site and network counters."""
+    by_item = {}
+    for (site, shard, group), delta in deltas.items():
+        if not delta:
+            continue
+        for item_id in (f"{INVENTORY_COUNTER}#{shard}", f"{SITE_INVENTORY_COUNTER}#{site}#{shard}"):
+            groups = by_item.setdefault(item_id, {})
+            groups[group] = groups.get(group, 0) + delta
+    return _tx_stat_adds(db, by_item)
+
+
+def _daily_donation_deltas(changes):
+    """{stats item id: {blood_group: delta}} for (donation, new status) pairs entering or leaving collected."""
+    by_item = {}
+    for donation, status in changes:
+        delta = (status == DONATION_COLLECTED) - (donation.get("status") == DONATION_COLLECTED)
+        if not delta or not donation.get("date") or not donation.get("blood_group"):
+            continue
+        groups = by_item.setdefault(f"{DONATIONS_DAILY_COUNTER}#{str(donation['date'])[:10]}", {})
+        groups[donation["blood_group"]] = groups.get(donation["blood_group"], 0) + delta
+    return by_item
+
+
+def _tx_stat_adds(db, by_item):
+    """Update actions adding {stats item id: {attribute: delta}} (zero deltas skipped)."""
+    actions = []
+    for item_id, groups in sorted(by_item.items()):
+        groups = {g: d for g, d in groups.items() if d}
+        if not groups:
+            continue
+        names = {f"#g{i}": g for i, g in enumerate(groups)}
+        values = {f":d{i}": d for i, d in enumerate(groups.values())}
+        update = "ADD " + ", ".join(f"#g{i} :d{i}" for i in range(len(groups)))
+        actions.append(_tx_update(db, "stats", {"id": item_id}, update, names=names, values=values))
+    return actions
+
+
+class PagedList(list):
+    """Items from a paged read. partial/cursor are set when the request deadline stopped it early."""
+
+    partial = False
+    cursor = None
+
+    def carry(self, items):
+        """Return items as a PagedList with this page's partial/cursor."""
+        out = PagedList(items)
+        out.partial = self.partial
+        out.cursor = self.cursor
+        return out
+
+
+def _resorted(pager, items):
+    """Wrap items re-sorted in memory: partial as read, but never a cursor.
+
+    The scan cursor resumes in table order, so pages continued from it would not
+    follow on from this sort order.
+    """
+    out = pager.wrap(items)
+    out.cursor = None
+    return out
+
+
+def _failed_read():
+    """Result of a list read that failed: empty, and partial (there may be items it could not read)."""
+    out = PagedList()
+    out.partial = True
+    return out
+
+
+class _Pager:
+    """Iterate the raw pages of a query/scan, following LastEvaluatedKey.
+
+    Always fetches at least one page; after that, stops as soon as the request
+    deadline has passed and records a continuation cursor (also on the deadline,
+    under `name`). `cursor` resumes from a token returned earlier.
+    """
+
+    def __init__(self, name, method, cursor=None, **kwargs):
+        self.name = name
+        self.method = method
+        self.start = decode_cursor(cursor)
+        if cursor and self.start is None:
+            raise InvalidCursor(f"{name}: malformed cursor")
+        self.kwargs = kwargs
+        self.cursor = None
+
+    def __iter__(self):
+        deadline = current_deadline()
+        start = self.start
+        while True:
+            if start:
+                self.kwargs["ExclusiveStartKey"] = start
+            try:
+                r = self.method(**self.kwargs)
+            except ClientError as e:
+                # A key that does not belong to this table or index came from the client.
+                if start is self.start and start and e.response.get("Error", {}).get("Code") == "ValidationException":
+                    raise InvalidCursor(f"{self.name}: cursor does not fit this read") from e
+                raise
+            yield r
+            start = r.get("LastEvaluatedKey")
+            if not start:
+                return
+            if deadline is not None and deadline.expired():
+                self.cursor = encode_cursor(start)
+                deadline.mark_partial(self.name, self.cursor)
+                return
+
+    def wrap(self, items):
+        out = PagedList(items)
+        out.partial = self.cursor is not None
+        out.cursor = self.cursor
+        return out
+
+
+def _query_cells(name, method, prefixes, cell_attribute, values=None, **kwargs):
+    """Query a (cell, geohash) index once per geohash prefix and concatenate the items.
+
+    Each prefix is at least GEO_CELL_PRECISION characters; its head is the cell
+    (partition key) and begins_with on geohash narrows the range within it.
+    """
+    items = PagedList()
+    for prefix in prefixes:
+        pager = _Pager(
+            name,
+            method,
+            KeyConditionExpression=f"{cell_attribute} = :c AND begins_with(geohash, :p)",
+            ExpressionAttributeValues=dict(values or {}, **{":c": prefix[:GEO_CELL_PRECISION], ":p": prefix}),
+            **kwargs,
+        )
+        for r in pager:
+            items.extend(_serialize_item(i) for i in r.get("Items", []))
+        if pager.cursor:
+            items.partial = True
+    return items
+
+
 # ---------- Users ----------
 def find_user_by_id(db, user_id):
     item = User.from_id(db, user_id)
@@ -55,10 +363,22 @@ def find_user_by_email(db, email):
         )
         items = list(r.get("Items", []))
         return _serialize_item(items[0]) if items else None
+    except DatabaseUnavailable:
+        raise
     except Exception:
         return None
 
 
+def get_users_by_ids(db, user_ids):
+    """Return {user_id: user} for the users that exist (one BatchGetItem per 100 ids)."""
+    user_ids = list(dict.fromkeys(u for u in user_ids if u))
+    out = {}
+    for start in range(0, len(user_ids), MAX_BATCH_GET_KEYS):
+        chunk = user_ids[start:start + MAX_BATCH_GET_KEYS]
+        out.update((u["id"], u) for u in _batch_get(db, "users", [{"id": u} for u in chunk]))
+    return out
+
+
 def create_user(db, name, email, password_hash, blood_group=None, role=None):
     user_id = str(uuid.uuid4())
     item = {
@@ -72,28 +392,51 @@ def create_user(db, name, email, password_hash, blood_group=None, role=None):
     if role is not None:
         item["role"] = role
     db.users.put_item(Item=item)
+    _emit(db, "users", INSERT, new_image=item)
     return user_id
 
 
 def update_user_current_role(db, user_id, current_role):
-    db.users.update_item(
+    r = db.users.update_item(
         Key={"id": user_id},
         UpdateExpression="SET current_role = :r",
         ExpressionAttributeValues={":r": current_role},
+        ReturnValues="ALL_OLD",
     )
+    old = r.get("Attributes")
+    if old:
+        _emit(db, "users", MODIFY, new_image=dict(old, current_role=current_role), old_image=old)
+
+
+def set_user_site(db, user_id, site_id):
+    """Assign a blood bank user to a site. Returns False when the user is missing or not a blood bank."""
+    try:
+        r = db.users.update_item(
+            Key={"id": user_id},
+            UpdateExpression="SET site_id = :s",
+            ConditionExpression="#r = :bank",
+            ExpressionAttributeNames={"#r": "role"},
+            ExpressionAttributeValues={":s": site_id, ":bank": "bloodbank"},
+            ReturnValues="ALL_OLD",
+        )
+    except ClientError as e:
+        if _is_conditional_failure(e):
+            return False
+        raise
+    old = r.get("Attributes") or {}
+    _emit(db, "users", MODIFY, new_image=dict(old, site_id=site_id), old_image=old)
+    return True
 
 
 def delete_user_by_id(db, user_id):
-    db.users.delete_item(Key={"id": user_id})
+    r = db.users.delete_item(Key={"id": user_id}, ReturnValues="ALL_OLD")
+    if r.get("Attributes"):
+        _emit(db, "users", REMOVE, old_image=r["Attributes"])
 
 
-def list_all_users(db):
-    r = db.users.scan()
-    items = r.get("Items", [])
-    while r.get("LastEvaluatedKey"):
-        r = db.users.scan(ExclusiveStartKey=r["LastEvaluatedKey"])
-        items.extend(r.get("Items", []))
-    return [_serialize_item(i) for i in items]
+def list_all_users(db, cursor=None):
+    pager = _Pager("list_all_users", db.users.scan, cursor=cursor)
+    return pager.wrap(_serialize_item(i) for r in pager for i in r.get("Items", []))
 
 
 def enrich_users_with_blood_group(db, users):
@@ -108,18 +451,44 @@ def enrich_users_with_blood_group(db, users):
             if donations and donations[0].get("blood_group"):
                 bg = donations[0]["blood_group"]
                 user["blood_group"] = bg
-                db.users.update_item(
+                r = db.users.update_item(
                     Key={"id": uid},
                     UpdateExpression="SET blood_group = :bg",
                     ExpressionAttributeValues={":bg": str(bg)},
+                    ReturnValues="ALL_OLD",
                 )
+                old = r.get("Attributes")
+                if old:
+                    _emit(db, "users", MODIFY, new_image=dict(old, blood_group=str(bg)), old_image=old)
+        except DatabaseUnavailable:
+            raise
         except Exception:
             continue
     return users
 
 
 # ---------- Donations ----------
-def create_donation(db, donor_id, donor_name, blood_group, date, location, time_slot, status="Scheduled"):
+def create_donation(
+    db,
+    donor_id,
+    donor_name,
+    blood_group,
+    date,
+    location,
+    time_slot,
+    status="Scheduled",
+    lat=None,
+    lon=None,
+    site_id=None,
+    capacity=DONATION_SLOT_CAPACITY,
+):
+    """Book a donation, taking one place in its slot in the same transaction.
+
+    The slot's counter only moves while it is below the slot's capacity (its
+    stored override, else `capacity`). Returns the donation id, or None when
+    the slot is full. A transaction that conflicts with a concurrent booking is
+    retried with the call guard's backoff; DatabaseUnavailable if it keeps conflicting.
+    """
     donation_id = str(uuid.uuid4())
     item = {
         "id": donation_id,
@@ -130,86 +499,189 @@ def create_donation(db, donor_id, donor_name, blood_group, date, location, time_
         "location": location or "",
         "time_slot": time_slot or "",
         "status": status,
+        "site_id": site_id or DEFAULT_SITE_ID,
     }
-    db.donations.put_item(Item=item)
+    item.update(geo_attributes(lat, lon))
+    actions = [
+        _tx_update(
+            db,
+            "donation_slots",
+            slot_key(location, date, time_slot),
+            "ADD booked :one SET #loc = :loc, #d = :d, time_slot = :t",
+            condition=(
+                "attribute_not_exists(booked) OR booked < #cap"
+                " OR (attribute_not_exists(#cap) AND booked < :cap)"
+            ),
+            names={"#loc": "location", "#d": "date", "#cap": "capacity"},
+            values={":one": 1, ":loc": item["location"], ":d": item["date"], ":t": item["time_slot"], ":cap": capacity},
+        ),
+        _tx_put(db, "donations", item),
+    ]
+    # A donation booked as already collected counts in its day's rollup.
+    actions.extend(_tx_stat_adds(db, _daily_donation_deltas([(dict(item, status=None), status)])))
+    budget_end, attempt = db.guard.budget_end(), 0
+    while True:
+        attempt += 1
+        try:
+            _transact_write(db, actions)
+            break
+        except TransactionCancelled as e:
+            # reasons[0] is the slot: only its failed condition means the slot is full.
+            if e.reasons[0] == "ConditionalCheckFailed":
+                return None
+            if not db.guard.backoff(attempt, budget_end):
+                raise DatabaseUnavailable(
+                    db.donation_slots.name, f"booking cancelled after {attempt} attempt(s): {e}"
+                ) from e
+    _emit(db, "donations", INSERT, new_image=item)
     return donation_id
 
 
+def get_donations_by_ids(db, donation_ids):
+    """Return {donation_id: donation} for the donations that exist (one BatchGetItem per 100 ids)."""
+    donation_ids = list(dict.fromkeys(donation_ids))
+    out = {}
+    for start in range(0, len(donation_ids), MAX_BATCH_GET_KEYS):
+        chunk = donation_ids[start:start + MAX_BATCH_GET_KEYS]
+        out.update((d["id"], d) for d in _batch_get(db, "donations", [{"id": d} for d in chunk]))
+    return out
+
+
+def transition_donations(db, changes):
+    """Move several donations to new statuses in one TransactWriteItems.
+
+    changes: (donation, status, unit) tuples; each donation must still have its
+    current status. unit, when given, is the donation's inventory unit: a
+    collection puts it (unless one exists), a reverted collection discards it
+    (it must still be available). Either way the site and network inventory
+    counters and the daily collected-donations rollup move in the same transaction.
+    Raises TransactionCancelled; reasons[i] is change i's donation, then one
+    reason per unit in the order of the changes that have one.
+    """
+    actions, unit_actions, deltas, discarded = [], [], {}, set()
+    for donation, status, unit in changes:
+        actions.append(_tx_update(
+            db,
+            "donations",
+            {"id": donation["id"]},
+            "SET #st = :s",
+            condition="#st = :e",
+            names={"#st": "status"},
+            values={":s": status, ":e": donation.get("status")},
+        ))
+        if not unit:
+            continue
+        key = (site_of(unit), inventory_shard(unit["id"]), unit["blood_group"])
+        if status == DONATION_COLLECTED:
+            unit_actions.append(_tx_put(db, "inventory_units", unit, "attribute_not_exists(id)"))
+            if unit.get("status") == "available":
+                deltas[key] = deltas.get(key, 0) + 1
+        else:
+            unit_actions.append(_tx_update(
+                db,
+                "inventory_units",
+                {"id": unit["id"]},
+                _unit_update("discarded"),
+                condition="#st = :e",
+                names={"#st": "status"},
+                values={":s": "discarded", ":e": "available"},
+            ))
+            deltas[key] = deltas.get(key, 0) - 1
+            discarded.add(unit["id"])
+    actions.extend(unit_actions)
+    actions.extend(_tx_inventory_deltas(db, deltas))
+    actions.extend(_tx_stat_adds(db, _daily_donation_deltas((d, s) for d, s, _ in changes)))
+    if len(actions) > MAX_TRANSACT_ITEMS:
+        raise ValueError(f"{len(changes)} donations do not fit in one transaction")
+    _transact_write(db, actions)
+    for donation, status, unit in changes:
+        if unit and unit["id"] in discarded:
+            _emit_unit_change(db, unit, "discarded", "available")
+        elif unit:
+            _emit(db, "inventory_units", INSERT, new_image=unit)
+        _emit(db, "donations", MODIFY, new_image=dict(donation, status=status), old_image=donation)
+
+
 def get_donations_by_donor(db, donor_id, limit=None):
     try:
-        r = db.donations.query(
+        pager = _Pager(
+            "get_donations_by_donor",
+            db.donations.query,
             IndexName="donor_id-date-index",
             KeyConditionExpression="donor_id = :d",
             ExpressionAttributeValues={":d": donor_id},
             ScanIndexForward=False,
         )
-        items = r.get("Items", [])
-        while r.get("LastEvaluatedKey") and (limit is None or len(items) < limit):
-            r = db.donations.query(
-                IndexName="donor_id-date-index",
-                KeyConditionExpression="donor_id = :d",
-                ExpressionAttributeValues={":d": donor_id},
-                ScanIndexForward=False,
-                ExclusiveStartKey=r["LastEvaluatedKey"],
-            )
+        items = []
+        for r in pager:
             items.extend(r.get("Items", []))
+            if limit is not None and len(items) >= limit:
+                break
         items = [_serialize_item(i) for i in items]
-        return items[:limit] if limit else items
+        return pager.wrap(items[:limit] if limit else items)
+    except DatabaseUnavailable:
+        raise
     except Exception:
-        return []
+        return _failed_read()
 
 
 def get_recent_donations_for_bloodbank(db, limit=5):
-    r = db.donations.scan(ProjectionExpression="donor_name, blood_group, #dt, location", ExpressionAttributeNames={"#dt": "date"})
-    items = r.get("Items", [])
-    while r.get("LastEvaluatedKey"):
-        r = db.donations.scan(
-            ProjectionExpression="donor_name, blood_group, #dt, location",
-            ExpressionAttributeNames={"#dt": "date"},
-            ExclusiveStartKey=r["LastEvaluatedKey"],
-        )
-        items.extend(r.get("Items", []))
-    items = [_serialize_item(i) for i in items]
+    pager = _Pager(
+        "get_recent_donations_for_bloodbank",
+        db.donations.scan,
+        ProjectionExpression="donor_name, blood_group, #dt, location",
+        ExpressionAttributeNames={"#dt": "date"},
+    )
+    items = [_serialize_item(i) for r in pager for i in r.get("Items", [])]
     items.sort(key=lambda x: (x.get("date") or ""), reverse=True)
-    return items[:limit]
+    return _resorted(pager, items[:limit])
 
 
 def get_all_donations_sorted(db, sort_timestamp=-1, limit=None):
-    r = db.donations.scan()
-    items = r.get("Items", [])
-    while r.get("LastEvaluatedKey"):
-        r = db.donations.scan(ExclusiveStartKey=r["LastEvaluatedKey"])
-        items.extend(r.get("Items", []))
-    items = [_serialize_item(i) for i in items]
+    """All donations, newest date first. When partial, only the pages read so far are sorted (no cursor)."""
+    pager = _Pager("get_all_donations_sorted", db.donations.scan)
+    items = [_serialize_item(i) for r in pager for i in r.get("Items", [])]
     items.sort(key=lambda x: (x.get("date") or ""), reverse=True)
-    return items[:limit] if limit else items
+    return _resorted(pager, items[:limit] if limit else items)
+
+
+def iter_donations_newest_first(db, statuses=DONATION_STATUSES):
+    """Stream every donation, newest date first, a page at a time (exports).
+
+    One status-date-index Query per status, merged; memory stays at one page per status.
+    """
+
+    def by_status(status):
+        pager = _Pager(
+            "iter_donations_newest_first",
+            db.donations.query,
+            IndexName="status-date-index",
+            KeyConditionExpression="#st = :s",
+            ExpressionAttributeNames={"#st": "status"},
+            ExpressionAttributeValues={":s": status},
+            ScanIndexForward=False,
+        )
+        for r in pager:
+            for i in r.get("Items", []):
+                yield _serialize_item(i)
+
+    return heapq.merge(*(by_status(s) for s in statuses), key=lambda x: str(x.get("date") or ""), reverse=True)
 
 
 def count_donors_distinct(db):
-    r = db.donations.scan(ProjectionExpression="donor_id")
-    items = r.get("Items", [])
-    while r.get("LastEvaluatedKey"):
-        r = db.donations.scan(ProjectionExpression="donor_id", ExclusiveStartKey=r["LastEvaluatedKey"])
-        items.extend(r.get("Items", []))
-    return len(set(i.get("donor_id") for i in items if i.get("donor_id")))
+    pager = _Pager("count_donors_distinct", db.donations.scan, ProjectionExpression="donor_id")
+    return len(set(i.get("donor_id") for r in pager for i in r.get("Items", []) if i.get("donor_id")))
 
 
 def count_donations_by_date(db, date_str):
-    r = db.donations.scan(
+    pager = _Pager(
+        "count_donations_by_date",
+        db.donations.scan,
         FilterExpression="#dt = :d",
         ExpressionAttributeNames={"#dt": "date"},
         ExpressionAttributeValues={":d": str(date_str)},
     )
-    count = len(r.get("Items", []))
-    while r.get("LastEvaluatedKey"):
-        r = db.donations.scan(
-            FilterExpression="#dt = :d",
-            ExpressionAttributeNames={"#dt": "date"},
-            ExpressionAttributeValues={":d": str(date_str)},
-            ExclusiveStartKey=r["LastEvaluatedKey"],
-        )
-        count += len(r.get("Items", []))
-    return count
+    return sum(len(r.get("Items", [])) for r in pager)
 
 
 def count_donations_by_blood_group_and_status(db, blood_groups=None, statuses=None):
@@ -225,19 +697,12 @@ def count_donations_by_blood_group_and_status(db, blood_groups=None, statuses=No
         Attr("status").is_in(statuses)
     )
 
-    r = db.donations.scan(FilterExpression=filter_expr)
-
-    for item in r.get("Items", []):
-        bg = item.get("blood_group")
-        if bg in result:
-            result[bg] += 1
-
-    # Handle pagination
-    while "LastEvaluatedKey" in r:
-        r = db.donations.scan(
-            FilterExpression=filter_expr,
-            ExclusiveStartKey=r["LastEvaluatedKey"],
-        )
+    pager = _Pager(
+        "count_donations_by_blood_group_and_status",
+        db.donations.scan,
+        FilterExpression=filter_expr,
+    )
+    for r in pager:
         for item in r.get("Items", []):
             bg = item.get("blood_group")
             if bg in result:
@@ -247,13 +712,46 @@ def count_donations_by_blood_group_and_status(db, blood_groups=None, statuses=No
 
 
 # ---------- Blood requests ----------
-def create_blood_request(db, requester_id, patient_name, blood_group, units, hospital, status="pending"):
+def urgency_rank(urgency):
+    """Position of urgency in REQUEST_URGENCIES (0 = most urgent); unknown values rank as the default."""
+    if urgency not in REQUEST_URGENCIES:
+        urgency = DEFAULT_REQUEST_URGENCY
+    return REQUEST_URGENCIES.index(urgency)
+
+
+def request_priority(urgency, timestamp):
+    """Sort key of the status-priority-index: urgency rank, then timestamp (ascending = serve first)."""
+    return f"{urgency_rank(urgency)}#{timestamp}"
+
+
+def site_status(site_id, status):
+    """Partition key of the site_status-priority-index: one site's requests in one status."""
+    return f"{site_id}#{status}"
+
+
+def create_blood_request(
+    db,
+    requester_id,
+    patient_name,
+    blood_group,
+    units,
+    hospital,
+    status="pending",
+    lat=None,
+    lon=None,
+    urgency=None,
+    site_id=None,
+    notify=True,
+):
+    """Store a new blood request. Pending requests get a donor notification outbox
+    entry in the same transaction (notify=False skips it, e.g. for imports)."""
     try:
         units = int(units) if units is not None else 0
     except (TypeError, ValueError):
         units = 0
     request_id = str(uuid.uuid4())
     ts = datetime.utcnow().isoformat() + "Z"
+    urgency = urgency if urgency in REQUEST_URGENCIES else DEFAULT_REQUEST_URGENCY
     item = {
         "id": request_id,
         "requester_id": requester_id,
@@ -263,103 +761,206 @@ def create_blood_request(db, requester_id, patient_name, blood_group, units, hos
         "hospital": hospital,
         "status": status,
         "timestamp": ts,
+        "urgency": urgency,
+        "priority": request_priority(urgency, ts),
+        "site_id": site_id or DEFAULT_SITE_ID,
+        "site_status": site_status(site_id or DEFAULT_SITE_ID, status),
     }
-    db.blood_requests.put_item(Item=item)
+    # Hospital coordinates, when given, make the request findable by proximity.
+    item.update(geo_attributes(lat, lon))
+    if notify and status == "pending":
+        _transact_write(db, [_tx_put(db, "blood_requests", item), _tx_put(db, "notification_outbox", _outbox_entry(item))])
+    else:
+        db.blood_requests.put_item(Item=item)
+    _emit(db, "blood_requests", INSERT, new_image=item)
     return request_id
 
 
 def get_blood_requests_by_requester(db, requester_id, sort_timestamp=-1):
     try:
-        r = db.blood_requests.query(
+        pager = _Pager(
+            "get_blood_requests_by_requester",
+            db.blood_requests.query,
             IndexName="requester_id-timestamp-index",
             KeyConditionExpression="requester_id = :r",
             ExpressionAttributeValues={":r": requester_id},
             ScanIndexForward=(sort_timestamp == 1),
         )
-        items = r.get("Items", [])
-        while r.get("LastEvaluatedKey"):
-            r = db.blood_requests.query(
-                IndexName="requester_id-timestamp-index",
-                KeyConditionExpression="requester_id = :r",
-                ExpressionAttributeValues={":r": requester_id},
-                ScanIndexForward=(sort_timestamp == 1),
-                ExclusiveStartKey=r["LastEvaluatedKey"],
-            )
-            items.extend(r.get("Items", []))
-        return [_serialize_item(i) for i in items]
+        return pager.wrap(_serialize_item(i) for r in pager for i in r.get("Items", []))
+    except DatabaseUnavailable:
+        raise
     except Exception:
-        return []
+        return _failed_read()
+
+
+def _read_bounded(pager, limit):
+    """Items of a priority-ordered pager; with limit, each Query asks only for what is still missing."""
+    items = []
+    next_cursor = None
+    for r in pager:
+        items.extend(r.get("Items", []))
+        if limit:
+            if len(items) >= limit:
+                next_cursor = encode_cursor(r["LastEvaluatedKey"]) if r.get("LastEvaluatedKey") else None
+                break
+            pager.kwargs["Limit"] = limit - len(items)
+    out = pager.wrap([_serialize_item(i) for i in items])
+    if next_cursor:
+        out.cursor = next_cursor
+    return out
+
 
+def get_pending_blood_requests(db, limit=None, cursor=None):
+    """Pending requests across the network, most urgent first and oldest first within an urgency.
 
-def get_pending_blood_requests(db, limit=None):
+    With limit, the Query itself is bounded to that many items and the result's
+    cursor continues after them.
+    """
     try:
-        r = db.blood_requests.query(
-            IndexName="status-timestamp-index",
+        kwargs = {"Limit": limit} if limit else {}
+        pager = _Pager(
+            "get_pending_blood_requests",
+            db.blood_requests.query,
+            cursor=cursor,
+            IndexName="status-priority-index",
             KeyConditionExpression="#st = :pending",
             ExpressionAttributeNames={"#st": "status"},
             ExpressionAttributeValues={":pending": "pending"},
-            ScanIndexForward=False,
+            ScanIndexForward=True,
+            **kwargs,
         )
-        items = r.get("Items", [])
-        while r.get("LastEvaluatedKey") and (limit is None or len(items) < limit):
-            r = db.blood_requests.query(
-                IndexName="status-timestamp-index",
-                KeyConditionExpression="#st = :pending",
-                ExpressionAttributeNames={"#st": "status"},
-                ExpressionAttributeValues={":pending": "pending"},
-                ScanIndexForward=False,
-                ExclusiveStartKey=r["LastEvaluatedKey"],
-            )
-            items.extend(r.get("Items", []))
-        items = [_serialize_item(i) for i in items]
-        return items[:limit] if limit else items
+        return _read_bounded(pager, limit)
+    except (DatabaseUnavailable, InvalidCursor):
+        raise
     except Exception:
-        return []
+        return _failed_read()
+
+
+def get_site_pending_blood_requests(db, site_id, limit=None, cursor=None):
+    """Pending requests lodged with one site, in the same order as get_pending_blood_requests."""
+    try:
+        kwargs = {"Limit": limit} if limit else {}
+        pager = _Pager(
+            "get_site_pending_blood_requests",
+            db.blood_requests.query,
+            cursor=cursor,
+            IndexName="site_status-priority-index",
+            KeyConditionExpression="site_status = :ss",
+            ExpressionAttributeValues={":ss": site_status(site_id, "pending")},
+            ScanIndexForward=True,
+            **kwargs,
+        )
+        return _read_bounded(pager, limit)
+    except (DatabaseUnavailable, InvalidCursor):
+        raise
+    except Exception:
+        return _failed_read()
+
+
+def set_request_priority(db, request_id, urgency, timestamp):
+    """Backfill urgency and priority on a request created before urgency existed (no-op if set)."""
+    try:
+        db.blood_requests.update_item(
+            Key={"id": request_id},
+            UpdateExpression="SET urgency = :u, priority = :p",
+            ConditionExpression="attribute_exists(id) AND attribute_not_exists(priority)",
+            ExpressionAttributeValues={":u": urgency, ":p": request_priority(urgency, timestamp)},
+        )
+        return True
+    except ClientError as e:
+        if _is_conditional_failure(e):
+            return False
+        raise
+
+
+def set_request_site(db, request_id, site_id, status):
+    """Backfill site_id and site_status on a request created before sites existed (no-op if set)."""
+    try:
+        db.blood_requests.update_item(
+            Key={"id": request_id},
+            UpdateExpression="SET site_id = :site, site_status = :ss",
+            ConditionExpression="#st = :s AND attribute_not_exists(site_status)",
+            ExpressionAttributeNames={"#st": "status"},
+            ExpressionAttributeValues={":site": site_id, ":ss": site_status(site_id, status), ":s": status},
+        )
+        return True
+    except ClientError as e:
+        if _is_conditional_failure(e):
+            return False
+        raise
+
+
+def get_blood_request_by_id(db, request_id):
+    r = db.blood_requests.get_item(Key={"id": request_id})
+    return _serialize_item(r.get("Item"))
+
+
+def query_requests_near(db, prefixes, status="pending"):
+    """Requests in status whose hospital lies in one of the geohash prefixes (see geo.covering_prefixes)."""
+    return _query_cells(
+        "query_requests_near",
+        db.blood_requests.query,
+        prefixes,
+        "geo_cell",
+        values={":s": status},
+        IndexName="geo_cell-geohash-index",
+        FilterExpression="#st = :s",
+        ExpressionAttributeNames={"#st": "status"},
+    )
 
 
 def get_all_blood_requests_sorted(db, sort_timestamp=-1, limit=None):
-    r = db.blood_requests.scan()
-    items = r.get("Items", [])
-    while r.get("LastEvaluatedKey"):
-        r = db.blood_requests.scan(ExclusiveStartKey=r["LastEvaluatedKey"])
-        items.extend(r.get("Items", []))
-    items = [_serialize_item(i) for i in items]
+    """All blood requests by timestamp. When partial, only the pages read so far are sorted (no cursor)."""
+    pager = _Pager("get_all_blood_requests_sorted", db.blood_requests.scan)
+    items = [_serialize_item(i) for r in pager for i in r.get("Items", [])]
     items.sort(key=lambda x: x.get("timestamp") or "", reverse=(sort_timestamp == -1))
-    return items[:limit] if limit else items
+    return _resorted(pager, items[:limit] if limit else items)
+
+
+def iter_blood_requests_newest_first(db, statuses=REQUEST_STATUSES):
+    """Stream every blood request, newest first, a page at a time (exports).
+
+    One status-timestamp-index Query per status, merged; memory stays at one page per status.
+    """
+
+    def by_status(status):
+        pager = _Pager(
+            "iter_blood_requests_newest_first",
+            db.blood_requests.query,
+            IndexName="status-timestamp-index",
+            KeyConditionExpression="#st = :s",
+            ExpressionAttributeNames={"#st": "status"},
+            ExpressionAttributeValues={":s": status},
+            ScanIndexForward=False,
+        )
+        for r in pager:
+            for i in r.get("Items", []):
+                yield _serialize_item(i)
+
+    return heapq.merge(*(by_status(s) for s in statuses), key=lambda x: x.get("timestamp") or "", reverse=True)
 
 
 def count_blood_requests_by_status(db, status):
     try:
-        r = db.blood_requests.query(
+        pager = _Pager(
+            "count_blood_requests_by_status",
+            db.blood_requests.query,
             IndexName="status-timestamp-index",
             KeyConditionExpression="#st = :s",
             ExpressionAttributeNames={"#st": "status"},
             ExpressionAttributeValues={":s": status},
             Select="COUNT",
         )
-        count = r.get("Count", 0)
-        while r.get("LastEvaluatedKey"):
-            r = db.blood_requests.query(
-                IndexName="status-timestamp-index",
-                KeyConditionExpression="#st = :s",
-                ExpressionAttributeNames={"#st": "status"},
-                ExpressionAttributeValues={":s": status},
-                Select="COUNT",
-                ExclusiveStartKey=r["LastEvaluatedKey"],
-            )
-            count += r.get("Count", 0)
-        return count
+        return sum(r.get("Count", 0) for r in pager)
+    except DatabaseUnavailable:
+        raise
     except Exception:
         return 0
 
 
 def count_recipients_distinct(db):
-    r = db.blood_requests.scan(ProjectionExpression="requester_id")
-    items = r.get("Items", [])
-    while r.get("LastEvaluatedKey"):
-        r = db.blood_requests.scan(ProjectionExpression="requester_id", ExclusiveStartKey=r["LastEvaluatedKey"])
-        items.extend(r.get("Items", []))
-    return len(set(i.get("requester_id") for i in items if i.get("requester_id")))
+    pager = _Pager("count_recipients_distinct", db.blood_requests.scan, ProjectionExpression="requester_id")
+    return len(set(i.get("requester_id") for r in pager for i in r.get("Items", []) if i.get("requester_id")))
 
 
 # ---------- Contact messages ----------
@@ -375,28 +976,21 @@ def create_contact_message(db, name, email, subject, message):
         "timestamp": ts,
     }
     db.messages.put_item(Item=item)
+    _publish(db, "messages", INSERT, new_image=item)
     return msg_id
 
 
 # ---------- Admin ----------
 def count_users_by_role(db, role):
-    r = db.users.scan(
+    pager = _Pager(
+        "count_users_by_role",
+        db.users.scan,
         FilterExpression="#r = :role",
         ExpressionAttributeNames={"#r": "role"},
         ExpressionAttributeValues={":role": role},
         Select="COUNT",
     )
-    count = r.get("Count", 0)
-    while r.get("LastEvaluatedKey"):
-        r = db.users.scan(
-            FilterExpression="#r = :role",
-            ExpressionAttributeNames={"#r": "role"},
-            ExpressionAttributeValues={":role": role},
-            Select="COUNT",
-            ExclusiveStartKey=r["LastEvaluatedKey"],
-        )
-        count += r.get("Count", 0)
-    return count
+    return sum(r.get("Count", 0) for r in pager)
 
 
 # ---------- Admin users (separate table) ----------
@@ -414,6 +1008,8 @@ def find_admin_by_email(db, email):
         )
         items = list(r.get("Items", []))
         return _serialize_item(items[0]) if items else None
+    except DatabaseUnavailable:
+        raise
     except Exception:
         return None
 
@@ -423,6 +1019,8 @@ def find_admin_by_id(db, admin_id):
     try:
         r = db.admins.get_item(Key={"id": str(admin_id)})
         return _serialize_item(r.get("Item")) if r.get("Item") else None
+    except DatabaseUnavailable:
+        raise
     except Exception:
         return None
 
@@ -437,4 +1035,651 @@ def create_admin(db, name, email, password_hash):
         "password": password_hash,
     }
     db.admins.put_item(Item=item)
+    _publish(db, "admins", INSERT, new_image=item)
     return admin_id
+
+
+# ---------- Derived views (stats table) ----------
+def increment_stat(db, item_id, attribute, delta):
+    """Atomically add delta to a counter attribute of a stats item; returns the new value."""
+    r = db.stats.update_item(
+        Key={"id": item_id},
+        UpdateExpression="ADD #a :d",
+        ExpressionAttributeNames={"#a": attribute},
+        ExpressionAttributeValues={":d": delta},
+        ReturnValues="UPDATED_NEW",
+    )
+    return (_serialize_item(r.get("Attributes")) or {}).get(attribute, 0)
+
+
+def get_stat_items(db, item_ids):
+    """Return {item_id: item} for the stats items that exist (one BatchGetItem per 100 ids)."""
+    item_ids = list(dict.fromkeys(item_ids))
+    out = {}
+    for start in range(0, len(item_ids), MAX_BATCH_GET_KEYS):
+        chunk = item_ids[start:start + MAX_BATCH_GET_KEYS]
+        out.update((i["id"], i) for i in _batch_get(db, "stats", [{"id": i} for i in chunk]))
+    return out
+
+
+def get_stat_item(db, item_id):
+    """Return a stats item as a plain dict ({} if it does not exist yet)."""
+    r = db.stats.get_item(Key={"id": item_id})
+    return _serialize_item(r.get("Item")) or {}
+
+
+def put_stat_item(db, item, expected_version):
+    """Replace a stats item if its version is still expected_version (None = must not exist).
+
+    Bumps the stored version. Returns False when another writer got there first.
+    """
+    item = dict(item, version=(expected_version or 0) + 1)
+    if expected_version is None:
+        condition = {"ConditionExpression": "attribute_not_exists(id)"}
+    else:
+        condition = {
+            "ConditionExpression": "version = :v",
+            "ExpressionAttributeValues": {":v": expected_version},
+        }
+    try:
+        db.stats.put_item(Item=item, **condition)
+        return True
+    except ClientError as e:
+        if _is_conditional_failure(e):
+            return False
+        raise
+
+
+def clear_stats(db, keep=()):
+    """Delete every stats item except the ids in keep (used before a full rebuild of derived views)."""
+    pager = _Pager("clear_stats", db.stats.scan, ProjectionExpression="id")
+    count = 0
+    for r in pager:
+        for i in r.get("Items", []):
+            if i["id"] in keep:
+                continue
+            db.stats.delete_item(Key={"id": i["id"]})
+            count += 1
+    return count
+
+
+def bump_stat_version(db, item_id, attribute, epoch):
+    """Add one to a version counter of a stats item; epoch is stored the first time (when it is created)."""
+    db.stats.update_item(
+        Key={"id": item_id},
+        UpdateExpression="SET epoch = if_not_exists(epoch, :e) ADD #a :one",
+        ExpressionAttributeNames={"#a": attribute},
+        ExpressionAttributeValues={":e": epoch, ":one": 1},
+    )
+
+
+def claim_flight(db, item_id, holder, now_ms, lease_ms):
+    """Lease a singleflight item to holder unless another lease or a fresh result is current.
+
+    Returns False when another worker holds it (or its result is still fresh).
+    """
+    try:
+        db.stats.update_item(
+            Key={"id": item_id},
+            UpdateExpression="SET #h = :h, lease_until = :l",
+            ConditionExpression=(
+                "attribute_not_exists(id) OR "
+                "(lease_until < :now AND (attribute_not_exists(fresh_until) OR fresh_until < :now))"
+            ),
+            ExpressionAttributeNames={"#h": "holder"},
+            ExpressionAttributeValues={":h": holder, ":l": now_ms + lease_ms, ":now": now_ms},
+        )
+        return True
+    except ClientError as e:
+        if _is_conditional_failure(e):
+            return False
+        raise
+
+
+def finish_flight(db, item_id, holder, result, fresh_until_ms, now_ms):
+    """Release holder's lease, storing result (JSON text, or None) until fresh_until_ms.
+
+    Returns False when the lease was taken over meanwhile.
+    """
+    values = {":h": holder, ":now": now_ms, ":f": fresh_until_ms}
+    if result is None:
+        expression = "SET lease_until = :now, fresh_until = :f REMOVE #r"
+    else:
+        expression = "SET lease_until = :now, fresh_until = :f, #r = :r"
+        values[":r"] = result
+    try:
+        db.stats.update_item(
+            Key={"id": item_id},
+            UpdateExpression=expression,
+            ConditionExpression="#h = :h",
+            ExpressionAttributeNames={"#h": "holder", "#r": "result"},
+            ExpressionAttributeValues=values,
+        )
+        return True
+    except ClientError as e:
+        if _is_conditional_failure(e):
+            return False
+        raise
+
+
+def set_stat_attribute_if(db, item_id, attribute, value, observed):
+    """Set a stats attribute to value only if it still holds observed (None = absent).
+
+    Returns False when the attribute changed since it was observed.
+    """
+    names = {"#a": attribute}
+    values = {":v": value}
+    if observed is None:
+        condition = "attribute_not_exists(#a)"
+    else:
+        condition = "#a = :o"
+        values[":o"] = observed
+    try:
+        db.stats.update_item(
+            Key={"id": item_id},
+            UpdateExpression="SET #a = :v",
+            ConditionExpression=condition,
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values,
+        )
+        return True
+    except ClientError as e:
+        if _is_conditional_failure(e):
+            return False
+        raise
+
+
+# ---------- Eligible-donor index ----------
+def record_donor_donation(db, donor_id, donor_name, blood_group, last_donation, next_eligible, geo=None):
+    """Move a donor's index entry to a newer donation.
+
+    Conditional on last_donation being newer than the stored one, so out-of-order
+    events cannot move a donor back. geo (lat/lon/geohash/geo_cell of the donation
+    site) becomes the donor's last known location. Returns False when nothing changed.
+    """
+    values = {
+        ":n": donor_name or "",
+        ":g": blood_group,
+        ":l": last_donation,
+        ":e": next_eligible,
+    }
+    sets = ["donor_name = :n", "blood_group = :g", "last_donation = :l", "next_eligible = :e"]
+    for attribute, value in (geo or {}).items():
+        sets.append(f"{attribute} = :{attribute}")
+        values[f":{attribute}"] = value
+    try:
+        db.donor_eligibility.update_item(
+            Key={"donor_id": donor_id},
+            UpdateExpression="SET " + ", ".join(sets),
+            ConditionExpression="attribute_not_exists(last_donation) OR last_donation < :l",
+            ExpressionAttributeValues=values,
+        )
+        return True
+    except ClientError as e:
+        if _is_conditional_failure(e):
+            return False
+        raise
+
+
+def record_donor_attendance(db, donor_id, donation_id, booked, completed):
+    """Add one donation to a donor's booked / completed counts (show-up rate for ranking).
+
+    Conditional on donation_id not being in the donor's counted_donations set, so a
+    replayed event does not count twice. Returns False when it was already counted.
+    """
+    try:
+        db.donor_eligibility.update_item(
+            Key={"donor_id": donor_id},
+            UpdateExpression="ADD booked :b, completed :c, counted_donations :ids",
+            ConditionExpression="NOT contains(counted_donations, :id)",
+            ExpressionAttributeValues={":b": booked, ":c": completed, ":ids": {donation_id}, ":id": donation_id},
+        )
+        return True
+    except ClientError as e:
+        if _is_conditional_failure(e):
+            return False
+        raise
+
+
+def put_donor_eligibility(db, item):
+    """Replace a donor's index entry (used when recomputing from donation history)."""
+    db.donor_eligibility.put_item(Item=item)
+
+
+def delete_donor_eligibility(db, donor_id):
+    db.donor_eligibility.delete_item(Key={"donor_id": donor_id})
+
+
+def get_donor_eligibility(db, donor_id):
+    r = db.donor_eligibility.get_item(Key={"donor_id": donor_id})
+    return _serialize_item(r.get("Item"))
+
+
+def query_eligible_donors(db, blood_group, as_of, limit=10):
+    """Up to `limit` donors of blood_group eligible on as_of (YYYY-MM-DD), longest-eligible first.
+
+    A bounded Query on the blood_group-next_eligible-index, paged until limit
+    items (or the request deadline).
+    """
+    pager = _Pager(
+        "query_eligible_donors",
+        db.donor_eligibility.query,
+        IndexName="blood_group-next_eligible-index",
+        KeyConditionExpression="blood_group = :g AND next_eligible <= :d",
+        ExpressionAttributeValues={":g": blood_group, ":d": as_of},
+        ScanIndexForward=True,
+        Limit=limit,
+    )
+    items = []
+    for r in pager:
+        items.extend(_serialize_item(i) for i in r.get("Items", []))
+        if len(items) >= limit:
+            break
+    return pager.wrap(items[:limit])
+
+
+def query_donors_near(db, prefixes, as_of):
+    """Donors eligible on as_of whose last known location is in one of the geohash prefixes."""
+    return _query_cells(
+        "query_donors_near",
+        db.donor_eligibility.query,
+        prefixes,
+        "geo_cell",
+        values={":d": as_of},
+        IndexName="geo_cell-geohash-index",
+        FilterExpression="next_eligible <= :d",
+    )
+
+
+# ---------- Donation slots ----------
+def slot_key(location, date, time_slot):
+    """Key of a donation slot: the location's month, then date and time slot.
+
+    Locations are compared case- and whitespace-insensitively.
+    """
+    location = " ".join((location or "").split()).lower()
+    date = str(date)[:10]
+    return {"slot_month": f"{location}#{date[:7]}", "slot": f"{date}#{time_slot or ''}"}
+
+
+def query_slot_month(db, location, month, limit):
+    """Booked slots of a location in month (YYYY-MM), date order: one Query of at most limit items.
+
+    The result's partial flag is set when the month holds more than limit slots.
+    """
+    r = db.donation_slots.query(
+        KeyConditionExpression="slot_month = :m",
+        ExpressionAttributeValues={":m": slot_key(location, f"{month}-01", None)["slot_month"]},
+        Limit=limit,
+    )
+    items = PagedList(_serialize_item(i) for i in r.get("Items", []))
+    items.partial = bool(r.get("LastEvaluatedKey"))
+    return items
+
+
+def adjust_slot_booking(db, location, date, time_slot, delta):
+    """Move a booked slot's counter by delta (no capacity check). Returns False if the slot was never booked."""
+    try:
+        db.donation_slots.update_item(
+            Key=slot_key(location, date, time_slot),
+            UpdateExpression="ADD booked :d",
+            ConditionExpression="attribute_exists(booked)",
+            ExpressionAttributeValues={":d": delta},
+        )
+        return True
+    except ClientError as e:
+        if _is_conditional_failure(e):
+            return False
+        raise
+
+
+def set_slot_capacity(db, location, date, time_slot, capacity):
+    """Override the capacity of one slot (existing bookings are kept, even above it)."""
+    db.donation_slots.update_item(
+        Key=slot_key(location, date, time_slot),
+        UpdateExpression="SET #cap = :c, booked = if_not_exists(booked, :zero), #loc = :loc, #d = :d, time_slot = :t",
+        ExpressionAttributeNames={"#cap": "capacity", "#loc": "location", "#d": "date"},
+        ExpressionAttributeValues={":c": capacity, ":zero": 0, ":loc": location, ":d": str(date)[:10], ":t": time_slot or ""},
+    )
+
+
+def set_slot_booked(db, location, date, time_slot, booked):
+    """Overwrite a slot's booking counter (rebuilds only)."""
+    db.donation_slots.update_item(
+        Key=slot_key(location, date, time_slot),
+        UpdateExpression="SET booked = :b, #loc = :loc, #d = :d, time_slot = :t",
+        ExpressionAttributeNames={"#loc": "location", "#d": "date"},
+        ExpressionAttributeValues={":b": booked, ":loc": location, ":d": str(date)[:10], ":t": time_slot or ""},
+    )
+
+
+# ---------- Notification outbox ----------
+OUTBOX_PENDING = "pending"
+
+
+def _outbox_entry(blood_request):
+    """Outbox entry for a new request: what the notification says and where to look for donors."""
+    entry = {
+        k: blood_request[k]
+        for k in ("requester_id", "blood_group", "units", "hospital", "urgency", "site_id", "lat", "lon")
+        if blood_request.get(k) is not None
+    }
+    entry.update({
+        "id": blood_request["id"],
+        "outbox_state": OUTBOX_PENDING,
+        "status": OUTBOX_PENDING,
+        "due_at": blood_request["timestamp"],
+        "created_at": blood_request["timestamp"],
+        "attempts": 0,
+        "delivered": 0,
+    })
+    return entry
+
+
+def query_due_notifications(db, now, limit):
+    """Up to limit pending outbox entries due at or before now (ISO time), oldest first."""
+    r = db.notification_outbox.query(
+        IndexName="outbox_state-due_at-index",
+        KeyConditionExpression="outbox_state = :p AND due_at <= :now",
+        ExpressionAttributeValues={":p": OUTBOX_PENDING, ":now": now},
+        Limit=limit,
+    )
+    return [_serialize_item(i) for i in r.get("Items", [])]
+
+
+def get_notification(db, entry_id):
+    r = db.notification_outbox.get_item(Key={"id": entry_id})
+    return _serialize_item(r.get("Item"))
+
+
+def claim_notification(db, entry_id, attempts, now, lease_until):
+    """Take a due entry for delivery: bump attempts and push due_at to lease_until.
+
+    Conditional on the entry still being pending, due and at `attempts`, so only
+    one worker wins it. Returns the claimed entry, or None.
+    """
+    try:
+        r = db.notification_outbox.update_item(
+            Key={"id": entry_id},
+            UpdateExpression="SET due_at = :lease, attempts = attempts + :one",
+            ConditionExpression="outbox_state = :p AND due_at <= :now AND attempts = :a",
+            ExpressionAttributeValues={":lease": lease_until, ":one": 1, ":p": OUTBOX_PENDING, ":now": now, ":a": attempts},
+            ReturnValues="ALL_NEW",
+        )
+    except ClientError as e:
+        if _is_conditional_failure(e):
+            return None
+        raise
+    return _serialize_item(r.get("Attributes"))
+
+
+def _update_claimed(db, entry_id, attempts, update, names=None, values=None):
+    """Update an entry only while it is still held by the claim that made `attempts`."""
+    kwargs = {"ExpressionAttributeNames": names} if names else {}
+    try:
+        db.notification_outbox.update_item(
+            Key={"id": entry_id},
+            UpdateExpression=update,
+            ConditionExpression="attempts = :a AND outbox_state = :p",
+            ExpressionAttributeValues=dict(values or {}, **{":a": attempts, ":p": OUTBOX_PENDING}),
+            **kwargs,
+        )
+        return True
+    except ClientError as e:
+        if _is_conditional_failure(e):
+            return False
+        raise
+
+
+def record_notification_progress(db, entry_id, attempts, lease_until, delivered, recipient_ids=None):
+    """Record how many recipients have been sent to (and, first time, who they are); extends the lease.
+    Returns False if the claim was lost."""
+    update = "SET delivered = :d, due_at = :lease"
+    values = {":d": delivered, ":lease": lease_until}
+    if recipient_ids is not None:
+        update += ", recipient_ids = :r"
+        values[":r"] = recipient_ids
+    return _update_claimed(db, entry_id, attempts, update, values=values)
+
+
+def retry_notification(db, entry_id, attempts, due_at, error):
+    """Release a claimed entry to be retried at due_at."""
+    return _update_claimed(
+        db, entry_id, attempts, "SET due_at = :due, last_error = :e", values={":due": due_at, ":e": error[:500]}
+    )
+
+
+def finish_notification(db, entry_id, attempts, status, finished_at, error=None):
+    """Take a claimed entry out of the pending index with its final status ("sent" or "failed")."""
+    update = "REMOVE outbox_state SET #st = :s, finished_at = :f"
+    values = {":s": status, ":f": finished_at}
+    if error:
+        update += ", last_error = :e"
+        values[":e"] = error[:500]
+    return _update_claimed(db, entry_id, attempts, update, names={"#st": "status"}, values=values)
+
+
+# ---------- Inventory unit ledger ----------
+def put_inventory_unit(db, unit):
+    """Add a unit to the ledger unless one with its id exists. Returns False for duplicates.
+
+    Available units are counted in the sharded inventory counter in the same transaction.
+    """
+    condition = "attribute_not_exists(id)"
+    try:
+        if unit.get("status") == "available":
+            _transact_write(db, [_tx_put(db, "inventory_units", unit, condition)] + _tx_inventory_deltas(
+                db, {(site_of(unit), inventory_shard(unit["id"]), unit["blood_group"]): 1}
+            ))
+        else:
+            db.inventory_units.put_item(Item=unit, ConditionExpression=condition)
+    except TransactionCancelled:
+        return False
+    except ClientError as e:
+        if _is_conditional_failure(e):
+            return False
+        raise
+    _emit(db, "inventory_units", INSERT, new_image=unit)
+    return True
+
+
+def _unit_update(status, with_request=False, located=False):
+    """UpdateExpression moving a unit to status; with_request links it to :r, or unlinks it when it becomes available."""
+    if status == "available":
+        sets = ["#st = :s", "available_group = :g"] + (["available_cell = :c"] if located else [])
+        return "SET " + ", ".join(sets) + (" REMOVE request_id" if with_request else "")
+    sets = ["#st = :s"] + (["request_id = :r"] if with_request else [])
+    return "SET " + ", ".join(sets) + " REMOVE available_group, available_cell"
+
+
+def _available_values(values, unit):
+    """Add the sparse index keys (:g, and :c for located units) for a unit becoming available."""
+    values[":g"] = unit["blood_group"]
+    if unit.get("geo_cell"):
+        values[":c"] = unit["geo_cell"]
+    return values
+
+
+def set_unit_status(db, unit, status, expected_status):
+    """Move a unit (dict with id, blood_group, site_id, and geo_cell if located) from expected_status to status.
+
+    Leaving "available" drops it from the usable indexes and the site and network counters,
+    atomically. Returns False when the unit is missing or no longer in expected_status.
+    """
+    delta = (status == "available") - (expected_status == "available")
+    values = {":s": status, ":e": expected_status}
+    if status == "available":
+        _available_values(values, unit)
+    action = _tx_update(
+        db,
+        "inventory_units",
+        {"id": unit["id"]},
+        _unit_update(status, located=bool(unit.get("geo_cell"))),
+        condition="#st = :e",
+        names={"#st": "status"},
+        values=values,
+    )
+    try:
+        _transact_write(db, [action] + _tx_inventory_deltas(
+            db, {(site_of(unit), inventory_shard(unit["id"]), unit["blood_group"]): delta}
+        ))
+    except TransactionCancelled:
+        return False
+    _emit_unit_change(db, unit, status, expected_status)
+    return True
+
+
+def _emit_unit_change(db, unit, status, expected_status, bump=True):
+    old = {k: v for k, v in unit.items() if k not in ("available_group", "available_cell")}
+    new = dict(old, status=status)
+    old["status"] = expected_status
+    available = {"available_group": unit["blood_group"]}
+    if unit.get("geo_cell"):
+        available["available_cell"] = unit["geo_cell"]
+    if expected_status == "available":
+        old.update(available)
+    if status == "available":
+        new.update(available)
+        new.pop("request_id", None)
+    _emit(db, "inventory_units", MODIFY, new_image=new, old_image=old, bump=bump)
+
+
+def transition_request_units(db, blood_request, request_status, units, unit_status, expected_unit_status, reserved_units=None):
+    """Atomically move a blood request and its units to new statuses (one TransactWriteItems).
+
+    The request must still have blood_request["status"]; every unit must still be in
+    expected_unit_status. The sharded inventory counter moves in the same transaction.
+    reserved_units (list of unit ids) is stored on the request, or removed when None.
+    Units leave stock linked to the request (request_id); units returned to
+    "available" have the link removed.
+    Raises TransactionCancelled; reasons[0] is the request, reasons[1..len(units)] the units.
+    """
+    values = {
+        ":s": request_status,
+        ":e": blood_request["status"],
+        ":ss": site_status(site_of(blood_request), request_status),
+    }
+    if reserved_units is None:
+        request_update = "SET #st = :s, site_status = :ss REMOVE reserved_units"
+    else:
+        request_update = "SET #st = :s, site_status = :ss, reserved_units = :u"
+        values[":u"] = reserved_units
+    actions = [_tx_update(
+        db,
+        "blood_requests",
+        {"id": blood_request["id"]},
+        request_update,
+        condition="#st = :e",
+        names={"#st": "status"},
+        values=values,
+    )]
+    deltas = {}
+    delta = (unit_status == "available") - (expected_unit_status == "available")
+    for unit in units:
+        unit_values = {":s": unit_status, ":e": expected_unit_status}
+        if unit_status == "available":
+            # Back in stock: the unit no longer belongs to the request.
+            _available_values(unit_values, unit)
+        else:
+            unit_values[":r"] = blood_request["id"]
+        actions.append(_tx_update(
+            db,
+            "inventory_units",
+            {"id": unit["id"]},
+            _unit_update(unit_status, with_request=True, located=bool(unit.get("geo_cell"))),
+            condition="#st = :e",
+            names={"#st": "status"},
+            values=unit_values,
+        ))
+        key = (site_of(unit), inventory_shard(unit["id"]), unit["blood_group"])
+        deltas[key] = deltas.get(key, 0) + delta
+    actions.extend(_tx_inventory_deltas(db, deltas))
+    if len(actions) > MAX_TRANSACT_ITEMS:
+        raise ValueError(f"{len(units)} units do not fit in one transaction")
+    _transact_write(db, actions)
+
+    new_request = dict(blood_request, status=request_status, site_status=values[":ss"])
+    new_request.pop("reserved_units", None)
+    if reserved_units is not None:
+        new_request["reserved_units"] = reserved_units
+    _emit(db, "blood_requests", MODIFY, new_image=new_request, old_image=blood_request)
+    for i, unit in enumerate(units):
+        _emit_unit_change(
+            db, dict(unit, request_id=blood_request["id"]), unit_status, expected_unit_status, bump=i == 0
+        )
+    return new_request
+
+
+def get_inventory_unit(db, unit_id):
+    r = db.inventory_units.get_item(Key={"id": unit_id})
+    return _serialize_item(r.get("Item"))
+
+
+def query_usable_units(db, blood_group, as_of, limit=None):
+    """Available units of blood_group not expired on as_of, first to expire first."""
+    kwargs = {"Limit": limit} if limit else {}
+    pager = _Pager(
+        "query_usable_units",
+        db.inventory_units.query,
+        IndexName="available_group-expires_on-index",
+        KeyConditionExpression="available_group = :g AND expires_on >= :d",
+        ExpressionAttributeValues={":g": blood_group, ":d": as_of},
+        ScanIndexForward=True,
+        **kwargs,
+    )
+    items = []
+    for r in pager:
+        items.extend(_serialize_item(i) for i in r.get("Items", []))
+        if limit is not None and len(items) >= limit:
+            break
+    return pager.wrap(items[:limit] if limit else items)
+
+
+def query_expired_units(db, blood_group, as_of, limit=100):
+    """Up to `limit` units of blood_group still marked available but expired before as_of."""
+    r = db.inventory_units.query(
+        IndexName="available_group-expires_on-index",
+        KeyConditionExpression="available_group = :g AND expires_on < :d",
+        ExpressionAttributeValues={":g": blood_group, ":d": as_of},
+        Limit=limit,
+    )
+    return [_serialize_item(i) for i in r.get("Items", [])]
+
+
+def query_units_near(db, prefixes):
+    """Available units collected at sites in the given geohash prefixes (expiry is not checked)."""
+    return _query_cells(
+        "query_units_near",
+        db.inventory_units.query,
+        prefixes,
+        "available_cell",
+        IndexName="available_cell-geohash-index",
+    )
+
+
+def scan_segment(db, table, segment, total_segments, page_size=100):
+    """Yield (items, consumed_read_units) for one segment of a parallel scan of db.<table>.
+
+    Pages are capped at page_size items so callers can throttle between pages.
+    """
+    scan = getattr(db, table).scan
+    kwargs = {
+        "Segment": segment,
+        "TotalSegments": total_segments,
+        "Limit": page_size,
+        "ReturnConsumedCapacity": "TOTAL",
+    }
+    while True:
+        r = scan(**kwargs)
+        consumed = (r.get("ConsumedCapacity") or {}).get("CapacityUnits")
+        yield [_serialize_item(i) for i in r.get("Items", [])], float(consumed) if consumed is not None else 1.0
+        if not r.get("LastEvaluatedKey"):
+            return
+        kwargs["ExclusiveStartKey"] = r["LastEvaluatedKey"]
+
+
+def iter_table_items(db, table):
+    """Yield every item of a table (db.<table>) page by page, de-Decimalized."""
+    for r in _Pager(f"iter_table_items:{table}", getattr(db, table).scan):
+        for i in r.get("Items", []):
+            yield _serialize_item(i)
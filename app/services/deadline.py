@@ -0,0 +1,87 @@
+"""
+Per-request deadlines. A Deadline is attached to flask.g at the start of each
+request; paging loops and the DynamoDB call guard consult it so that one slow
+request cannot hold a worker indefinitely. Loops that stop early mark the
+deadline partial and return a continuation cursor.
+"""
+import base64
+import json
+import time
+
+from flask import g, has_app_context
+
+
+class InvalidCursor(ValueError):
+    """A continuation cursor that is malformed or does not fit the read it is passed to."""
+
+
+class Deadline:
+    """Absolute point in time (monotonic) by which the current request should finish."""
+
+    def __init__(self, budget_ms):
+        self.budget_ms = budget_ms
+        self.expires_at = time.monotonic() + budget_ms / 1000.0
+        self.partial = False
+        self.cursors = {}
+
+    def remaining(self):
+        """Seconds left; never negative."""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return time.monotonic() >= self.expires_at
+
+    def mark_partial(self, name, cursor):
+        """Record that `name` stopped early; cursor resumes it."""
+        self.partial = True
+        self.cursors[name] = cursor
+
+
+def start_request_deadline(budget_ms):
+    """Attach a fresh Deadline to the current request."""
+    g.deadline = Deadline(budget_ms)
+    return g.deadline
+
+
+def clear_request_deadline():
+    """Lift the deadline for the rest of the current request (streamed responses read to the end)."""
+    g.deadline = None
+
+
+def current_deadline():
+    """Deadline of the current request, or None outside a request (scripts, workers)."""
+    if not has_app_context():
+        return None
+    return g.get("deadline")
+
+
+def remaining_request_time():
+    """Seconds left for the current request, or None when there is no deadline."""
+    deadline = current_deadline()
+    return deadline.remaining() if deadline else None
+
+
+def request_partial():
+    """True if any read in the current request returned a partial result."""
+    deadline = current_deadline()
+    return bool(deadline and deadline.partial)
+
+
+def encode_cursor(last_evaluated_key):
+    """Encode a DynamoDB LastEvaluatedKey as an opaque URL-safe token."""
+    if not last_evaluated_key:
+        return None
+    raw = json.dumps(last_evaluated_key, sort_keys=True, default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Decode a token from encode_cursor; returns None for empty or malformed input."""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        key = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        return None
+    return key if isinstance(key, dict) else None
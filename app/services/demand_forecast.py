@@ -0,0 +1,185 @@
+"""
+Demand forecasting per blood group from daily rollups.
+
+Two derived views count, per day and blood group, the units requested
+(requests_daily, by request timestamp) and the donations collected
+(donations_daily, completed donations by donation date). DemandForecaster keeps
+the last FORECAST_HISTORY_DAYS complete days of both as (groups, days) NumPy
+arrays, one row per group in BLOOD_GROUPS order. The first call reads the whole
+window; after that, each new day reads only the days since the last refresh
+(plus REFRESH_OVERLAP_DAYS trailing days, which late status changes can still
+move) and shifts the arrays.
+
+Everything is vectorized across the eight groups:
+  - moving averages: trailing 7- and 28-day means from cumulative sums.
+  - seasonality: day-of-week factors, each weekday's mean over the overall mean.
+  - exponential smoothing: Holt's linear method (level + trend) on the
+    deseasonalized series, one step per day for all groups at once.
+The forecast for day h ahead is (level + h * trend) times that weekday's
+factor, floored at zero.
+"""
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from app.services.derived_views import daily_rollup_view, inventory_view
+from config import (
+    BLOOD_GROUPS,
+    FORECAST_HISTORY_DAYS,
+    FORECAST_HORIZON_DAYS,
+    FORECAST_ALPHA,
+    FORECAST_BETA,
+)
+
+SHORT_WINDOW = 7
+LONG_WINDOW = 28
+REFRESH_OVERLAP_DAYS = 7
+MAX_HORIZON_DAYS = 28
+
+
+def moving_average(series, window):
+    """Trailing mean over window days for each row; NaN until a full window is available."""
+    cumulative = np.cumsum(np.pad(series, ((0, 0), (1, 0))), axis=1)
+    out = np.full(series.shape, np.nan)
+    if series.shape[1] >= window:
+        out[:, window - 1:] = (cumulative[:, window:] - cumulative[:, :-window]) / window
+    return out
+
+
+def weekday_factors(series, weekdays):
+    """(rows, 7) day-of-week factors: mean on that weekday over the overall mean (1 when unknown)."""
+    onehot = (weekdays[None, :] == np.arange(7)[:, None]).astype(float)
+    counts = onehot.sum(axis=1)
+    means = (series @ onehot.T) / np.maximum(counts, 1)
+    overall = series.mean(axis=1, keepdims=True) if series.shape[1] else np.zeros((len(series), 1))
+    factors = np.divide(means, overall, out=np.ones_like(means), where=overall > 0)
+    factors[:, counts == 0] = 1.0
+    return factors
+
+
+def holt(series, alpha=FORECAST_ALPHA, beta=FORECAST_BETA):
+    """Final (level, trend) of Holt's linear exponential smoothing, one row per series."""
+    rows, days = series.shape
+    if days == 0:
+        return np.zeros(rows), np.zeros(rows)
+    level = series[:, :SHORT_WINDOW].mean(axis=1)
+    trend = np.zeros(rows)
+    for t in range(1, days):
+        previous = level
+        level = alpha * series[:, t] + (1 - alpha) * (level + trend)
+        trend = beta * (level - previous) + (1 - beta) * trend
+    return level, trend
+
+
+def _last(values):
+    """Last column of a (rows, days) array, NaN as 0."""
+    return np.nan_to_num(values[:, -1]) if values.shape[1] else np.zeros(len(values))
+
+
+def forecast_series(series, weekdays, future_weekdays, alpha=FORECAST_ALPHA, beta=FORECAST_BETA):
+    """Moving averages, weekday factors, smoothed level/trend and the forecast for each row."""
+    factors = weekday_factors(series, weekdays)
+    seasonal = factors[:, weekdays]
+    deseasonalized = np.divide(series, seasonal, out=series.astype(float), where=seasonal > 0)
+    level, trend = holt(deseasonalized, alpha, beta)
+    steps = np.arange(1, len(future_weekdays) + 1)
+    forecast = np.maximum((level[:, None] + steps[None, :] * trend[:, None]) * factors[:, future_weekdays], 0)
+    return {
+        "ma7": _last(moving_average(series, SHORT_WINDOW)),
+        "ma28": _last(moving_average(series, LONG_WINDOW)),
+        "weekday_factors": factors,
+        "level": level,
+        "trend": trend,
+        "forecast": forecast,
+    }
+
+
+def _dates(first, count):
+    return [(first + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(count)]
+
+
+class DemandForecaster:
+    """Cached daily series of requested units and collected donations per group, and forecasts from them."""
+
+    def __init__(self, db, history_days=FORECAST_HISTORY_DAYS, alpha=FORECAST_ALPHA, beta=FORECAST_BETA):
+        self.db = db
+        self.history_days = history_days
+        self.alpha = alpha
+        self.beta = beta
+        self.requested = np.zeros((len(BLOOD_GROUPS), history_days))
+        self.donated = np.zeros((len(BLOOD_GROUPS), history_days))
+        self.through = None
+        self.days_read = 0
+        self._lock = threading.Lock()
+
+    def _read(self, dates):
+        requested, donated = daily_rollup_view(self.db, dates)
+        self.days_read += len(dates)
+        return tuple(
+            np.array([[by_date[d][bg] for d in dates] for bg in BLOOD_GROUPS], dtype=float)
+            for by_date in (requested, donated)
+        )
+
+    def refresh(self, today=None):
+        """Bring the arrays up to the last complete day (yesterday); reads only what changed."""
+        today = today or datetime.now().date()
+        through = today - timedelta(days=1)
+        with self._lock:
+            if self.through == through:
+                return
+            n = self.history_days
+            if self.through is None or (through - self.through).days >= n - REFRESH_OVERLAP_DAYS:
+                fresh = n
+            else:
+                shift = (through - self.through).days
+                self.requested = np.roll(self.requested, -shift, axis=1)
+                self.donated = np.roll(self.donated, -shift, axis=1)
+                fresh = min(shift + REFRESH_OVERLAP_DAYS, n)
+            requested, donated = self._read(_dates(through - timedelta(days=fresh - 1), fresh))
+            self.requested[:, n - fresh:] = requested
+            self.donated[:, n - fresh:] = donated
+            self.through = through
+
+    def forecast(self, horizon=FORECAST_HORIZON_DAYS, today=None):
+        """Per blood group: recent averages, weekday factors and daily forecasts of demand and donations."""
+        horizon = min(max(int(horizon), 1), MAX_HORIZON_DAYS)
+        self.refresh(today)
+        with self._lock:
+            requested, donated, through = self.requested.copy(), self.donated.copy(), self.through
+        start = through - timedelta(days=self.history_days - 1)
+        weekdays = (np.arange(self.history_days) + start.weekday()) % 7
+        future_weekdays = (np.arange(1, horizon + 1) + through.weekday()) % 7
+        demand = forecast_series(requested, weekdays, future_weekdays, self.alpha, self.beta)
+        supply = forecast_series(donated, weekdays, future_weekdays, self.alpha, self.beta)
+        stock = inventory_view(self.db)
+        groups = {}
+        for i, bg in enumerate(BLOOD_GROUPS):
+            expected_demand = float(demand["forecast"][i].sum())
+            expected_donations = float(supply["forecast"][i].sum())
+            groups[bg] = {
+                "demand": self._summary(demand, i),
+                "donations": self._summary(supply, i),
+                "expected_demand": round(expected_demand, 1),
+                "expected_donations": round(expected_donations, 1),
+                "stock": stock.get(bg, 0),
+                "projected_stock": round(stock.get(bg, 0) + expected_donations - expected_demand, 1),
+            }
+        return {
+            "as_of": through.strftime("%Y-%m-%d"),
+            "history_days": self.history_days,
+            "horizon_days": horizon,
+            "dates": _dates(through + timedelta(days=1), horizon),
+            "groups": groups,
+        }
+
+    @staticmethod
+    def _summary(result, i):
+        return {
+            "ma7": round(float(result["ma7"][i]), 2),
+            "ma28": round(float(result["ma28"][i]), 2),
+            "weekday_factors": [round(float(f), 3) for f in result["weekday_factors"][i]],
+            "level": round(float(result["level"][i]), 2),
+            "trend": round(float(result["trend"][i]), 3),
+            "forecast": [round(float(v), 1) for v in result["forecast"][i]],
+        }
@@ -0,0 +1,471 @@
+"""
+Derived views maintained from the change stream (see change_stream).
+
+Each view subscribes to one or more tables and folds change events into items
+of the stats table: counters and rollups, distinct counts and recent lists.
+Reads become single GetItems instead of table scans. New views are added by
+appending to default_views(); the write path does not change.
+
+Views write through a sink: StatsTableSink (the stats table) when consuming the
+live stream, MemorySink when the reconciler recomputes ground truth.
+
+Views marked transactional are written by the data-access layer in the same
+transaction as their source item (the sharded inventory counters, the daily
+collected-donations rollup). They are not subscribed to the stream; rebuilds
+and the reconciler still recompute them.
+
+Site views partition the same counts by site (site_id of the donation, request
+or unit; see database_service.site_of), so a blood bank's dashboard reads only
+its own site's items. The network-wide views are the roll-up.
+"""
+import threading
+
+from app.services.change_stream import ChangeEvent, INSERT
+from app.services.database_service import (
+    INVENTORY_COUNTER,
+    SITE_INVENTORY_COUNTER,
+    DONATIONS_DAILY_COUNTER,
+    DONATION_COLLECTED,
+    site_of,
+    inventory_shard,
+    increment_stat,
+    get_stat_item,
+    get_stat_items,
+    put_stat_item,
+    clear_stats,
+    iter_table_items,
+)
+from config import BLOOD_GROUPS, REQUEST_STATUSES, ROLES, INVENTORY_COUNTER_SHARDS
+
+# Stats item ids
+INVENTORY = INVENTORY_COUNTER
+DONATIONS_TOTAL = "donations_total"
+DONATIONS_ON_DATE = "donations_on"
+DONORS_DISTINCT = "donors_distinct"
+RECIPIENTS_DISTINCT = "recipients_distinct"
+REQUESTS_BY_STATUS = "requests_by_status"
+PENDING_DEMAND = "pending_demand"
+USERS_BY_ROLE = "users_by_role"
+RECENT_DONATIONS = "recent_donations"
+SITE_INVENTORY = SITE_INVENTORY_COUNTER
+SITE_DONATIONS_ON_DATE = "site_donations_on"
+SITE_DONORS_DISTINCT = "site_donors_distinct"
+SITE_RECENT_DONATIONS = "site_recent_donations"
+SITE_REQUESTS_BY_STATUS = "site_requests_by_status"
+SITE_PENDING_DEMAND = "site_pending_demand"
+REQUESTS_DAILY = "requests_daily"
+DONATIONS_DAILY = DONATIONS_DAILY_COUNTER
+# Settings kept in the stats table; not views, so rebuilds keep them.
+SHORTAGE_THRESHOLDS = "shortage_thresholds"
+PRESERVED_STATS = (SHORTAGE_THRESHOLDS,)
+
+
+class StatsTableSink:
+    """View storage backed by the stats table."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def increment(self, item_id, attribute, delta):
+        return increment_stat(self.db, item_id, attribute, delta)
+
+    def get(self, item_id):
+        return get_stat_item(self.db, item_id)
+
+    def put(self, item, expected_version):
+        return put_stat_item(self.db, item, expected_version)
+
+
+class MemorySink:
+    """In-memory view storage with the same semantics as StatsTableSink."""
+
+    def __init__(self):
+        self.items = {}
+        self._lock = threading.Lock()
+
+    def increment(self, item_id, attribute, delta):
+        with self._lock:
+            item = self.items.setdefault(item_id, {"id": item_id})
+            item[attribute] = item.get(attribute, 0) + delta
+            return item[attribute]
+
+    def get(self, item_id):
+        with self._lock:
+            return dict(self.items.get(item_id, {}))
+
+    def put(self, item, expected_version):
+        with self._lock:
+            current = self.items.get(item["id"], {}).get("version")
+            if current != expected_version:
+                return False
+            self.items[item["id"]] = dict(item, version=(expected_version or 0) + 1)
+            return True
+
+
+class CounterView:
+    """Counters keyed by key_fn(image) -> list of (suffix, attribute).
+
+    Counts live in item_id (suffix None) or f"{item_id}#{suffix}". On each change,
+    keys of the old image are decremented and keys of the new image incremented
+    (net zero changes are skipped). weight_fn(image) sums a quantity instead of
+    counting items.
+    """
+
+    # Increments: a replayed event would count twice.
+    idempotent = False
+
+    def __init__(self, name, table, item_id, key_fn, transactional=False, weight_fn=None):
+        self.name = name
+        self.tables = (table,)
+        self.item_id = item_id
+        self.key_fn = key_fn
+        self.transactional = transactional
+        self.weight_fn = weight_fn or (lambda image: 1)
+
+    def apply(self, sink, event):
+        deltas = {}
+        if event.old_image:
+            weight = self.weight_fn(event.old_image)
+            for key in self.key_fn(event.old_image):
+                deltas[key] = deltas.get(key, 0) - weight
+        if event.new_image:
+            weight = self.weight_fn(event.new_image)
+            for key in self.key_fn(event.new_image):
+                deltas[key] = deltas.get(key, 0) + weight
+        for (suffix, attribute), delta in deltas.items():
+            if delta:
+                item_id = self.item_id if suffix is None else f"{self.item_id}#{suffix}"
+                sink.increment(item_id, attribute, delta)
+
+
+class DistinctCountView:
+    """Number of distinct values of field, via a reference count per value.
+
+    With partition_fn(image), values are counted per partition: the total lives in
+    f"{item_id}#{partition}" and reference counts in f"{item_id}#{partition}#{value}".
+    """
+
+    idempotent = False
+
+    def __init__(self, name, table, field, item_id, partition_fn=None):
+        self.name = name
+        self.tables = (table,)
+        self.field = field
+        self.item_id = item_id
+        self.partition_fn = partition_fn
+
+    def _ids(self, image):
+        """(total item id, reference count item id) of image's value, or None."""
+        value = (image or {}).get(self.field) or None
+        if not value:
+            return None
+        total = self.item_id if self.partition_fn is None else f"{self.item_id}#{self.partition_fn(image)}"
+        return total, f"{total}#{value}"
+
+    def apply(self, sink, event):
+        old, new = self._ids(event.old_image), self._ids(event.new_image)
+        if old == new:
+            return
+        if new:
+            if sink.increment(new[1], "count", 1) == 1:
+                sink.increment(new[0], "count", 1)
+        if old:
+            if sink.increment(old[1], "count", -1) == 0:
+                sink.increment(old[0], "count", -1)
+
+
+class RecentListView:
+    """Newest `size` items of a table by sort_field, stored in one stats item.
+
+    With partition_fn(image), each partition keeps its own list in
+    f"{item_id}#{partition}". Updated with optimistic concurrency on the item's version.
+    """
+
+    # Replacing an entry by id: replays leave the list as it was.
+    idempotent = True
+
+    def __init__(self, name, table, item_id, fields, sort_field, size=20, max_attempts=5, partition_fn=None):
+        self.name = name
+        self.tables = (table,)
+        self.item_id = item_id
+        self.fields = fields
+        self.sort_field = sort_field
+        self.size = size
+        self.max_attempts = max_attempts
+        self.partition_fn = partition_fn
+
+    def _list_id(self, image):
+        if self.partition_fn is None:
+            return self.item_id
+        return f"{self.item_id}#{self.partition_fn(image)}" if image else None
+
+    def apply(self, sink, event):
+        old_id, new_id = self._list_id(event.old_image), self._list_id(event.new_image)
+        if old_id and old_id != new_id:
+            # The item moved to another partition (or was removed): drop it from the old list.
+            self._update(sink, old_id, event.key, None)
+        if new_id:
+            self._update(sink, new_id, event.key, event.new_image)
+
+    def _update(self, sink, list_id, key, image):
+        for _ in range(self.max_attempts):
+            current = sink.get(list_id)
+            entries = [e for e in current.get("items", []) if e.get("id") != key]
+            if image:
+                entries.append({f: image.get(f) for f in ["id"] + self.fields})
+            # id breaks ties so the result does not depend on event order.
+            entries.sort(key=lambda e: (e.get(self.sort_field) or "", e.get("id") or ""), reverse=True)
+            item = {"id": list_id, "items": entries[: self.size]}
+            if sink.put(item, current.get("version")):
+                return
+        raise RuntimeError(f"{self.name}: too much contention updating {list_id}")
+
+
+def _inventory_keys(image):
+    if image.get("status") == "available" and image.get("blood_group"):
+        return [(str(inventory_shard(image["id"])), image["blood_group"])]
+    return []
+
+
+def _site_inventory_keys(image):
+    return [(f"{site_of(image)}#{shard}", group) for shard, group in _inventory_keys(image)]
+
+
+def _pending_demand_keys(image):
+    if (image.get("status") or "pending") == "pending" and image.get("blood_group"):
+        return [(None, image["blood_group"])]
+    return []
+
+
+def _site_pending_demand_keys(image):
+    return [(site_of(image), group) for _, group in _pending_demand_keys(image)]
+
+
+def _requests_daily_keys(image):
+    day = str(image.get("timestamp") or "")[:10]
+    if day and image.get("blood_group"):
+        return [(day, image["blood_group"])]
+    return []
+
+
+def _donations_daily_keys(image):
+    # Collected donations only (the same status that adds a unit to the ledger).
+    if image.get("status") == DONATION_COLLECTED and image.get("date") and image.get("blood_group"):
+        return [(str(image["date"])[:10], image["blood_group"])]
+    return []
+
+
+def _requested_units(image):
+    try:
+        return max(int(image.get("units") or 0), 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def default_views():
+    """Views maintained by every app instance."""
+    return [
+        CounterView("inventory", "inventory_units", INVENTORY, _inventory_keys, transactional=True),
+        CounterView("donations_total", "donations", DONATIONS_TOTAL, lambda img: [(None, "count")]),
+        CounterView(
+            "donations_on_date",
+            "donations",
+            DONATIONS_ON_DATE,
+            lambda img: [(img["date"], "count")] if img.get("date") else [],
+        ),
+        DistinctCountView("donors_distinct", "donations", "donor_id", DONORS_DISTINCT),
+        RecentListView(
+            "recent_donations",
+            "donations",
+            RECENT_DONATIONS,
+            ["donor_name", "blood_group", "date", "location"],
+            sort_field="date",
+        ),
+        CounterView(
+            "requests_by_status",
+            "blood_requests",
+            REQUESTS_BY_STATUS,
+            lambda img: [(None, img.get("status") or "pending")],
+        ),
+        CounterView(
+            "pending_demand",
+            "blood_requests",
+            PENDING_DEMAND,
+            _pending_demand_keys,
+            weight_fn=_requested_units,
+        ),
+        DistinctCountView("recipients_distinct", "blood_requests", "requester_id", RECIPIENTS_DISTINCT),
+        CounterView("users_by_role", "users", USERS_BY_ROLE, lambda img: [(None, img.get("role") or "none")]),
+        # Daily rollups per blood group (demand forecasting).
+        CounterView(
+            "requests_daily",
+            "blood_requests",
+            REQUESTS_DAILY,
+            _requests_daily_keys,
+            weight_fn=_requested_units,
+        ),
+        CounterView("donations_daily", "donations", DONATIONS_DAILY, _donations_daily_keys, transactional=True),
+        # Per-site partitions of the views above.
+        CounterView("site_inventory", "inventory_units", SITE_INVENTORY, _site_inventory_keys, transactional=True),
+        CounterView(
+            "site_donations_on_date",
+            "donations",
+            SITE_DONATIONS_ON_DATE,
+            lambda img: [(f"{site_of(img)}#{img['date']}", "count")] if img.get("date") else [],
+        ),
+        DistinctCountView("site_donors_distinct", "donations", "donor_id", SITE_DONORS_DISTINCT, partition_fn=site_of),
+        RecentListView(
+            "site_recent_donations",
+            "donations",
+            SITE_RECENT_DONATIONS,
+            ["donor_name", "blood_group", "date", "location"],
+            sort_field="date",
+            size=10,
+            partition_fn=site_of,
+        ),
+        CounterView(
+            "site_requests_by_status",
+            "blood_requests",
+            SITE_REQUESTS_BY_STATUS,
+            lambda img: [(site_of(img), img.get("status") or "pending")],
+        ),
+        CounterView(
+            "site_pending_demand",
+            "blood_requests",
+            SITE_PENDING_DEMAND,
+            _site_pending_demand_keys,
+            weight_fn=_requested_units,
+        ),
+    ]
+
+
+def register_derived_views(db, views=None):
+    """Subscribe views to the wrapper's change stream (transactional views are skipped).
+
+    Views that are not idempotent are not retried; the reconciler repairs their drift.
+    """
+    views = default_views() if views is None else views
+    sink = StatsTableSink(db)
+    for view in views:
+        if getattr(view, "transactional", False):
+            continue
+        for table in view.tables:
+            db.events.subscribe(
+                table,
+                lambda event, v=view: v.apply(sink, event),
+                name=view.name,
+                retry=getattr(view, "idempotent", False),
+            )
+    return views
+
+
+def rebuild_derived_views(db, views=None, tables=("users", "donations", "blood_requests", "inventory_units")):
+    """Recompute all views from scratch by replaying every item as an INSERT.
+
+    Not safe to run concurrently with writes; use the reconciler for live repair.
+    Returns {table: items replayed}.
+    """
+    views = default_views() if views is None else views
+    sink = StatsTableSink(db)
+    clear_stats(db, keep=PRESERVED_STATS)
+    replayed = {}
+    for table in tables:
+        subscribed = [v for v in views if table in v.tables]
+        count = 0
+        for item in iter_table_items(db, table):
+            event = ChangeEvent(table, INSERT, new_image=item)
+            for view in subscribed:
+                view.apply(sink, event)
+            count += 1
+        replayed[table] = count
+    return replayed
+
+
+# ---------- Readers ----------
+def _count(item, attribute="count"):
+    return int(item.get(attribute, 0) or 0)
+
+
+def _inventory_shard_ids(site_id=None):
+    prefix = INVENTORY if site_id is None else f"{SITE_INVENTORY}#{site_id}"
+    return [f"{prefix}#{s}" for s in range(INVENTORY_COUNTER_SHARDS)]
+
+
+def inventory_view(db, blood_groups=None, site_id=None):
+    """Return dict blood_group -> usable units (available units in the ledger, swept for expiry).
+
+    Network-wide, or one site's stock with site_id. Sums the counter shards (one BatchGetItem).
+    """
+    shards = get_stat_items(db, _inventory_shard_ids(site_id))
+    return {
+        bg: sum(_count(item, bg) for item in shards.values())
+        for bg in (blood_groups or BLOOD_GROUPS)
+    }
+
+
+def supply_demand_view(db, blood_groups=None, extra_items=(), site_id=None):
+    """Per blood group: pending requested units (demand), usable units (supply) and gap.
+
+    gap = demand - supply (positive = short); network-wide, or for one site with
+    site_id. One BatchGetItem reads the pending demand item and the inventory
+    shards, plus any extra_items (returned second).
+    """
+    shard_ids = _inventory_shard_ids(site_id)
+    demand_id = PENDING_DEMAND if site_id is None else f"{SITE_PENDING_DEMAND}#{site_id}"
+    items = get_stat_items(db, shard_ids + [demand_id] + list(extra_items))
+    demand = items.get(demand_id, {})
+    out = {}
+    for bg in blood_groups or BLOOD_GROUPS:
+        supply = sum(_count(items.get(i, {}), bg) for i in shard_ids)
+        out[bg] = {"demand": _count(demand, bg), "supply": supply, "gap": _count(demand, bg) - supply}
+    return out, {i: items.get(i, {}) for i in extra_items}
+
+
+def daily_rollup_view(db, dates, blood_groups=None):
+    """Units requested and donations collected per day and blood group for dates (YYYY-MM-DD).
+
+    Returns ({date: {bg: units}}, {date: {bg: donations}}), read with BatchGetItem.
+    """
+    ids = [f"{REQUESTS_DAILY}#{d}" for d in dates] + [f"{DONATIONS_DAILY}#{d}" for d in dates]
+    items = get_stat_items(db, ids)
+    groups = blood_groups or BLOOD_GROUPS
+    requested = {d: {bg: _count(items.get(f"{REQUESTS_DAILY}#{d}", {}), bg) for bg in groups} for d in dates}
+    donated = {d: {bg: _count(items.get(f"{DONATIONS_DAILY}#{d}", {}), bg) for bg in groups} for d in dates}
+    return requested, donated
+
+
+def donations_total_view(db):
+    return _count(get_stat_item(db, DONATIONS_TOTAL))
+
+
+def donations_on_date_view(db, date_str, site_id=None):
+    if site_id is None:
+        return _count(get_stat_item(db, f"{DONATIONS_ON_DATE}#{date_str}"))
+    return _count(get_stat_item(db, f"{SITE_DONATIONS_ON_DATE}#{site_id}#{date_str}"))
+
+
+def donors_distinct_view(db, site_id=None):
+    item_id = DONORS_DISTINCT if site_id is None else f"{SITE_DONORS_DISTINCT}#{site_id}"
+    return _count(get_stat_item(db, item_id))
+
+
+def recipients_distinct_view(db):
+    return _count(get_stat_item(db, RECIPIENTS_DISTINCT))
+
+
+def requests_by_status_view(db, site_id=None):
+    """Return dict status -> number of blood requests (network-wide, or lodged with site_id)."""
+    item = get_stat_item(db, REQUESTS_BY_STATUS if site_id is None else f"{SITE_REQUESTS_BY_STATUS}#{site_id}")
+    return {s: _count(item, s) for s in REQUEST_STATUSES}
+
+
+def users_by_role_view(db):
+    """Return dict role -> number of users ("none" for users without a role)."""
+    item = get_stat_item(db, USERS_BY_ROLE)
+    return {r: _count(item, r) for r in ROLES + ["none"]}
+
+
+def recent_donations_view(db, limit=5, site_id=None):
+    """Newest donations (donor_name, blood_group, date, location), newest first."""
+    item_id = RECENT_DONATIONS if site_id is None else f"{SITE_RECENT_DONATIONS}#{site_id}"
+    return get_stat_item(db, item_id).get("items", [])[:limit]
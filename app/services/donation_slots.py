@@ -0,0 +1,127 @@
+"""
+Donation slot capacity and occupancy.
+
+Each (location, date, time slot) that has been booked is one item in the
+donation_slots table with a `booked` counter and an optional `capacity`
+override (default DONATION_SLOT_CAPACITY). create_donation takes a place with a
+conditional ADD in the same transaction as the donation, so concurrent
+bookings can never overfill a slot. SlotBookings gives the place back when a
+donation is cancelled or removed (and takes it again if it is un-cancelled).
+
+Items are partitioned by location and month, so the schedule page's heatmap
+for a location's month is one bounded Query.
+"""
+import calendar
+from datetime import datetime
+
+from app.services.change_stream import INSERT, REMOVE
+from app.services.database_service import (
+    adjust_slot_booking,
+    query_slot_month,
+    set_slot_booked,
+    slot_key,
+    iter_table_items,
+)
+from config import DONATION_SLOT_CAPACITY, DONATION_TIME_SLOTS
+
+# Donations in these statuses do not hold a place in their slot.
+RELEASED_STATUSES = ["Cancelled"]
+# Upper bound on slot items read for one month (the configured slots, plus
+# unnamed and free-form ones).
+MONTH_SLOT_LIMIT = 31 * (len(DONATION_TIME_SLOTS) + 3)
+
+
+def _holds_place(donation):
+    return bool(donation) and donation.get("status") not in RELEASED_STATUSES
+
+
+class SlotBookings:
+    """Change-stream consumer that keeps slot counters in step with cancellations.
+
+    Not retried: the counter moves by ADD, so a replay would move it twice. A
+    dropped adjustment is logged; rebuild_slot_bookings recounts the slots.
+    """
+
+    name = "donation_slots"
+    tables = ("donations",)
+
+    def __init__(self, db):
+        self.db = db
+
+    def apply(self, event):
+        new = event.new_image if event.event_name != REMOVE else None
+        # New bookings were counted by create_donation itself.
+        if event.event_name == INSERT:
+            return
+        held, holds = _holds_place(event.old_image), _holds_place(new)
+        if held == holds:
+            return
+        donation = event.old_image if held else new
+        adjust_slot_booking(
+            self.db, donation.get("location"), donation.get("date"), donation.get("time_slot"), 1 if holds else -1
+        )
+
+
+def register_slot_bookings(db):
+    """Subscribe the slot counters to donation events."""
+    bookings = SlotBookings(db)
+    for table in bookings.tables:
+        db.events.subscribe(table, bookings.apply, name=bookings.name, retry=False)
+    return bookings
+
+
+def _slot_entry(time_slot, item, capacity):
+    booked = int(item.get("booked", 0) or 0)
+    slot_capacity = int(item["capacity"]) if item.get("capacity") is not None else capacity
+    return {
+        "time_slot": time_slot,
+        "booked": booked,
+        "capacity": slot_capacity,
+        "available": max(slot_capacity - booked, 0),
+    }
+
+
+def slot_heatmap(db, location, month, capacity=DONATION_SLOT_CAPACITY, time_slots=DONATION_TIME_SLOTS):
+    """Occupancy of every day of a location's month (YYYY-MM), from one bounded Query.
+
+    Each day lists the configured time slots (plus any other booked ones) with
+    booked / capacity / available, and the day's overall occupancy (0..1).
+    """
+    items = query_slot_month(db, location, month, MONTH_SLOT_LIMIT)
+    by_day = {}
+    for item in items:
+        date, _, time_slot = item["slot"].partition("#")
+        by_day.setdefault(date, {})[time_slot] = item
+    year, mon = (int(part) for part in month.split("-"))
+    days = []
+    for day in range(1, calendar.monthrange(year, mon)[1] + 1):
+        date = f"{month}-{day:02d}"
+        stored = by_day.get(date, {})
+        names = list(time_slots) + sorted(s for s in stored if s not in time_slots)
+        slots = [_slot_entry(s, stored.get(s, {}), capacity) for s in names]
+        booked = sum(s["booked"] for s in slots)
+        total = sum(s["capacity"] for s in slots)
+        days.append({
+            "date": date,
+            "slots": slots,
+            "booked": booked,
+            "capacity": total,
+            "occupancy": round(min(booked / total, 1.0), 3) if total else 1.0,
+        })
+    return {"location": location, "month": month, "time_slots": list(time_slots), "days": days, "partial": items.partial}
+
+
+def rebuild_slot_bookings(db, from_date=None):
+    """Recount places held in slots from from_date (default today) on. Returns the number of slots written."""
+    from_date = from_date or datetime.now().strftime("%Y-%m-%d")
+    slots, counts = {}, {}
+    for donation in iter_table_items(db, "donations"):
+        if _holds_place(donation) and str(donation.get("date") or "")[:10] >= from_date:
+            slot = (donation.get("location") or "", str(donation["date"])[:10], donation.get("time_slot") or "")
+            # Spellings of a location that share a slot key are counted together.
+            key = tuple(slot_key(*slot).values())
+            slots.setdefault(key, slot)
+            counts[key] = counts.get(key, 0) + 1
+    for key, booked in counts.items():
+        set_slot_booked(db, *slots[key], booked)
+    return len(counts)
@@ -0,0 +1,135 @@
+"""
+Eligible-donor index fed by the change stream.
+
+One item per donor in the donor_eligibility table holds their blood group, last
+donation date and next eligible date (last donation + DONATION_DEFERRAL_DAYS).
+A GSI on (blood_group, next_eligible) answers "who can donate now" with a
+bounded Query per donor group instead of scanning donations. The donor's last
+donation site with coordinates is kept as their location (geo_cell-geohash-index),
+and booked / completed donation counts give their show-up rate for ranking.
+The entry keeps the ids of the donations it has counted, so a retried event
+does not count a donation twice.
+"""
+from datetime import datetime, timedelta
+
+from app.services.change_stream import INSERT
+from app.services.geo import item_geo_attributes
+from app.services.database_service import (
+    record_donor_donation,
+    record_donor_attendance,
+    put_donor_eligibility,
+    delete_donor_eligibility,
+    get_donations_by_donor,
+    iter_table_items,
+)
+from config import DONATION_DEFERRAL_DAYS
+
+# Donations in these statuses do not count towards a donor's deferral.
+IGNORED_STATUSES = ["Cancelled"]
+# A booked donation in this status means the donor showed up.
+COMPLETED = "Completed"
+
+
+def next_eligible_date(date_str, deferral_days=DONATION_DEFERRAL_DAYS):
+    """YYYY-MM-DD on which a donor who gave on date_str may give again (None if unparsable)."""
+    try:
+        day = datetime.strptime(str(date_str)[:10], "%Y-%m-%d")
+    except ValueError:
+        return None
+    return (day + timedelta(days=deferral_days)).strftime("%Y-%m-%d")
+
+
+def _counts(donation):
+    return bool(
+        donation
+        and donation.get("donor_id")
+        and donation.get("blood_group")
+        and donation.get("status") not in IGNORED_STATUSES
+        and next_eligible_date(donation.get("date"))
+    )
+
+
+class EligibleDonorIndex:
+    """Consumer keeping donor_eligibility in step with the donations table."""
+
+    name = "eligible_donors"
+    tables = ("donations",)
+
+    def __init__(self, db, deferral_days=DONATION_DEFERRAL_DAYS):
+        self.db = db
+        self.deferral_days = deferral_days
+
+    def apply(self, event):
+        if event.event_name == INSERT:
+            if _counts(event.new_image):
+                self._record(event.new_image)
+            if event.new_image.get("donor_id"):
+                record_donor_attendance(
+                    self.db,
+                    event.new_image["donor_id"],
+                    event.new_image["id"],
+                    1,
+                    int(event.new_image.get("status") == COMPLETED),
+                )
+            return
+        # A donation was changed or removed: its donor's latest counting donation
+        # (and attendance) may have changed, so recompute from the donor's history.
+        donor_ids = {img.get("donor_id") for img in (event.old_image, event.new_image) if img}
+        for donor_id in donor_ids - {None}:
+            self.recompute(donor_id)
+
+    def _record(self, donation):
+        record_donor_donation(
+            self.db,
+            donation["donor_id"],
+            donation.get("donor_name"),
+            donation["blood_group"],
+            str(donation["date"])[:10],
+            next_eligible_date(donation["date"], self.deferral_days),
+            geo=item_geo_attributes(donation),
+        )
+
+    def recompute(self, donor_id):
+        """Rebuild one donor's entry from their donations (newest first).
+
+        Raises if the history could not be read in full: an empty or cut-short read
+        must not delete or roll back the entry (the stream retries the event).
+        """
+        history = get_donations_by_donor(self.db, donor_id)
+        if history.partial:
+            raise RuntimeError(f"{self.name}: could not read the donations of donor {donor_id}")
+        donations = [d for d in history if _counts(d)]
+        if not donations:
+            delete_donor_eligibility(self.db, donor_id)
+            return
+        latest = donations[0]
+        item = {
+            "donor_id": donor_id,
+            "donor_name": latest.get("donor_name") or "",
+            "blood_group": latest["blood_group"],
+            "last_donation": str(latest["date"])[:10],
+            "next_eligible": next_eligible_date(latest["date"], self.deferral_days),
+            "booked": len(history),
+            "completed": sum(d.get("status") == COMPLETED for d in history),
+            "counted_donations": {d["id"] for d in history},
+        }
+        located = next((d for d in donations if d.get("geo_cell")), None)
+        item.update(item_geo_attributes(located))
+        put_donor_eligibility(self.db, item)
+
+
+def register_donor_index(db):
+    """Subscribe the eligible-donor index to donation events."""
+    index = EligibleDonorIndex(db)
+    for table in index.tables:
+        db.events.subscribe(table, index.apply, name=index.name)
+    return index
+
+
+def rebuild_donor_index(db):
+    """Recompute every donor's entry from their history. Returns the number of donors."""
+    index = EligibleDonorIndex(db)
+    donor_ids = {d.get("donor_id") for d in iter_table_items(db, "donations")} - {None}
+    for donor_id in donor_ids:
+        index.recompute(donor_id)
+    return len(donor_ids)
@@ -1,9 +1,11 @@
 """
 DynamoDB client and table access for Blood Bridge.
 Uses boto3; credentials from env or default chain.
+Every table call goes through a DynamoDBCallGuard (retries, breaker, rate limit).
 """
 import os
 import boto3
+from botocore.config import Config
 from botocore.exceptions import ClientError
 
 from config import (
@@ -13,17 +15,59 @@ from config import (
     BLOOD_REQUESTS_TABLE,
     MESSAGES_TABLE,
     ADMINS_TABLE,
+    STATS_TABLE,
+    DONOR_ELIGIBILITY_TABLE,
+    INVENTORY_UNITS_TABLE,
+    DONATION_SLOTS_TABLE,
+    NOTIFICATION_OUTBOX_TABLE,
+    EVENT_BUS,
+    EVENT_BUS_WORKERS,
+    DDB_CONNECT_TIMEOUT,
+    DDB_READ_TIMEOUT,
+    DDB_MAX_ATTEMPTS,
+    DDB_RETRY_BUDGET_MS,
+    DDB_RETRY_BASE_MS,
+    DDB_BREAKER_FAILURE_THRESHOLD,
+    DDB_BREAKER_RESET_SECONDS,
+    DDB_RATE_LIMIT_INITIAL,
+    DDB_RATE_LIMIT_MIN,
+    DDB_RATE_LIMIT_MAX,
 )
+from app.services.resilience import DynamoDBCallGuard, GuardedTable
+from app.services.deadline import remaining_request_time
+from app.services.change_stream import build_event_bus
 
 
 def _get_client():
-    kwargs = {"region_name": os.environ.get("AWS_REGION") or AWS_REGION}
+    kwargs = {
+        "region_name": os.environ.get("AWS_REGION") or AWS_REGION,
+        # Retries are owned by DynamoDBCallGuard; botocore makes a single attempt.
+        "config": Config(
+            connect_timeout=DDB_CONNECT_TIMEOUT,
+            read_timeout=DDB_READ_TIMEOUT,
+            retries={"mode": "standard", "total_max_attempts": 1},
+        ),
+    }
     if os.environ.get("AWS_ACCESS_KEY_ID"):
         kwargs["aws_access_key_id"] = os.environ.get("AWS_ACCESS_KEY_ID")
         kwargs["aws_secret_access_key"] = os.environ.get("AWS_SECRET_ACCESS_KEY", "")
     return boto3.resource("dynamodb", **kwargs)
 
 
+def _get_guard():
+    return DynamoDBCallGuard(
+        max_attempts=DDB_MAX_ATTEMPTS,
+        retry_budget_ms=DDB_RETRY_BUDGET_MS,
+        retry_base_ms=DDB_RETRY_BASE_MS,
+        breaker_failure_threshold=DDB_BREAKER_FAILURE_THRESHOLD,
+        breaker_reset_seconds=DDB_BREAKER_RESET_SECONDS,
+        rate_initial=DDB_RATE_LIMIT_INITIAL,
+        rate_min=DDB_RATE_LIMIT_MIN,
+        rate_max=DDB_RATE_LIMIT_MAX,
+        deadline_fn=remaining_request_time,
+    )
+
+
 def get_dynamodb_tables(app):
     """Return an object with DynamoDB Table resources.
 
@@ -33,15 +77,39 @@ def get_dynamodb_tables(app):
       - blood_requests
       - messages
       - admins
+      - stats (derived views: counters, rollups, recent lists)
+      - donor_eligibility (eligible-donor index: blood group -> next eligible date)
+      - inventory_units (unit ledger: one unit per completed donation, with expiry)
+      - donation_slots (booked / capacity per location, date and time slot)
+      - notification_outbox (donor notifications still to deliver for new requests)
+      - guard (DynamoDBCallGuard shared by all tables)
+      - events (change-data-capture bus; see change_stream)
     """
     client = _get_client()
+    guard = _get_guard()
+    config = app.config if app is not None else {}
+    events = build_event_bus(
+        config.get("EVENT_BUS", EVENT_BUS),
+        workers=config.get("EVENT_BUS_WORKERS", EVENT_BUS_WORKERS),
+    )
+
+    def table(name):
+        return GuardedTable(client.Table(name), guard)
+
     return type("DynamoDBTables", (), {
         "client": client,
-        "users": client.Table(os.environ.get("USERS_TABLE") or USERS_TABLE),
-        "donations": client.Table(os.environ.get("DONATIONS_TABLE") or DONATIONS_TABLE),
-        "blood_requests": client.Table(os.environ.get("BLOOD_REQUESTS_TABLE") or BLOOD_REQUESTS_TABLE),
-        "messages": client.Table(os.environ.get("MESSAGES_TABLE") or MESSAGES_TABLE),
-        "admins": client.Table(os.environ.get("ADMINS_TABLE") or ADMINS_TABLE),
+        "guard": guard,
+        "events": events,
+        "users": table(os.environ.get("USERS_TABLE") or USERS_TABLE),
+        "donations": table(os.environ.get("DONATIONS_TABLE") or DONATIONS_TABLE),
+        "blood_requests": table(os.environ.get("BLOOD_REQUESTS_TABLE") or BLOOD_REQUESTS_TABLE),
+        "messages": table(os.environ.get("MESSAGES_TABLE") or MESSAGES_TABLE),
+        "admins": table(os.environ.get("ADMINS_TABLE") or ADMINS_TABLE),
+        "stats": table(os.environ.get("STATS_TABLE") or STATS_TABLE),
+        "donor_eligibility": table(os.environ.get("DONOR_ELIGIBILITY_TABLE") or DONOR_ELIGIBILITY_TABLE),
+        "inventory_units": table(os.environ.get("INVENTORY_UNITS_TABLE") or INVENTORY_UNITS_TABLE),
+        "donation_slots": table(os.environ.get("DONATION_SLOTS_TABLE") or DONATION_SLOTS_TABLE),
+        "notification_outbox": table(os.environ.get("NOTIFICATION_OUTBOX_TABLE") or NOTIFICATION_OUTBOX_TABLE),
     })()
 
 
@@ -54,3 +122,11 @@ def dynamodb_health_check(app):
         return True
     except (ClientError, KeyError, AttributeError, Exception):
         return False
+
+
+def dynamodb_guard_status(app):
+    """Return per-table circuit breaker / rate limiter state from the call guard."""
+    try:
+        return app.extensions["dynamodb"].guard.snapshot()
+    except (KeyError, AttributeError):
+        return {}
@@ -0,0 +1,89 @@
+"""
+Conditional GET for polled read endpoints (inventory, my requests, dashboards).
+
+The "view_versions" stats item holds two counters per table (blood_requests,
+donations, inventory_units, users):
+  - <table>: bumped by the write path itself (database_service._emit), before
+    the write's response is sent, so a POST-redirect-GET never gets a 304 for
+    the page as it was before the write;
+  - <table>_applied: bumped by ViewVersions, which consumes the change stream
+    after every other consumer. The derived views and the allocation read by a
+    GET that follows the write may still lag a moment; this second bump makes
+    sure a body computed from them then is not kept under the final ETag.
+
+A route computes a strong ETag from the counters of the tables its payload
+depends on plus whatever else varies the response (user, site, mode, today's
+date), with one GetItem. If the client's If-None-Match holds that ETag the
+route answers 304 before any other read. The item's epoch is set when it is
+first created, so counters that restart after a stats rebuild never repeat an
+old ETag.
+"""
+import hashlib
+import json
+import uuid
+from datetime import datetime
+
+from flask import make_response, request
+
+from app.services.database_service import VIEW_VERSIONS, VERSIONED_TABLES, bump_stat_version, get_stat_item
+from app.services.responses import response_format
+
+APPLIED_SUFFIX = "_applied"
+
+
+class ViewVersions:
+    """Change-stream consumer that counts applied changes per table (register it last)."""
+
+    name = "view_versions"
+    tables = VERSIONED_TABLES
+
+    def __init__(self, db):
+        self.db = db
+        self.epoch = uuid.uuid4().hex
+
+    def apply(self, event):
+        bump_stat_version(self.db, VIEW_VERSIONS, event.table + APPLIED_SUFFIX, self.epoch)
+
+
+def register_view_versions(db):
+    """Subscribe the version counters to every table a polled payload reads (after all other consumers)."""
+    versions = ViewVersions(db)
+    for table in versions.tables:
+        db.events.subscribe(table, versions.apply, name=versions.name)
+    return versions
+
+
+def versions_etag(db, tables, *parts):
+    """Strong ETag (unquoted) of the version counters of tables plus the other parts of the response key.
+
+    The negotiated body format is part of the key: JSON and MessagePack bodies differ byte for byte.
+    """
+    versions = get_stat_item(db, VIEW_VERSIONS)
+    key = [
+        versions.get("epoch"),
+        [(versions.get(t, 0), versions.get(t + APPLIED_SUFFIX, 0)) for t in tables],
+        datetime.now().strftime("%Y-%m-%d"),
+        response_format(),
+        parts,
+    ]
+    return hashlib.sha256(json.dumps(key, default=str).encode()).hexdigest()[:32]
+
+
+def not_modified(etag):
+    """A 304 response when the request's If-None-Match holds etag, else None."""
+    if etag and request.if_none_match.contains(etag):
+        response = make_response("", 304)
+        response.set_etag(etag)
+        response.vary.add("Accept")
+        return response
+    return None
+
+
+def with_etag(result, etag, partial=False):
+    """Attach etag to a (response, status) pair; only full 200 responses get one."""
+    response, status = result
+    if status == 200 and not partial:
+        response.set_etag(etag)
+        # Clients may keep it but must revalidate every time.
+        response.headers["Cache-Control"] = "private, no-cache"
+    return response, status
@@ -0,0 +1,123 @@
+"""
+Reservation and fulfilment of blood requests against the unit ledger.
+
+Each operation is one TransactWriteItems: the request's status, every unit it
+takes and the sharded inventory counter change together or not at all. Units
+are picked first-expire-first-out from the donor groups the allocation engine
+assigned to the request, so a reservation never takes stock promised to an
+older request.
+"""
+from app.services.database_service import (
+    get_db,
+    get_blood_request_by_id,
+    transition_request_units,
+    TransactionCancelled,
+)
+from app.models.request import BloodRequest
+
+# Failure reasons returned in data["reason"]
+NOT_FOUND = "not_found"
+CONFLICT = "conflict"
+INSUFFICIENT_STOCK = "insufficient_stock"
+TOO_LARGE = "too_large"
+
+
+def _failure(message, reason):
+    return False, message, {"reason": reason}
+
+
+def _unit_refs(units):
+    # site_id keeps the site counter in step; geo_cell lets a released unit rejoin the proximity index.
+    return [
+        {k: u[k] for k in ("id", "blood_group", "site_id", "geo_cell") if u.get(k)}
+        for u in units
+    ]
+
+
+class FulfilmentService:
+    """Reserve, fulfil and release blood requests; requires Flask app for DB, ledger and allocation."""
+
+    def __init__(self, app, max_attempts=3):
+        self.app = app
+        self.db = get_db(app)
+        self.ledger = app.extensions["inventory_ledger"]
+        self.allocation = app.extensions["allocation"]
+        self.max_attempts = max_attempts
+
+    def reserve(self, request_id):
+        """Hold units for a pending request. Returns (success, message, data)."""
+        req = get_blood_request_by_id(self.db, request_id)
+        if not req:
+            return _failure("Request not found.", NOT_FOUND)
+        if req.get("status") != "pending":
+            return _failure(f"Request is {req.get('status')}, not pending.", CONFLICT)
+        return self._take(req, "reserved", "reserved", "Units reserved.")
+
+    def fulfil(self, request_id):
+        """Issue a reserved request's units, or take and issue units for a pending one."""
+        req = get_blood_request_by_id(self.db, request_id)
+        if not req:
+            return _failure("Request not found.", NOT_FOUND)
+        if req.get("status") == "pending":
+            return self._take(req, "fulfilled", "issued", "Request fulfilled.")
+        if req.get("status") != "reserved":
+            return _failure(f"Request is {req.get('status')}, cannot fulfil.", CONFLICT)
+        units = req.get("reserved_units") or []
+        try:
+            new = transition_request_units(self.db, req, "fulfilled", units, "issued", "reserved")
+        except TransactionCancelled:
+            return _failure("Request changed while fulfilling; reload and retry.", CONFLICT)
+        return True, "Request fulfilled.", {"request": BloodRequest.to_serializable(new), "units": _unit_refs(units)}
+
+    def release(self, request_id):
+        """Return a reservation's units to stock and put the request back in the queue."""
+        req = get_blood_request_by_id(self.db, request_id)
+        if not req:
+            return _failure("Request not found.", NOT_FOUND)
+        if req.get("status") != "reserved":
+            return _failure(f"Request is {req.get('status')}, not reserved.", CONFLICT)
+        units = req.get("reserved_units") or []
+        try:
+            new = transition_request_units(self.db, req, "pending", units, "available", "reserved")
+        except TransactionCancelled:
+            return _failure("Request changed while releasing; reload and retry.", CONFLICT)
+        return True, "Reservation released.", {"request": BloodRequest.to_serializable(new), "units": []}
+
+    def _pick(self, sources, exclude):
+        """FEFO units for {blood_group: count}, skipping ids in exclude; None if stock is short."""
+        picked = []
+        for group, count in sources.items():
+            candidates = [
+                u for u in self.ledger.pick_units(group, count + len(exclude))
+                if u["id"] not in exclude
+            ]
+            if len(candidates) < count:
+                return None
+            picked.extend(candidates[:count])
+        return picked
+
+    def _take(self, req, request_status, unit_status, message):
+        plan = self.allocation.snapshot()["requests"].get(req["id"])
+        if not plan or not plan["allocated"]:
+            return _failure("Not enough compatible stock is allocated to this request yet.", INSUFFICIENT_STOCK)
+        exclude = set()
+        for _ in range(self.max_attempts):
+            units = self._pick(plan["allocated_from"], exclude)
+            if units is None:
+                return _failure("Not enough usable units left to cover this request.", INSUFFICIENT_STOCK)
+            refs = _unit_refs(units)
+            try:
+                new = transition_request_units(
+                    self.db, req, request_status, units, unit_status, "available",
+                    reserved_units=refs if request_status == "reserved" else None,
+                )
+            except ValueError as e:
+                return _failure(str(e), TOO_LARGE)
+            except TransactionCancelled as e:
+                if e.reasons[0] == "ConditionalCheckFailed":
+                    return _failure("Request changed while reserving; reload and retry.", CONFLICT)
+                # Units taken by a concurrent reservation: pick around them and try again.
+                exclude.update(u["id"] for u, code in zip(units, e.reasons[1:]) if code != "None")
+                continue
+            return True, message, {"request": BloodRequest.to_serializable(new), "units": refs}
+        return _failure("Stock is changing too fast; please retry.", CONFLICT)
@@ -0,0 +1,159 @@
+"""
+Geohash encoding and proximity helpers.
+
+Items with coordinates carry lat/lon, a full-precision geohash and a coarse
+geo_cell (the first GEO_CELL_PRECISION characters). A GSI on (geo_cell, geohash)
+lets a radius search Query the few cells around a point with begins_with on
+the geohash instead of scanning every record; exact distances are then
+computed for the candidates only.
+"""
+import math
+from decimal import Decimal
+
+import numpy as np
+
+from config import GEO_CELL_PRECISION, MAX_PROXIMITY_RADIUS_KM
+
+GEOHASH_PRECISION = 9
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_DECODE = {c: i for i, c in enumerate(_BASE32)}
+EARTH_RADIUS_KM = 6371.0
+_KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def encode(lat, lon, precision=GEOHASH_PRECISION):
+    """Geohash of (lat, lon) with `precision` characters."""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        rng, coord = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        value <<= 1
+        if coord >= mid:
+            value |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits = value = 0
+    return "".join(chars)
+
+
+def bounding_box(geohash):
+    """(lat_min, lat_max, lon_min, lon_max) of a geohash cell."""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for c in geohash:
+        value = _DECODE[c]
+        for shift in range(4, -1, -1):
+            rng = lon_range if even else lat_range
+            mid = (rng[0] + rng[1]) / 2
+            if value >> shift & 1:
+                rng[0] = mid
+            else:
+                rng[1] = mid
+            even = not even
+    return lat_range[0], lat_range[1], lon_range[0], lon_range[1]
+
+
+def cell_size_km(precision, lat=0.0):
+    """(height_km, width_km) of a geohash cell of `precision` characters at latitude lat."""
+    bits = 5 * precision
+    lat_bits, lon_bits = bits // 2, bits - bits // 2
+    height = 180.0 / 2 ** lat_bits * _KM_PER_DEGREE
+    width = 360.0 / 2 ** lon_bits * _KM_PER_DEGREE * max(math.cos(math.radians(lat)), 1e-6)
+    return height, width
+
+
+def neighbors(geohash):
+    """The up to 8 cells around geohash (fewer at the poles)."""
+    lat_min, lat_max, lon_min, lon_max = bounding_box(geohash)
+    dlat, dlon = lat_max - lat_min, lon_max - lon_min
+    lat_c, lon_c = (lat_min + lat_max) / 2, (lon_min + lon_max) / 2
+    out = set()
+    for i in (-1, 0, 1):
+        for j in (-1, 0, 1):
+            lat = lat_c + i * dlat
+            if (i or j) and -90 < lat < 90:
+                lon = (lon_c + j * dlon + 180) % 360 - 180
+                out.add(encode(lat, lon, len(geohash)))
+    out.discard(geohash)
+    return sorted(out)
+
+
+def covering_prefixes(lat, lon, radius_km):
+    """Geohash prefixes whose cells together cover the circle (centre cell + neighbours).
+
+    Uses the longest prefix whose cells are at least radius_km on each side, but
+    never shorter than GEO_CELL_PRECISION (the index partition key).
+    """
+    precision = GEO_CELL_PRECISION
+    for p in range(GEOHASH_PRECISION, GEO_CELL_PRECISION - 1, -1):
+        height, width = cell_size_km(p, lat)
+        if height >= radius_km and width >= radius_km:
+            precision = p
+            break
+    center = encode(lat, lon, precision)
+    return [center] + neighbors(center)
+
+
+def clamp_radius(radius_km):
+    return max(0.1, min(float(radius_km), float(MAX_PROXIMITY_RADIUS_KM)))
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km; works element-wise on NumPy arrays."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def parse_coordinates(lat, lon):
+    """(lat, lon) as floats, or None if either is missing or out of range."""
+    try:
+        lat, lon = float(lat), float(lon)
+    except (TypeError, ValueError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return lat, lon
+
+
+def geo_attributes(lat, lon):
+    """Item attributes for a located record ({} when coordinates are missing/invalid)."""
+    coords = parse_coordinates(lat, lon)
+    if coords is None:
+        return {}
+    lat, lon = coords
+    geohash = encode(lat, lon)
+    return {
+        "lat": Decimal(str(round(lat, 6))),
+        "lon": Decimal(str(round(lon, 6))),
+        "geohash": geohash,
+        "geo_cell": geohash[:GEO_CELL_PRECISION],
+    }
+
+
+def item_geo_attributes(item):
+    """geo_attributes of a stored item's lat/lon (Decimal or float), for copying to derived records."""
+    return geo_attributes(item.get("lat"), item.get("lon")) if item else {}
+
+
+def within_radius(items, lat, lon, radius_km):
+    """Items (with lat/lon) inside radius_km of (lat, lon), nearest first, each with distance_km."""
+    located = [i for i in items if i.get("lat") is not None and i.get("lon") is not None]
+    if not located:
+        return []
+    distances = haversine_km(lat, lon, [i["lat"] for i in located], [i["lon"] for i in located])
+    order = np.argsort(distances, kind="stable")
+    return [
+        dict(located[k], distance_km=round(float(distances[k]), 2))
+        for k in order
+        if distances[k] <= radius_km
+    ]
@@ -0,0 +1,173 @@
+"""
+Unit-level inventory ledger.
+
+Every donation that reaches "Completed" adds one unit (id = donation id) with
+its collection date and expiry (collection + UNIT_SHELF_LIFE_DAYS). Scheduled
+donations are not stock. Units stay "available" until they are issued, expire
+or are discarded. Usable stock per group is a sharded counter updated in the
+same transaction as each unit write, so reads never rescan donation history.
+
+The sparse available_group-expires_on index orders each group's available
+units by expiry, like a per-group min-heap: its head gives first-expire-
+first-out picks, and the expired prefix is what the sweep marks "expired".
+The sweep runs once per day per process on a background thread, started by
+the first inventory read; reads never wait for it.
+Units of donations with coordinates keep the site's geohash, and the sparse
+available_cell-geohash-index holds them while available for proximity search.
+Each unit belongs to its donation's site and is counted in that site's counter
+as well as the network one. Check-in (checkin_service) puts or discards the
+unit in the donation's own transaction; the ledger's write for it is then a no-op.
+"""
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+from app.services.change_stream import REMOVE
+from app.services.geo import item_geo_attributes
+from app.services.database_service import (
+    put_inventory_unit,
+    set_unit_status,
+    query_usable_units,
+    query_expired_units,
+    iter_table_items,
+    site_of,
+)
+from config import BLOOD_GROUPS, UNIT_SHELF_LIFE_DAYS
+
+COLLECTED = "Completed"
+# How often the sweep thread checks whether a new day's sweep is due (and retries a failed one).
+SWEEP_CHECK_SECONDS = 300
+
+logger = logging.getLogger(__name__)
+
+
+def expiry_date(collected_on, shelf_life_days=UNIT_SHELF_LIFE_DAYS):
+    """YYYY-MM-DD on which a unit collected on collected_on expires (None if unparsable)."""
+    try:
+        day = datetime.strptime(str(collected_on)[:10], "%Y-%m-%d")
+    except ValueError:
+        return None
+    return (day + timedelta(days=shelf_life_days)).strftime("%Y-%m-%d")
+
+
+def _today():
+    return datetime.now().strftime("%Y-%m-%d")
+
+
+def _collected(donation):
+    return bool(donation and donation.get("status") == COLLECTED)
+
+
+def unit_for_donation(donation, shelf_life_days=UNIT_SHELF_LIFE_DAYS, today=None):
+    """The unit a completed donation adds to the ledger (None if it has no valid date or group)."""
+    expires_on = expiry_date(donation.get("date"), shelf_life_days)
+    if not expires_on or donation.get("blood_group") not in BLOOD_GROUPS:
+        return None
+    unit = {
+        "id": donation["id"],
+        "donation_id": donation["id"],
+        "donor_id": donation.get("donor_id"),
+        "blood_group": donation["blood_group"],
+        "collected_on": str(donation["date"])[:10],
+        "expires_on": expires_on,
+        "status": "expired",
+        "site_id": site_of(donation),
+    }
+    unit.update(item_geo_attributes(donation))
+    # Recorded after its expiry (late entry or backfill): never counts as stock.
+    if expires_on >= (today or _today()):
+        unit.update(status="available", available_group=donation["blood_group"])
+        if unit.get("geo_cell"):
+            unit["available_cell"] = unit["geo_cell"]
+    return unit
+
+
+class InventoryLedger:
+    """Keeps the unit table in step with donation status and sweeps expired units."""
+
+    name = "inventory_ledger"
+    tables = ("donations",)
+
+    def __init__(self, db, shelf_life_days=UNIT_SHELF_LIFE_DAYS):
+        self.db = db
+        self.shelf_life_days = shelf_life_days
+        self._swept_on = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def apply(self, event):
+        new = event.new_image if event.event_name != REMOVE else None
+        if _collected(new) and not _collected(event.old_image):
+            self.add_unit(new)
+        elif _collected(event.old_image) and not _collected(new):
+            # Collection was reverted: the unit leaves stock if it is still on the shelf.
+            unit = {
+                "id": event.old_image["id"],
+                "blood_group": event.old_image.get("blood_group"),
+                "site_id": site_of(event.old_image),
+            }
+            set_unit_status(self.db, unit, "discarded", "available")
+
+    def add_unit(self, donation):
+        """Create the unit for a completed donation (idempotent). Returns False if skipped."""
+        unit = unit_for_donation(donation, self.shelf_life_days)
+        if unit is None:
+            return False
+        return put_inventory_unit(self.db, unit)
+
+    def pick_units(self, blood_group, count, as_of=None):
+        """Up to `count` available units of blood_group, first to expire first (FEFO)."""
+        return query_usable_units(self.db, blood_group, as_of or _today(), limit=count)
+
+    def sweep_expired(self, as_of=None, batch_size=100):
+        """Mark every available unit that expired before as_of as "expired". Returns the count."""
+        as_of = as_of or _today()
+        swept = 0
+        for group in BLOOD_GROUPS:
+            while True:
+                units = query_expired_units(self.db, group, as_of, limit=batch_size)
+                for unit in units:
+                    if set_unit_status(self.db, unit, "expired", "available"):
+                        swept += 1
+                if len(units) < batch_size:
+                    break
+        return swept
+
+    def sweep_if_due(self):
+        """Make sure the daily sweep is running; starts its thread on first use and never waits for it."""
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="inventory-sweep", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            today = _today()
+            if self._swept_on != today:
+                try:
+                    swept = self.sweep_expired(today)
+                    self._swept_on = today
+                    logger.info("Inventory sweep for %s: %d unit(s) expired", today, swept)
+                except Exception:
+                    logger.exception("Inventory sweep failed")
+            time.sleep(SWEEP_CHECK_SECONDS)
+
+
+def register_inventory_ledger(db):
+    """Subscribe the ledger to donation events."""
+    ledger = InventoryLedger(db)
+    for table in ledger.tables:
+        db.events.subscribe(table, ledger.apply, name=ledger.name)
+    return ledger
+
+
+def rebuild_inventory_ledger(db):
+    """Add units for completed donations missing from the ledger. Returns the number added."""
+    ledger = InventoryLedger(db)
+    added = 0
+    for donation in iter_table_items(db, "donations"):
+        if _collected(donation) and ledger.add_unit(donation):
+            added += 1
+    return added
@@ -0,0 +1,339 @@
+"""
+Live updates for blood bank screens over Server-Sent Events.
+
+LiveFeed is shared by every open stream in a worker. Messages are built once
+and fanned out to the subscriber queues:
+  - "request": a request that joined, changed in or left a scope's pending
+    queue (its site's, or the network's); sent to that scope's streams.
+  - "inventory": usable units per group for each scope with listeners.
+  - "alert": shortage alerts. Levels are network-wide, so every stream gets
+    them, site streams included.
+
+The source is shared by all workers, not this process's change stream: one
+publisher thread polls the write counters in the "view_versions" stats item
+(one GetItem every LIVE_POLL_SECONDS, bumped by every worker's writes). When
+requests moved, it re-reads each listened scope's pending queue (its first
+LIVE_PENDING_LIMIT, one Query) and diffs it with the last read; when units
+moved, it reads each scope's counters (one BatchGetItem). Alerts come from the
+stats item ShortageMonitor keeps them in. Local changes wake the thread
+early; a burst of them settles for LIVE_MIN_INTERVAL_SECONDS into one round of
+reads, however many clients listen.
+
+Messages carry increasing ids and the last LIVE_HISTORY are kept, so a client
+reconnecting with Last-Event-ID gets what it missed. A subscriber that falls
+LIVE_QUEUE_SIZE messages behind is dropped; EventSource reconnects on its own.
+Each open stream holds a server thread, so a worker takes at most
+LIVE_MAX_SUBSCRIBERS of them (keep it below the worker's threads).
+"""
+import itertools
+import json
+import logging
+import queue
+import threading
+import time
+from collections import deque
+
+from app.models.request import BloodRequest
+from app.services.change_stream import INSERT, MODIFY, REMOVE
+from app.services.database_service import (
+    VIEW_VERSIONS,
+    get_blood_request_by_id,
+    get_pending_blood_requests,
+    get_site_pending_blood_requests,
+    get_stat_item,
+)
+from app.services.derived_views import inventory_view
+from app.services.shortage_alerts import SHORTAGE_ALERTS
+from config import (
+    BLOOD_GROUPS,
+    LIVE_MIN_INTERVAL_SECONDS,
+    LIVE_POLL_SECONDS,
+    LIVE_PENDING_LIMIT,
+    LIVE_HEARTBEAT_SECONDS,
+    LIVE_QUEUE_SIZE,
+    LIVE_HISTORY,
+    LIVE_MAX_SUBSCRIBERS,
+)
+
+logger = logging.getLogger(__name__)
+
+# Scope of network-wide subscribers and messages.
+NETWORK = None
+# Scope of messages for every subscriber, whatever its own scope.
+EVERYONE = "*"
+# Sent instead of a message when a subscriber is dropped.
+_CLOSED = object()
+
+
+def _pending(image):
+    return bool(image) and image.get("status") == "pending"
+
+
+def _sse(event_id, kind, data):
+    return f"id: {event_id}\nevent: {kind}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+class Subscription:
+    """One client's queue of encoded messages."""
+
+    def __init__(self, feed, site_id, queue_size):
+        self.feed = feed
+        self.site_id = site_id
+        self.queue = queue.Queue(maxsize=queue_size)
+
+    def offer(self, message):
+        """Queue a message; False when the client is too far behind."""
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except queue.Full:
+            return False
+
+    def stream(self, heartbeat_seconds=LIVE_HEARTBEAT_SECONDS):
+        """Generator of SSE text for the response body; unsubscribes when the client goes away."""
+        try:
+            yield f"retry: {int(heartbeat_seconds * 1000)}\n\n"
+            while True:
+                try:
+                    message = self.queue.get(timeout=heartbeat_seconds)
+                except queue.Empty:
+                    # Comment line: keeps proxies from closing an idle stream.
+                    yield ": keep-alive\n\n"
+                    continue
+                if message is _CLOSED:
+                    return
+                yield message
+        finally:
+            self.feed.unsubscribe(self)
+
+
+def _reaches(scopes, site_id):
+    return EVERYONE in scopes or site_id in scopes
+
+
+class LiveFeed:
+    """Fans request, inventory and alert changes from the shared tables out to SSE subscribers."""
+
+    name = "live_feed"
+    tables = ("blood_requests", "inventory_units")
+
+    def __init__(
+        self,
+        db,
+        min_interval=LIVE_MIN_INTERVAL_SECONDS,
+        poll_seconds=LIVE_POLL_SECONDS,
+        pending_limit=LIVE_PENDING_LIMIT,
+        queue_size=LIVE_QUEUE_SIZE,
+        history=LIVE_HISTORY,
+        max_subscribers=LIVE_MAX_SUBSCRIBERS,
+    ):
+        self.db = db
+        self.min_interval = min_interval
+        self.poll_seconds = poll_seconds
+        self.pending_limit = pending_limit
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self.published = 0
+        self.inventory_reads = 0
+        self.polls = 0
+        self._ids = itertools.count(1)
+        self._history = deque(maxlen=history)
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        # Publisher thread state: counters at the last poll, each scope's pending
+        # queue at its last read ({request id: image}), alert ids already sent.
+        self._versions = None
+        self._queues = {}
+        self._alerts_seen = None
+        self._thread = threading.Thread(target=self._run, name="live-feed", daemon=True)
+        self._thread.start()
+
+    # ----- change stream -----
+    def apply(self, event):
+        """A local write: poll now rather than at the next tick."""
+        self._wake.set()
+
+    def alert(self, alert):
+        """ShortageMonitor listener: alerts fired here go out at once (the poll skips them)."""
+        with self._lock:
+            if self._alerts_seen is not None:
+                self._alerts_seen.add(alert["id"])
+        self._publish("alert", alert, {EVERYONE})
+
+    # ----- polling -----
+    def _run(self):
+        while True:
+            if self._wake.wait(self.poll_seconds):
+                # Let a burst of local writes settle into one round of reads.
+                time.sleep(self.min_interval)
+            self._wake.clear()
+            try:
+                self._poll()
+            except Exception:
+                # Counters keep moving; the next round catches up.
+                logger.exception("Live feed poll failed")
+
+    def _poll(self):
+        with self._lock:
+            listening = {s.site_id for s in self._subscribers}
+        if not listening:
+            # Nobody to tell: start from a fresh read when someone subscribes.
+            self._versions, self._queues, self._alerts_seen = None, {}, None
+            return
+        self.polls += 1
+        versions = get_stat_item(self.db, VIEW_VERSIONS)
+        seen, self._versions = self._versions, versions
+        moved = {t for t in self.tables if seen is not None and versions.get(t) != seen.get(t)}
+        for scope in set(self._queues) - listening:
+            del self._queues[scope]
+        for scope in listening:
+            if scope not in self._queues or "blood_requests" in moved:
+                self._diff_queue(scope)
+        if "inventory_units" in moved:
+            for scope in listening:
+                self._publish_inventory(scope)
+        if seen is None or moved:
+            self._check_alerts()
+
+    def _diff_queue(self, scope):
+        """Read scope's pending queue and send what joined, changed or left since the last read."""
+        if scope is NETWORK:
+            current = get_pending_blood_requests(self.db, limit=self.pending_limit)
+        else:
+            current = get_site_pending_blood_requests(self.db, scope, limit=self.pending_limit)
+        if current.partial:
+            # A failed or cut-short read says nothing about what left the queue.
+            return
+        current = {r["id"]: r for r in current}
+        known, self._queues[scope] = self._queues.get(scope), current
+        if known is None:
+            return
+        for request_id, request in current.items():
+            old = known.get(request_id)
+            if old != request:
+                self._publish_request(scope, INSERT if old is None else MODIFY, request, old)
+        for request_id, old in known.items():
+            if request_id in current:
+                continue
+            request = get_blood_request_by_id(self.db, request_id)
+            if request and request.get("status") == "pending":
+                # Still pending, only pushed past the first pending_limit.
+                continue
+            self._publish_request(scope, MODIFY if request else REMOVE, request, old)
+
+    def _publish_request(self, scope, change, request, old):
+        self._publish(
+            "request",
+            {
+                "request": BloodRequest.to_serializable(request or old),
+                "change": change,
+                "previous_status": (old or {}).get("status"),
+                "pending": _pending(request),
+            },
+            {scope},
+        )
+
+    def _publish_inventory(self, scope):
+        try:
+            inventory = inventory_view(self.db, blood_groups=BLOOD_GROUPS, site_id=scope)
+        except Exception:
+            # The next unit change (or a reconnect) sends a fresh snapshot.
+            logger.exception("Live inventory update failed for %s", scope or "network")
+            return
+        self.inventory_reads += 1
+        self._publish("inventory", {"site_id": scope, "inventory": inventory}, {scope})
+
+    def _check_alerts(self):
+        """Send alerts fired by any worker since the last check, oldest first."""
+        alerts = get_stat_item(self.db, SHORTAGE_ALERTS).get("items") or []
+        with self._lock:
+            first, seen = self._alerts_seen is None, self._alerts_seen or set()
+            fresh = [a for a in reversed(alerts) if a.get("id") not in seen]
+            # The stored list is bounded, so ids older than it can be forgotten.
+            self._alerts_seen = {a.get("id") for a in alerts} | (seen - {a.get("id") for a in fresh})
+        if first:
+            return
+        for alert in fresh:
+            self._publish("alert", alert, {EVERYONE})
+
+    # ----- fan-out -----
+    def _publish(self, kind, data, scopes):
+        with self._lock:
+            event_id = next(self._ids)
+            message = _sse(event_id, kind, data)
+            self._history.append((event_id, scopes, message))
+            targets = [s for s in self._subscribers if _reaches(scopes, s.site_id)]
+            self.published += 1
+        for subscriber in targets:
+            if not subscriber.offer(message):
+                self._drop(subscriber)
+
+    def _drop(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+        # Make room for the close marker so the stream ends promptly.
+        try:
+            subscriber.queue.get_nowait()
+        except queue.Empty:
+            pass
+        subscriber.offer(_CLOSED)
+
+    def subscribe(self, site_id=NETWORK, last_event_id=None):
+        """Open a subscription (None when full). Replays missed messages after last_event_id,
+        else starts with the current inventory of its scope."""
+        subscriber = Subscription(self, site_id, self.queue_size)
+        try:
+            last_event_id = int(last_event_id)
+        except (TypeError, ValueError):
+            last_event_id = None
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                return None
+            self._subscribers.add(subscriber)
+            # Replay only if the history still reaches back to the client's last id
+            # (and the id is from this process's sequence).
+            replay = (
+                last_event_id is not None
+                and bool(self._history)
+                and self._history[0][0] <= last_event_id + 1
+                and last_event_id <= self._history[-1][0]
+            )
+            missed = [
+                m for i, scopes, m in self._history if replay and i > last_event_id and _reaches(scopes, site_id)
+            ]
+        # A new scope's pending queue is read on the next round.
+        self._wake.set()
+        if replay:
+            for message in missed[-self.queue_size:]:
+                subscriber.offer(message)
+        else:
+            inventory = inventory_view(self.db, blood_groups=BLOOD_GROUPS, site_id=site_id)
+            with self._lock:
+                message = _sse(next(self._ids), "inventory", {"site_id": site_id, "inventory": inventory})
+            subscriber.offer(message)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "subscribers": len(self._subscribers),
+                "max_subscribers": self.max_subscribers,
+                "published": self.published,
+                "inventory_reads": self.inventory_reads,
+                "polls": self.polls,
+            }
+
+
+def register_live_feed(db, shortage_monitor=None):
+    """Wake the feed on local request and unit events, and send this worker's shortage alerts at once."""
+    feed = LiveFeed(db)
+    for table in feed.tables:
+        db.events.subscribe(table, feed.apply, name=feed.name)
+    if shortage_monitor is not None:
+        shortage_monitor.add_listener(feed.alert)
+    return feed
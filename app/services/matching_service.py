@@ -1,15 +1,33 @@
 """
-Inventory and availability logic: inventory from donations, request availability.
+Inventory and availability logic: inventory from donations, request availability,
+allocation of inventory across pending requests, eligible compatible donors, and
+proximity search for stock and donors around a point, donor ranking for outreach.
 """
+import heapq
+import itertools
 from datetime import datetime
 
 from app.services.database_service import (
     get_db,
-    count_donations_by_blood_group_and_status,
     get_blood_requests_by_requester,
+    get_blood_request_by_id,
+    query_eligible_donors,
+    query_units_near,
+    query_donors_near,
+    query_requests_near,
     BLOOD_GROUPS,
 )
-from config import BLOOD_GROUPS as CONFIG_BLOOD_GROUPS
+from app.services.geo import covering_prefixes, clamp_radius, within_radius, parse_coordinates
+from app.services.donor_ranking import DonorFeatures, DonorRanker, group_scarcity
+from app.services.shortage_alerts import shortage_status
+from app.services.derived_views import inventory_view
+from app.services.compatibility import evaluate_availability, donor_groups_for, MODES
+from config import (
+    BLOOD_GROUPS as CONFIG_BLOOD_GROUPS,
+    AVAILABILITY_MODE,
+    DONOR_RANK_CANDIDATES,
+    DONOR_COUNT_MIN_RADIUS_KM,
+)
 from app.models.request import BloodRequest
 
 
@@ -19,37 +37,208 @@ BLOOD_GROUPS_LIST = CONFIG_BLOOD_GROUPS or [
 ]
 
 
+def _donor_counts(donors):
+    """Blood group -> number of donors; what callers without donor access see instead of the list."""
+    counts = {}
+    for d in donors:
+        counts[d.get("blood_group")] = counts.get(d.get("blood_group"), 0) + 1
+    return counts
+
+
 class MatchingService:
     """Inventory and request-availability; requires Flask app for DB."""
 
     def __init__(self, app):
         self.app = app
         self.db = get_db(app)
+        self.allocation = app.extensions.get("allocation")
+        self.ledger = app.extensions.get("inventory_ledger")
 
-    def get_inventory(self):
-        """Return dict blood_group -> units (from donations with status Scheduled/Completed)."""
-        return count_donations_by_blood_group_and_status(
-            self.db,
-            blood_groups=BLOOD_GROUPS_LIST,
-            statuses=["Scheduled", "Completed"],
-        )
+    def get_inventory(self, site_id=None):
+        """Return dict blood_group -> usable units (available, unexpired units in the ledger).
+
+        Network-wide by default; with site_id, only that site's stock.
+        """
+        if self.ledger:
+            self.ledger.sweep_if_due()
+        return inventory_view(self.db, blood_groups=BLOOD_GROUPS_LIST, site_id=site_id)
 
-    def get_recipient_requests_with_availability(self, requester_id):
-        """Return list of request dicts with available_units and is_available."""
+    def get_shortages(self, site_id=None):
+        """Supply-demand gap and shortage level per blood group, plus recent alerts (see shortage_alerts)."""
+        if self.ledger:
+            self.ledger.sweep_if_due()
+        return shortage_status(self.db, site_id=site_id)
+
+    def get_recipient_requests_with_availability(self, requester_id, mode=None):
+        """Return list of request dicts with available_units and is_available.
+
+        mode "compatible" counts every ABO/Rh-compatible group as supply; "exact"
+        only the requested group. Defaults to AVAILABILITY_MODE.
+        """
+        mode = mode if mode in MODES else AVAILABILITY_MODE
         inventory = self.get_inventory()
         requests = get_blood_requests_by_requester(self.db, requester_id, sort_timestamp=-1)
+        availability = evaluate_availability(requests, inventory, mode=mode)
+        allocations = self.get_allocation()["requests"]
+        extras = {
+            id(req): dict(a, match_mode=mode, **self.request_allocation(req, allocations))
+            for req, a in zip(requests, availability)
+        }
+        return BloodRequest.list_serializable(requests, extra_fn=lambda req: extras[id(req)])
+
+    def get_allocation(self):
+        """Allocation of current inventory across all pending requests (see allocation)."""
+        return self.allocation.snapshot()
+
+    @staticmethod
+    def request_allocation(req, allocations):
+        """allocated / allocated_units / allocated_from / queue_position for one request."""
+        return allocations.get(req.get("id")) or {
+            "allocated": False,
+            "allocated_units": 0,
+            "allocated_from": {},
+            "queue_position": None,
+        }
 
-        def extra(req):
-            bg = req.get("blood_group") or ""
-            units_val = req.get("units", 0)
-            try:
-                requested_units = int(units_val) if units_val else 0
-            except (TypeError, ValueError):
-                requested_units = 0
-            available_units = inventory.get(bg, 0)
-            return {
-                "available_units": available_units,
-                "is_available": available_units >= requested_units if requested_units > 0 else False,
+    def get_eligible_donors(self, blood_group, limit=10, mode=None, as_of=None):
+        """First `limit` donors who can give to blood_group today, longest-eligible first.
+
+        One bounded index Query per compatible donor group, merged by next eligible date.
+        """
+        mode = mode if mode in MODES else AVAILABILITY_MODE
+        as_of = as_of or datetime.now().strftime("%Y-%m-%d")
+        per_group = [
+            query_eligible_donors(self.db, group, as_of, limit=limit)
+            for group in donor_groups_for(blood_group, mode)
+        ]
+        merged = heapq.merge(*per_group, key=lambda d: d.get("next_eligible") or "")
+        return [
+            {
+                "donor_id": d.get("donor_id"),
+                "donor_name": d.get("donor_name", ""),
+                "blood_group": d.get("blood_group"),
+                "last_donation": d.get("last_donation"),
+                "next_eligible": d.get("next_eligible"),
             }
+            for d in itertools.islice(merged, limit)
+        ]
+
+    def find_nearby(
+        self, lat, lon, radius_km, blood_group=None, mode=None, limit=20,
+        include_requests=False, include_donors=False,
+    ):
+        """Compatible stock and eligible donors within radius_km of (lat, lon), nearest first.
+
+        Queries only the geohash cells around the point (see geo.covering_prefixes);
+        exact distances are computed for those candidates. Stock is grouped per
+        collection site. Without blood_group every group counts. include_requests
+        adds pending requests from hospitals in range. include_donors (blood banks)
+        lists donors with their distance; otherwise only donor_counts per blood group
+        are returned, over a radius of at least DONOR_COUNT_MIN_RADIUS_KM.
+        """
+        mode = mode if mode in MODES else AVAILABILITY_MODE
+        radius_km = clamp_radius(radius_km)
+        if not include_donors:
+            radius_km = clamp_radius(max(radius_km, DONOR_COUNT_MIN_RADIUS_KM))
+        today = datetime.now().strftime("%Y-%m-%d")
+        groups = set(donor_groups_for(blood_group, mode) if blood_group else BLOOD_GROUPS_LIST)
+        prefixes = covering_prefixes(lat, lon, radius_km)
+
+        units = query_units_near(self.db, prefixes)
+        usable = [u for u in units if u.get("blood_group") in groups and (u.get("expires_on") or "") >= today]
+        sites = {}
+        for unit in usable:
+            site = sites.setdefault(unit["geohash"], {
+                "lat": unit["lat"],
+                "lon": unit["lon"],
+                "units": 0,
+                "by_group": {},
+                "next_expiry": unit["expires_on"],
+            })
+            site["units"] += 1
+            site["by_group"][unit["blood_group"]] = site["by_group"].get(unit["blood_group"], 0) + 1
+            site["next_expiry"] = min(site["next_expiry"], unit["expires_on"])
+        stock = within_radius(list(sites.values()), lat, lon, radius_km)
+
+        candidates = query_donors_near(self.db, prefixes, today)
+        donors = within_radius([d for d in candidates if d.get("blood_group") in groups], lat, lon, radius_km)
+        result = {
+            "center": {"lat": lat, "lon": lon},
+            "radius_km": radius_km,
+            "blood_group": blood_group,
+            "match_mode": mode,
+            "stock": stock[:limit],
+            "stock_units": sum(s["units"] for s in stock),
+            "donor_counts": _donor_counts(donors),
+            "partial": units.partial or candidates.partial,
+        }
+        if include_donors:
+            result["donors"] = [
+                {
+                    "donor_id": d.get("donor_id"),
+                    "donor_name": d.get("donor_name", ""),
+                    "blood_group": d.get("blood_group"),
+                    "next_eligible": d.get("next_eligible"),
+                    "distance_km": d["distance_km"],
+                }
+                for d in donors[:limit]
+            ]
+        if include_requests:
+            requests = query_requests_near(self.db, prefixes)
+            result["requests"] = [
+                BloodRequest.to_serializable(r, {"distance_km": r["distance_km"]})
+                for r in within_radius(requests, lat, lon, radius_km)[:limit]
+            ]
+        return result
 
-        return BloodRequest.list_serializable(requests, extra_fn=extra)
+    def get_blood_request(self, request_id):
+        return get_blood_request_by_id(self.db, request_id)
+
+    def get_eligible_donors_for_request(self, blood_request, limit=10, mode=None):
+        """Eligible compatible donors for a blood request dict."""
+        return self.get_eligible_donors(blood_request.get("blood_group"), limit=limit, mode=mode)
+
+    def rank_donors_for_request(self, blood_request, limit=10, mode=None, weights=None, include_donors=False):
+        """Eligible compatible donors for a request, best outreach targets first.
+
+        Candidates are read per compatible donor group (up to DONOR_RANK_CANDIDATES
+        each) and scored together by DonorRanker: distance to the hospital, time
+        since last donation, show-up rate and group scarcity. Without include_donors
+        (blood banks) only donor_counts per blood group of the top candidates are returned.
+        """
+        mode = mode if mode in MODES else AVAILABILITY_MODE
+        as_of = datetime.now().strftime("%Y-%m-%d")
+        candidates = []
+        partial = False
+        for group in donor_groups_for(blood_request.get("blood_group"), mode):
+            donors = query_eligible_donors(self.db, group, as_of, limit=DONOR_RANK_CANDIDATES)
+            candidates.extend(donors)
+            partial = partial or donors.partial
+        ranked = DonorRanker(weights).top_k(
+            DonorFeatures(candidates),
+            limit,
+            origin=parse_coordinates(blood_request.get("lat"), blood_request.get("lon")),
+            scarcity=group_scarcity(self.get_allocation()),
+            as_of=as_of,
+        )
+        result = {
+            "match_mode": mode,
+            "candidates": len(candidates),
+            "partial": partial,
+            "donor_counts": _donor_counts(d for d, _, _, _ in ranked),
+        }
+        if include_donors:
+            result["donors"] = [
+                {
+                    "donor_id": d.get("donor_id"),
+                    "donor_name": d.get("donor_name", ""),
+                    "blood_group": d.get("blood_group"),
+                    "last_donation": d.get("last_donation"),
+                    "next_eligible": d.get("next_eligible"),
+                    "distance_km": distance,
+                    "score": round(score, 4),
+                    "components": parts,
+                }
+                for d, score, parts, distance in ranked
+            ]
+        return result
@@ -0,0 +1,322 @@
+"""
+Donor notifications for new blood requests, delivered through an outbox.
+
+create_blood_request writes an outbox entry in the same transaction as the
+request, so a request is never stored without its notification (and the
+request path never waits on mail). NotificationDispatcher drains the outbox
+with a small pool of worker threads, woken by blood request INSERT events and,
+as a fallback, every NOTIFY_POLL_SECONDS:
+
+  1. claim: a conditional update bumps the entry's attempts and pushes its due_at
+     forward as a lease, so exactly one worker holds it; if that worker dies the
+     lease runs out and another picks the entry up.
+  2. recipients: eligible donors of compatible groups near the hospital (see
+     resolve_recipients), resolved once and stored on the entry so retries send
+     to the same list.
+  3. send: NOTIFY_BATCH_SIZE recipients per message, throttled to
+     NOTIFY_RATE_PER_SECOND recipients per second across workers; progress is
+     recorded after every batch so a retry resumes where delivery stopped.
+  4. finish: the entry leaves the pending index as "sent", or is retried with
+     exponential backoff and ends as "failed" after NOTIFY_MAX_ATTEMPTS.
+
+Delivery is at least once: a batch sent just before a crash is sent again.
+
+Channels are pluggable (NOTIFY_CHANNEL in config):
+  - "local": keeps messages in memory and logs them (development, tests).
+  - "smtp": one SMTP session per batch, recipients in the envelope only.
+"""
+import heapq
+import logging
+import smtplib
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+
+from app.services.change_stream import INSERT
+from app.services.compatibility import donor_groups_for
+from app.services.database_service import (
+    claim_notification,
+    finish_notification,
+    get_users_by_ids,
+    query_donors_near,
+    query_due_notifications,
+    query_eligible_donors,
+    record_notification_progress,
+    retry_notification,
+)
+from app.services.geo import clamp_radius, covering_prefixes, parse_coordinates, within_radius
+from app.services.reconciler import CapacityThrottle
+from config import (
+    AVAILABILITY_MODE,
+    NOTIFY_CHANNEL,
+    NOTIFY_WORKERS,
+    NOTIFY_BATCH_SIZE,
+    NOTIFY_RATE_PER_SECOND,
+    NOTIFY_MAX_ATTEMPTS,
+    NOTIFY_RETRY_BASE_SECONDS,
+    NOTIFY_LEASE_SECONDS,
+    NOTIFY_POLL_SECONDS,
+    NOTIFY_RADIUS_KM,
+    NOTIFY_MAX_DONORS,
+    SMTP_HOST,
+    SMTP_PORT,
+    SMTP_USERNAME,
+    SMTP_PASSWORD,
+    SMTP_SENDER,
+    SMTP_USE_TLS,
+)
+
+logger = logging.getLogger(__name__)
+
+SENT = "sent"
+FAILED = "failed"
+# Messages the local channel keeps for inspection.
+LOCAL_OUTBOX_SIZE = 1000
+
+
+def _iso(moment):
+    return moment.isoformat() + "Z"
+
+
+class LocalChannel:
+    """Stand-in channel: records messages in memory instead of sending them."""
+
+    name = "local"
+
+    def __init__(self, keep=LOCAL_OUTBOX_SIZE):
+        self.sent = deque(maxlen=keep)
+        self._lock = threading.Lock()
+
+    def send(self, recipients, subject, body):
+        with self._lock:
+            self.sent.append({"to": list(recipients), "subject": subject, "body": body})
+        logger.info("Notification to %d recipient(s): %s", len(recipients), subject)
+
+
+class SmtpChannel:
+    """Sends each batch as one message; recipients are envelope-only, so donors never see each other."""
+
+    name = "smtp"
+
+    def __init__(self, host=SMTP_HOST, port=SMTP_PORT, username=SMTP_USERNAME, password=SMTP_PASSWORD,
+                 sender=SMTP_SENDER, use_tls=SMTP_USE_TLS, timeout=10):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.sender = sender
+        self.use_tls = use_tls
+        self.timeout = timeout
+
+    def send(self, recipients, subject, body):
+        message = EmailMessage()
+        message["From"] = self.sender
+        message["To"] = self.sender
+        message["Subject"] = subject
+        message.set_content(body)
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            if self.use_tls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password)
+            refused = smtp.send_message(message, to_addrs=list(recipients))
+        if refused:
+            # Individual bad addresses are not retried; the rest were accepted.
+            logger.warning("SMTP refused %d of %d recipient(s)", len(refused), len(recipients))
+
+
+def build_channel(kind="local"):
+    """Return the configured channel implementation."""
+    if kind == "local":
+        return LocalChannel()
+    if kind == "smtp":
+        return SmtpChannel()
+    raise ValueError(f"Unknown notification channel: {kind}")
+
+
+def resolve_recipients(db, entry, radius_km=NOTIFY_RADIUS_KM, max_donors=NOTIFY_MAX_DONORS, as_of=None):
+    """Donor ids to notify for an outbox entry (never the requester).
+
+    With hospital coordinates: donors eligible today, of a compatible group,
+    within radius_km, nearest first. Without: the longest-eligible compatible
+    donors (one bounded index Query per group).
+    """
+    as_of = as_of or datetime.now().strftime("%Y-%m-%d")
+    groups = donor_groups_for(entry.get("blood_group"), AVAILABILITY_MODE)
+    coords = parse_coordinates(entry.get("lat"), entry.get("lon"))
+    if coords is not None:
+        radius_km = clamp_radius(radius_km)
+        candidates = query_donors_near(db, covering_prefixes(coords[0], coords[1], radius_km), as_of)
+        donors = within_radius([d for d in candidates if d.get("blood_group") in groups], coords[0], coords[1], radius_km)
+    else:
+        per_group = [query_eligible_donors(db, group, as_of, limit=max_donors + 1) for group in groups]
+        donors = heapq.merge(*per_group, key=lambda d: d.get("next_eligible") or "")
+    ids = []
+    for donor in donors:
+        if donor.get("donor_id") and donor["donor_id"] != entry.get("requester_id"):
+            ids.append(donor["donor_id"])
+            if len(ids) >= max_donors:
+                break
+    return ids
+
+
+def render_message(entry):
+    """(subject, body) of the notification for an outbox entry."""
+    urgency = (entry.get("urgency") or "routine").capitalize()
+    subject = f"{urgency}: {entry.get('blood_group')} blood needed at {entry.get('hospital') or 'a nearby hospital'}"
+    body = (
+        f"A patient at {entry.get('hospital') or 'a nearby hospital'} needs {entry.get('units', 1)} unit(s) "
+        f"of blood that you can give ({entry.get('blood_group')} recipient, urgency: {urgency.lower()}).\n\n"
+        "You are eligible to donate today. If you can help, please schedule a donation "
+        "in Blood Bridge or contact the hospital's blood bank.\n\n"
+        "You are receiving this because you are a registered Blood Bridge donor."
+    )
+    return subject, body
+
+
+class NotificationDispatcher:
+    """Worker pool draining the notification outbox through a channel."""
+
+    name = "notification_outbox"
+    tables = ("blood_requests",)
+
+    def __init__(
+        self,
+        db,
+        channel,
+        workers=NOTIFY_WORKERS,
+        batch_size=NOTIFY_BATCH_SIZE,
+        rate_per_second=NOTIFY_RATE_PER_SECOND,
+        max_attempts=NOTIFY_MAX_ATTEMPTS,
+        retry_base_seconds=NOTIFY_RETRY_BASE_SECONDS,
+        lease_seconds=NOTIFY_LEASE_SECONDS,
+        poll_seconds=NOTIFY_POLL_SECONDS,
+        radius_km=NOTIFY_RADIUS_KM,
+        max_donors=NOTIFY_MAX_DONORS,
+    ):
+        self.db = db
+        self.channel = channel
+        self.batch_size = max(1, batch_size)
+        self.throttle = CapacityThrottle(rate_per_second)
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.lease_seconds = lease_seconds
+        self.poll_seconds = poll_seconds
+        self.radius_km = radius_km
+        self.max_donors = max_donors
+        self.counts = {SENT: 0, FAILED: 0, "retried": 0, "messages": 0, "recipients": 0}
+        self._counts_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        for i in range(max(0, workers)):
+            t = threading.Thread(target=self._run, name=f"notifications-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def apply(self, event):
+        """Change-stream hook: a new request means there is probably an entry to deliver."""
+        if event.event_name == INSERT and (event.new_image or {}).get("status") == "pending":
+            self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                handled = self.drain_once()
+            except Exception:
+                logger.exception("Notification worker failed")
+                handled = 0
+            if not handled:
+                self._wake.wait(self.poll_seconds)
+                self._wake.clear()
+
+    def _count(self, key, n=1):
+        with self._counts_lock:
+            self.counts[key] += n
+
+    def drain_once(self, now=None):
+        """Claim and deliver the entries due now; returns how many this call handled."""
+        now = now or datetime.utcnow()
+        handled = 0
+        for entry in query_due_notifications(self.db, _iso(now), self.batch_size):
+            claimed = claim_notification(
+                self.db, entry["id"], entry.get("attempts", 0), _iso(now), self._lease(now)
+            )
+            if claimed:
+                self.deliver(claimed)
+                handled += 1
+        return handled
+
+    def drain(self, max_rounds=100):
+        """Deliver everything due (scripts, tests); returns the number of entries handled."""
+        total = 0
+        for _ in range(max_rounds):
+            handled = self.drain_once()
+            if not handled:
+                break
+            total += handled
+        return total
+
+    def _lease(self, now=None):
+        return _iso((now or datetime.utcnow()) + timedelta(seconds=self.lease_seconds))
+
+    def deliver(self, entry):
+        """Send a claimed entry's remaining batches, then finish or schedule a retry."""
+        entry_id, attempts = entry["id"], entry["attempts"]
+        try:
+            recipient_ids = entry.get("recipient_ids")
+            if recipient_ids is None:
+                recipient_ids = resolve_recipients(self.db, entry, self.radius_km, self.max_donors)
+                if not record_notification_progress(
+                    self.db, entry_id, attempts, self._lease(), entry.get("delivered", 0), recipient_ids
+                ):
+                    return
+            subject, body = render_message(entry)
+            delivered = int(entry.get("delivered", 0))
+            while delivered < len(recipient_ids):
+                batch_ids = recipient_ids[delivered:delivered + self.batch_size]
+                users = get_users_by_ids(self.db, batch_ids)
+                emails = [users[u]["email"] for u in batch_ids if users.get(u, {}).get("email")]
+                if emails:
+                    self.throttle.consume(len(emails))
+                    self.channel.send(emails, subject, body)
+                    self._count("messages")
+                    self._count("recipients", len(emails))
+                delivered += len(batch_ids)
+                if not record_notification_progress(self.db, entry_id, attempts, self._lease(), delivered):
+                    # Lease lost (took longer than NOTIFY_LEASE_SECONDS); the new holder resumes.
+                    return
+            if finish_notification(self.db, entry_id, attempts, SENT, _iso(datetime.utcnow())):
+                self._count(SENT)
+        except Exception as e:
+            self._fail(entry_id, attempts, e)
+
+    def _fail(self, entry_id, attempts, error):
+        message = f"{type(error).__name__}: {error}"
+        if attempts >= self.max_attempts:
+            logger.error("Notification %s failed after %d attempt(s): %s", entry_id, attempts, message)
+            if finish_notification(self.db, entry_id, attempts, FAILED, _iso(datetime.utcnow()), message):
+                self._count(FAILED)
+            return
+        delay = self.retry_base_seconds * 2 ** (attempts - 1)
+        logger.warning("Notification %s attempt %d failed (%s); retrying in %ss", entry_id, attempts, message, delay)
+        due_at = _iso(datetime.utcnow() + timedelta(seconds=delay))
+        if retry_notification(self.db, entry_id, attempts, due_at, message):
+            self._count("retried")
+
+    def snapshot(self):
+        with self._counts_lock:
+            return dict(self.counts, channel=self.channel.name, workers=len(self._threads))
+
+    def close(self):
+        self._stop.set()
+        self._wake.set()
+
+
+def register_notifications(db, channel=None, **kwargs):
+    """Start the outbox workers and wake them on blood request events."""
+    dispatcher = NotificationDispatcher(db, channel or build_channel(NOTIFY_CHANNEL), **kwargs)
+    for table in dispatcher.tables:
+        db.events.subscribe(table, dispatcher.apply, name=dispatcher.name)
+    return dispatcher
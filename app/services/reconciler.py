@@ -0,0 +1,193 @@
+"""
+Reconciler for derived views.
+
+Recomputes ground truth by parallel-scanning the source tables and folding every
+item through the same view logic into memory, diffs it against the stats table,
+and repairs drifted values with conditional writes. Scans are throttled to a
+read-capacity budget so the job can run alongside production traffic.
+
+Writes keep landing while it runs, so a difference is not necessarily drift:
+  - the stats are read before the source scan, and a repair only applies if the
+    value is still the one that was read (a counter the stream moved meanwhile
+    is left alone);
+  - an event can be in the source table but not yet in the stats (still on the
+    stream). A difference is only repaired when the previous run saw the same
+    one (same stored and expected values); runs keep the differences they left
+    unrepaired in a stats item (PENDING_DRIFT) for the next run to confirm.
+"""
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.services.change_stream import ChangeEvent, INSERT
+from app.services.database_service import (
+    scan_segment,
+    set_stat_attribute_if,
+    get_stat_item,
+    put_stat_item,
+)
+from app.services.derived_views import MemorySink, default_views
+from config import (
+    RECONCILE_READ_CAPACITY_PER_SECOND,
+    RECONCILE_SEGMENTS,
+    RECONCILE_PAGE_SIZE,
+)
+
+_META_ATTRIBUTES = ("id", "version")
+# Stats item with the fingerprints of the drift the last run left unrepaired.
+PENDING_DRIFT = "reconcile_pending"
+# Fingerprints kept (items are limited to 400 KB).
+MAX_PENDING_DRIFT = 5000
+
+
+def _fingerprint(entry):
+    raw = json.dumps([entry["item"], entry["attribute"], entry["stored"], entry["expected"]], default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+
+class CapacityThrottle:
+    """Read-capacity budget shared by all scan segments (units per second).
+
+    Callers report what each page consumed; the throttle sleeps long enough to
+    keep the running average under the budget.
+    """
+
+    def __init__(self, units_per_second):
+        self.rate = float(units_per_second)
+        self.consumed = 0.0
+        self._available = self.rate
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, units):
+        with self._lock:
+            now = time.monotonic()
+            self._available = min(self.rate, self._available + (now - self._last) * self.rate)
+            self._last = now
+            self._available -= units
+            self.consumed += units
+            wait = -self._available / self.rate if self._available < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+
+
+class Reconciler:
+    """Diff and repair derived views against ground truth."""
+
+    def __init__(
+        self,
+        db,
+        views=None,
+        read_capacity_per_second=RECONCILE_READ_CAPACITY_PER_SECOND,
+        segments=RECONCILE_SEGMENTS,
+        page_size=RECONCILE_PAGE_SIZE,
+    ):
+        self.db = db
+        self.views = default_views() if views is None else views
+        self.throttle = CapacityThrottle(read_capacity_per_second)
+        self.segments = max(1, segments)
+        self.page_size = page_size
+        self._apply_lock = threading.Lock()
+
+    def _owns(self, item_id):
+        return any(item_id == v.item_id or item_id.startswith(v.item_id + "#") for v in self.views)
+
+    def _scan(self, table, on_page):
+        """Parallel scan of db.<table>; on_page(items) is called for every page."""
+
+        def run(segment):
+            for items, units in scan_segment(self.db, table, segment, self.segments, self.page_size):
+                on_page(items)
+                self.throttle.consume(units)
+
+        with ThreadPoolExecutor(max_workers=self.segments, thread_name_prefix=f"reconcile-{table}") as pool:
+            for future in [pool.submit(run, s) for s in range(self.segments)]:
+                future.result()
+
+    def compute_ground_truth(self):
+        """Return a MemorySink holding every view recomputed from the source tables."""
+        sink = MemorySink()
+        tables = []
+        for view in self.views:
+            tables.extend(t for t in view.tables if t not in tables)
+        for table in tables:
+            subscribed = [v for v in self.views if table in v.tables]
+
+            def on_page(items, table=table, subscribed=subscribed):
+                # Scans run in parallel; folding into the views is serialized.
+                with self._apply_lock:
+                    for item in items:
+                        event = ChangeEvent(table, INSERT, new_image=item)
+                        for view in subscribed:
+                            view.apply(sink, event)
+
+            self._scan(table, on_page)
+        return sink
+
+    def read_stored(self):
+        """Return {item_id: item} for every stats item owned by a view."""
+        stored = {}
+
+        def on_page(items):
+            with self._apply_lock:
+                stored.update((i["id"], i) for i in items if self._owns(i["id"]))
+
+        self._scan("stats", on_page)
+        return stored
+
+    @staticmethod
+    def diff(truth, stored):
+        """Return drift entries {item, attribute, stored, expected} (None = attribute absent)."""
+        drift = []
+        for item_id in sorted(set(truth) | set(stored)):
+            expected_item = truth.get(item_id, {})
+            stored_item = stored.get(item_id, {})
+            attributes = (set(expected_item) | set(stored_item)) - set(_META_ATTRIBUTES)
+            for attribute in sorted(attributes):
+                expected = expected_item.get(attribute)
+                observed = stored_item.get(attribute)
+                if isinstance(expected, list) or isinstance(observed, list):
+                    if (expected or []) != (observed or []):
+                        drift.append({"item": item_id, "attribute": attribute, "stored": observed, "expected": expected or []})
+                elif (expected or 0) != (observed or 0):
+                    drift.append({"item": item_id, "attribute": attribute, "stored": observed, "expected": expected or 0})
+        return drift
+
+    def repair(self, entry, stored):
+        """Apply one drift entry with a conditional write; False if it changed meanwhile."""
+        if isinstance(entry["expected"], list):
+            version = stored.get(entry["item"], {}).get("version")
+            item = {"id": entry["item"], entry["attribute"]: entry["expected"]}
+            return put_stat_item(self.db, item, version)
+        return set_stat_attribute_if(
+            self.db, entry["item"], entry["attribute"], entry["expected"], entry["stored"]
+        )
+
+    def run(self, repair=True):
+        """Recompute, diff and (optionally) repair confirmed drift. Returns a drift report."""
+        started = time.monotonic()
+        # Stored values first: what the stream applies during the scan then only makes
+        # the conditional repairs fail, never turns a good counter into a stale one.
+        stored = self.read_stored()
+        truth = self.compute_ground_truth().items
+        drift = self.diff(truth, stored)
+        pending = get_stat_item(self.db, PENDING_DRIFT)
+        seen = set(pending.get("drift") or [])
+        for entry in drift:
+            entry["confirmed"] = _fingerprint(entry) in seen
+            entry["repaired"] = self.repair(entry, stored) if repair and entry["confirmed"] else False
+        if repair:
+            unrepaired = [_fingerprint(e) for e in drift if not e["repaired"]][:MAX_PENDING_DRIFT]
+            # Lost to a concurrent run: that run keeps its own, equally good, list.
+            put_stat_item(self.db, {"id": PENDING_DRIFT, "drift": unrepaired}, pending.get("version"))
+        return {
+            "items_checked": len(set(truth) | set(stored)),
+            "drift": drift,
+            "drifted": len(drift),
+            "confirmed": sum(1 for e in drift if e["confirmed"]),
+            "repaired": sum(1 for e in drift if e["repaired"]),
+            "read_capacity_used": round(self.throttle.consumed, 1),
+            "duration_seconds": round(time.monotonic() - started, 2),
+        }
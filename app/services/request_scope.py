@@ -0,0 +1,62 @@
+"""
+Values computed once per request and reused by everything that handles it.
+
+A RequestScope lives on flask.g. A plain request gets its own on first use; the
+sub-requests of one /api/batch call share the batch's (see batch), so the
+signed-in user, for instance, is read once for all of them. Each key is
+computed by the first caller; concurrent callers of the same key wait for it.
+"""
+import threading
+
+from flask import g, has_app_context
+
+from app.services.database_service import find_user_by_id
+
+
+class RequestScope:
+    """Memo of computed values, safe to share between the threads of one batch."""
+
+    def __init__(self):
+        self._values = {}
+        self._key_locks = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, compute):
+        """Value of key, computing it with compute() the first time."""
+        with self._lock:
+            if key in self._values:
+                return self._values[key]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            with self._lock:
+                if key in self._values:
+                    return self._values[key]
+            value = compute()
+            with self._lock:
+                self._values[key] = value
+            return value
+
+    def clear(self):
+        """Forget every value (after a write that may have changed them)."""
+        with self._lock:
+            self._values.clear()
+
+
+def current_scope():
+    """Scope of the current request (created on first use), or None outside a request."""
+    if not has_app_context():
+        return None
+    if g.get("request_scope") is None:
+        g.request_scope = RequestScope()
+    return g.request_scope
+
+
+def scoped(key, compute):
+    """compute() once per request (or batch) for key."""
+    scope = current_scope()
+    return scope.get(key, compute) if scope else compute()
+
+
+def session_user(db, user_id):
+    """The signed-in user's item, read once per request (or batch)."""
+    return scoped(("user", user_id), lambda: find_user_by_id(db, user_id))
@@ -0,0 +1,276 @@
+"""
+Resilience for DynamoDB calls: adaptive client-side rate limiting, jittered
+retries bounded by a latency budget, and a per-table circuit breaker.
+All table access goes through DynamoDBCallGuard (see dynamodb_client).
+"""
+import random
+import threading
+import time
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+# Error codes that mean "slow down": shrink the client-side rate and retry.
+THROTTLE_ERROR_CODES = {
+    "ProvisionedThroughputExceededException",
+    "ThrottlingException",
+    "RequestLimitExceeded",
+    "TransactionInProgressException",
+}
+# Error codes that mean "try again": server-side blips.
+TRANSIENT_ERROR_CODES = {
+    "InternalServerError",
+    "InternalFailure",
+    "ServiceUnavailable",
+}
+
+# Table methods routed through the guard by GuardedTable.
+GUARDED_METHODS = ("get_item", "put_item", "update_item", "delete_item", "query", "scan")
+
+
+class DatabaseUnavailable(Exception):
+    """A DynamoDB call failed fast (circuit open) or exhausted its retry budget."""
+
+    def __init__(self, table, message):
+        super().__init__(f"{table}: {message}")
+        self.table = table
+        self.message = message
+
+
+class AdaptiveRateLimiter:
+    """Token bucket whose rate adapts to throttling (AIMD).
+
+    Rate is halved on every throttle and grows additively on success, so a
+    worker backs off together with DynamoDB instead of hammering it.
+    """
+
+    def __init__(self, initial_rate, min_rate, max_rate, increase=1.0):
+        self.rate = float(initial_rate)
+        self.min_rate = float(min_rate)
+        self.max_rate = float(max_rate)
+        self.increase = float(increase)
+        self._tokens = self.rate
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.rate, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self, timeout=None):
+        """Take one token, waiting at most timeout seconds. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_throttle(self):
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._tokens = min(self._tokens, self.rate)
+
+
+class CircuitBreaker:
+    """Closed -> open after N consecutive failures; half-open after reset_timeout lets one probe through."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.opened_at = None
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+    def snapshot(self):
+        with self._lock:
+            out = {"state": self.state, "consecutive_failures": self.failures}
+            if self.state == self.OPEN:
+                out["retry_in_seconds"] = round(
+                    max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at)), 1
+                )
+            return out
+
+
+class DynamoDBCallGuard:
+    """Central wrapper for every DynamoDB call: one rate limiter and one breaker per table."""
+
+    def __init__(
+        self,
+        max_attempts=4,
+        retry_budget_ms=2000,
+        retry_base_ms=25,
+        breaker_failure_threshold=5,
+        breaker_reset_seconds=30,
+        rate_initial=200,
+        rate_min=5,
+        rate_max=1000,
+        deadline_fn=None,
+    ):
+        self.max_attempts = max(1, int(max_attempts))
+        self.retry_budget = retry_budget_ms / 1000.0
+        self.retry_base = retry_base_ms / 1000.0
+        self._breaker_args = (breaker_failure_threshold, breaker_reset_seconds)
+        self._limiter_args = (rate_initial, rate_min, rate_max)
+        # Optional callable returning seconds left for the caller (request deadline) or None.
+        self.deadline_fn = deadline_fn
+        self._breakers = {}
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    def _state_for(self, table):
+        with self._lock:
+            if table not in self._breakers:
+                self._breakers[table] = CircuitBreaker(*self._breaker_args)
+                self._limiters[table] = AdaptiveRateLimiter(*self._limiter_args)
+            return self._breakers[table], self._limiters[table]
+
+    def budget_end(self):
+        """Monotonic time retries must finish by: the retry budget, or the request deadline if sooner."""
+        budget = self.retry_budget
+        if self.deadline_fn is not None:
+            remaining = self.deadline_fn()
+            if remaining is not None:
+                budget = min(budget, remaining)
+        return time.monotonic() + budget
+
+    def backoff(self, attempt, budget_end):
+        """Sleep a jittered exponential delay after attempt (1-based) failed.
+
+        Returns False, without sleeping, when attempts are used up or the delay would pass budget_end.
+        """
+        delay = random.uniform(0, self.retry_base * (2 ** attempt))
+        if attempt >= self.max_attempts or time.monotonic() + delay >= budget_end:
+            return False
+        time.sleep(delay)
+        return True
+
+    def call(self, table, operation, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) for table with rate limiting, retries and breaker.
+
+        Non-retryable client errors (validation, conditional check) propagate unchanged.
+        Raises DatabaseUnavailable when the breaker is open or the budget is spent.
+        """
+        breaker, limiter = self._state_for(table)
+        budget_end = self.budget_end()
+        attempt = 0
+        while True:
+            attempt += 1
+            # Take the token first: allow() claims the half-open probe, and a probe
+            # abandoned on a limiter timeout would leave the breaker half-open for good.
+            if not limiter.acquire(timeout=max(0.0, budget_end - time.monotonic())):
+                raise DatabaseUnavailable(table, "rate limit wait exceeds latency budget")
+            if not breaker.allow():
+                raise DatabaseUnavailable(table, "circuit open, failing fast")
+            # Every attempt reports to the breaker, whatever it raises: a half-open
+            # probe that ended without a verdict would keep the breaker half-open.
+            recorded = False
+            try:
+                result = fn(*args, **kwargs)
+            except ClientError as e:
+                code = e.response.get("Error", {}).get("Code", "")
+                if code in THROTTLE_ERROR_CODES:
+                    # Throttling is back-pressure, not an outage: slow down, keep the breaker closed.
+                    limiter.on_throttle()
+                    breaker.record_success()
+                elif code in TRANSIENT_ERROR_CODES:
+                    breaker.record_failure()
+                else:
+                    # The table answered; the request itself was wrong.
+                    breaker.record_success()
+                    recorded = True
+                    raise
+                recorded = True
+                error = e
+            except BotoCoreError as e:
+                breaker.record_failure()
+                recorded = True
+                error = e
+            else:
+                limiter.on_success()
+                breaker.record_success()
+                recorded = True
+                return result
+            finally:
+                if not recorded:
+                    breaker.record_failure()
+
+            if not self.backoff(attempt, budget_end):
+                raise DatabaseUnavailable(
+                    table, f"{operation} failed after {attempt} attempt(s): {error}"
+                ) from error
+
+    def snapshot(self):
+        """Per-table breaker state and current client-side rate, for /api/health."""
+        with self._lock:
+            tables = list(self._breakers)
+        out = {}
+        for table in tables:
+            breaker, limiter = self._state_for(table)
+            out[table] = dict(breaker.snapshot(), rate_per_second=round(limiter.rate, 1))
+        return out
+
+    def any_open(self):
+        return any(s["state"] != CircuitBreaker.CLOSED for s in self.snapshot().values())
+
+
+class GuardedTable:
+    """Proxy for a boto3 Table resource; data-plane methods go through the guard."""
+
+    def __init__(self, table, guard):
+        self._table = table
+        self._guard = guard
+
+    def __getattr__(self, name):
+        attr = getattr(self._table, name)
+        if name not in GUARDED_METHODS:
+            return attr
+
+        def guarded(*args, **kwargs):
+            return self._guard.call(self._table.name, name, attr, *args, **kwargs)
+
+        return guarded
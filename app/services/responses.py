@@ -0,0 +1,51 @@
+"""
+API responses: the {"success", "message", "data"} envelope, shared by every blueprint.
+
+The body format is negotiated from the Accept header: JSON by default (and for
+*/*), MessagePack for clients that ask for application/msgpack (kiosks, mobile
+apps). Both carry the same envelope; values JSON cannot hold natively (dates,
+Decimals) are converted the same way for both. Responses say Vary: Accept.
+Streamed list exports stay JSON (see streaming).
+"""
+import msgpack
+from flask import current_app, has_request_context, request
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+# Earlier types win ties, so */* gets JSON.
+_OFFERED = (JSON, MSGPACK, "application/x-msgpack")
+
+
+def response_format():
+    """Media type of the current request's responses (JSON outside a request)."""
+    if not has_request_context():
+        return JSON
+    best = request.accept_mimetypes.best_match(_OFFERED, default=JSON)
+    return JSON if best == JSON else MSGPACK
+
+
+def envelope(success, message, data=None):
+    out = {"success": success, "message": message}
+    if data is not None:
+        out["data"] = data
+    return out
+
+
+def encode(payload, media_type):
+    """Body bytes of payload in media_type."""
+    if media_type == MSGPACK:
+        return msgpack.packb(payload, default=current_app.json.default, use_bin_type=True)
+    return current_app.json.dumps(payload, separators=(",", ":")).encode() + b"\n"
+
+
+def api_response(payload, status_code=200):
+    """(Response, status) with payload encoded as the client asked."""
+    media_type = response_format()
+    response = current_app.response_class(encode(payload, media_type), mimetype=media_type)
+    response.vary.add("Accept")
+    return response, status_code
+
+
+def json_response(success, message, data=None, status_code=200):
+    """The standard envelope response (JSON, or MessagePack when the client asks for it)."""
+    return api_response(envelope(success, message, data), status_code)
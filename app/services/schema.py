@@ -0,0 +1,433 @@
+"""
+Declarative DynamoDB schema for Blood Bridge: tables, GSIs and named access patterns.
+
+- create_table_params / plan_table_updates generate CreateTable and UpdateTable
+  requests (used by scripts/create_dynamodb_tables.py).
+- access_pattern_report statically inspects the data-access modules and maps every
+  function to the operations it actually issues (GetItem/Query/Scan/transactions
+  and batch reads through the _tx_*/_batch_get helpers), failing
+  when a user-facing pattern falls back to a Scan (scripts/check_access_patterns.py).
+"""
+import ast
+import inspect
+
+from config import (
+    USERS_TABLE,
+    DONATIONS_TABLE,
+    BLOOD_REQUESTS_TABLE,
+    MESSAGES_TABLE,
+    ADMINS_TABLE,
+    STATS_TABLE,
+    DONOR_ELIGIBILITY_TABLE,
+    INVENTORY_UNITS_TABLE,
+    DONATION_SLOTS_TABLE,
+    NOTIFICATION_OUTBOX_TABLE,
+)
+
+# Keys are the attribute names on the tables wrapper (db.users, db.donations, ...).
+# "key" / index "key" list (attribute, type) pairs: hash first, optional range second.
+TABLES = {
+    "users": {
+        "name": USERS_TABLE,
+        "key": [("id", "S")],
+        "indexes": {
+            "email-index": {"key": [("email", "S")]},
+        },
+    },
+    "donations": {
+        "name": DONATIONS_TABLE,
+        "key": [("id", "S")],
+        "indexes": {
+            "donor_id-date-index": {"key": [("donor_id", "S"), ("date", "S")]},
+            # Each status newest first; merged across statuses for streamed exports.
+            "status-date-index": {"key": [("status", "S"), ("date", "S")]},
+        },
+    },
+    "blood_requests": {
+        "name": BLOOD_REQUESTS_TABLE,
+        "key": [("id", "S")],
+        "indexes": {
+            "requester_id-timestamp-index": {"key": [("requester_id", "S"), ("timestamp", "S")]},
+            "status-timestamp-index": {"key": [("status", "S"), ("timestamp", "S")]},
+            # priority = "<urgency rank>#<timestamp>": most urgent, then oldest, first.
+            "status-priority-index": {"key": [("status", "S"), ("priority", "S")]},
+            # site_status = "<site_id>#<status>": one site's queue in the same order.
+            "site_status-priority-index": {"key": [("site_status", "S"), ("priority", "S")]},
+            # Sparse: only requests with hospital coordinates (see geo).
+            "geo_cell-geohash-index": {"key": [("geo_cell", "S"), ("geohash", "S")]},
+        },
+    },
+    "messages": {
+        "name": MESSAGES_TABLE,
+        "key": [("id", "S")],
+        "indexes": {},
+    },
+    "admins": {
+        "name": ADMINS_TABLE,
+        "key": [("id", "S")],
+        "indexes": {
+            "admin-email-index": {"key": [("email", "S")]},
+        },
+    },
+    # Derived views maintained from the change stream (counters, rollups, recent lists).
+    "stats": {
+        "name": STATS_TABLE,
+        "key": [("id", "S")],
+        "indexes": {},
+    },
+    # One item per donor, maintained from donation events (see donor_index).
+    "donor_eligibility": {
+        "name": DONOR_ELIGIBILITY_TABLE,
+        "key": [("donor_id", "S")],
+        "indexes": {
+            "blood_group-next_eligible-index": {"key": [("blood_group", "S"), ("next_eligible", "S")]},
+            "geo_cell-geohash-index": {"key": [("geo_cell", "S"), ("geohash", "S")]},
+        },
+    },
+    # Unit ledger. available_group / available_cell are only set while a unit is
+    # available (sparse indexes): usable stock per group ordered by expiry, and
+    # usable located stock per geohash cell.
+    "inventory_units": {
+        "name": INVENTORY_UNITS_TABLE,
+        "key": [("id", "S")],
+        "indexes": {
+            "available_group-expires_on-index": {"key": [("available_group", "S"), ("expires_on", "S")]},
+            "available_cell-geohash-index": {"key": [("available_cell", "S"), ("geohash", "S")]},
+        },
+    },
+    # One item per booked slot: slot_month = "<location>#<YYYY-MM>", slot = "<date>#<time slot>",
+    # so a location's month is one partition (see donation_slots).
+    "donation_slots": {
+        "name": DONATION_SLOTS_TABLE,
+        "key": [("slot_month", "S"), ("slot", "S")],
+        "indexes": {},
+    },
+    # One entry per blood request whose donors are still to be notified (id = request id).
+    # outbox_state is only set while delivery is pending (sparse index): due entries
+    # in due_at order, where due_at is also the claiming worker's lease.
+    "notification_outbox": {
+        "name": NOTIFICATION_OUTBOX_TABLE,
+        "key": [("id", "S")],
+        "indexes": {
+            "outbox_state-due_at-index": {"key": [("outbox_state", "S"), ("due_at", "S")]},
+        },
+    },
+}
+
+# Named access patterns, keyed by the data-access function that implements them.
+# user_facing: reachable from donor/recipient/blood bank routes (admin-only reads may scan).
+# Writes to users, donations, blood_requests and inventory_units also bump the table's
+# write counter (an UpdateItem on the stats item "view_versions", see etags).
+ACCESS_PATTERNS = {
+    # Users
+    "find_user_by_id": {"table": "users", "operations": ["GetItem"], "user_facing": True},
+    "find_user_by_email": {"table": "users", "operations": ["Query"], "index": "email-index", "user_facing": True},
+    "get_users_by_ids": {"table": "users", "operations": ["BatchGetItem"], "user_facing": False},
+    "create_user": {"table": "users", "operations": ["PutItem", "UpdateItem"], "user_facing": True},
+    "update_user_current_role": {"table": "users", "operations": ["UpdateItem"], "user_facing": True},
+    "set_user_site": {"table": "users", "operations": ["UpdateItem"], "user_facing": False},
+    "delete_user_by_id": {"table": "users", "operations": ["DeleteItem", "UpdateItem"], "user_facing": False},
+    "list_all_users": {"table": "users", "operations": ["Scan"], "user_facing": False},
+    "enrich_users_with_blood_group": {"table": "users", "operations": ["Query", "UpdateItem"], "user_facing": False},
+    "count_users_by_role": {"table": "users", "operations": ["Scan"], "user_facing": False},
+    # Donations
+    # The slot's booking counter (donation_slots) moves in the same transaction.
+    "create_donation": {"table": "donations", "operations": ["TransactWriteItems", "UpdateItem"], "user_facing": True},
+    "get_donations_by_ids": {"table": "donations", "operations": ["BatchGetItem"], "user_facing": True},
+    # Units (put or discarded), the inventory counters and the daily rollup move in the same transaction.
+    "transition_donations": {"table": "donations", "operations": ["TransactWriteItems", "UpdateItem"], "user_facing": True},
+    "get_donations_by_donor": {"table": "donations", "operations": ["Query"], "index": "donor_id-date-index", "user_facing": True},
+    # Ground-truth scans; user-facing reads go through the derived views below.
+    "get_recent_donations_for_bloodbank": {"table": "donations", "operations": ["Scan"], "user_facing": False},
+    "get_all_donations_sorted": {"table": "donations", "operations": ["Scan"], "user_facing": False},
+    "iter_donations_newest_first": {
+        "table": "donations", "operations": ["Query"], "index": "status-date-index", "user_facing": False,
+    },
+    "count_donors_distinct": {"table": "donations", "operations": ["Scan"], "user_facing": False},
+    "count_donations_by_date": {"table": "donations", "operations": ["Scan"], "user_facing": False},
+    "count_donations_by_blood_group_and_status": {"table": "donations", "operations": ["Scan"], "user_facing": False},
+    # Blood requests
+    # Pending requests write their donor notification outbox entry in the same transaction.
+    "create_blood_request": {"table": "blood_requests", "operations": ["PutItem", "TransactWriteItems", "UpdateItem"], "user_facing": True},
+    "get_blood_requests_by_requester": {
+        "table": "blood_requests", "operations": ["Query"], "index": "requester_id-timestamp-index", "user_facing": True,
+    },
+    "get_pending_blood_requests": {
+        "table": "blood_requests", "operations": ["Query"], "index": "status-priority-index", "user_facing": True,
+    },
+    "get_site_pending_blood_requests": {
+        "table": "blood_requests", "operations": ["Query"], "index": "site_status-priority-index", "user_facing": True,
+    },
+    "get_blood_request_by_id": {"table": "blood_requests", "operations": ["GetItem"], "user_facing": True},
+    "query_requests_near": {
+        "table": "blood_requests", "operations": ["Query"], "index": "geo_cell-geohash-index", "user_facing": True,
+    },
+    "set_request_priority": {"table": "blood_requests", "operations": ["UpdateItem"], "user_facing": False},
+    "set_request_site": {"table": "blood_requests", "operations": ["UpdateItem"], "user_facing": False},
+    "get_all_blood_requests_sorted": {"table": "blood_requests", "operations": ["Scan"], "user_facing": False},
+    "iter_blood_requests_newest_first": {
+        "table": "blood_requests", "operations": ["Query"], "index": "status-timestamp-index", "user_facing": False,
+    },
+    "count_blood_requests_by_status": {
+        "table": "blood_requests", "operations": ["Query"], "index": "status-timestamp-index", "user_facing": True,
+    },
+    "count_recipients_distinct": {"table": "blood_requests", "operations": ["Scan"], "user_facing": False},
+    # Messages
+    "create_contact_message": {"table": "messages", "operations": ["PutItem"], "user_facing": True},
+    # Admins
+    "find_admin_by_email": {"table": "admins", "operations": ["Query"], "index": "admin-email-index", "user_facing": True},
+    "find_admin_by_id": {"table": "admins", "operations": ["GetItem"], "user_facing": True},
+    "create_admin": {"table": "admins", "operations": ["PutItem"], "user_facing": True},
+    # Derived views
+    "increment_stat": {"table": "stats", "operations": ["UpdateItem"], "user_facing": True},
+    "get_stat_item": {"table": "stats", "operations": ["GetItem"], "user_facing": True},
+    "get_stat_items": {"table": "stats", "operations": ["BatchGetItem"], "user_facing": True},
+    "put_stat_item": {"table": "stats", "operations": ["PutItem"], "user_facing": True},
+    "clear_stats": {"table": "stats", "operations": ["DeleteItem", "Scan"], "user_facing": False},
+    "set_stat_attribute_if": {"table": "stats", "operations": ["UpdateItem"], "user_facing": False},
+    "bump_stat_version": {"table": "stats", "operations": ["UpdateItem"], "user_facing": True},
+    "claim_flight": {"table": "stats", "operations": ["UpdateItem"], "user_facing": True},
+    "finish_flight": {"table": "stats", "operations": ["UpdateItem"], "user_facing": True},
+    # Eligible-donor index
+    "record_donor_donation": {"table": "donor_eligibility", "operations": ["UpdateItem"], "user_facing": True},
+    "record_donor_attendance": {"table": "donor_eligibility", "operations": ["UpdateItem"], "user_facing": True},
+    "put_donor_eligibility": {"table": "donor_eligibility", "operations": ["PutItem"], "user_facing": False},
+    "delete_donor_eligibility": {"table": "donor_eligibility", "operations": ["DeleteItem"], "user_facing": False},
+    "get_donor_eligibility": {"table": "donor_eligibility", "operations": ["GetItem"], "user_facing": True},
+    "query_eligible_donors": {
+        "table": "donor_eligibility", "operations": ["Query"], "index": "blood_group-next_eligible-index", "user_facing": True,
+    },
+    "query_donors_near": {
+        "table": "donor_eligibility", "operations": ["Query"], "index": "geo_cell-geohash-index", "user_facing": True,
+    },
+    # Inventory unit ledger
+    # Available units move the sharded inventory counter (stats) in the same transaction.
+    "put_inventory_unit": {"table": "inventory_units", "operations": ["PutItem", "TransactWriteItems", "UpdateItem"], "user_facing": True},
+    "set_unit_status": {"table": "inventory_units", "operations": ["TransactWriteItems", "UpdateItem"], "user_facing": True},
+    "transition_request_units": {
+        "table": "blood_requests", "operations": ["TransactWriteItems", "UpdateItem"], "user_facing": True,
+    },
+    "get_inventory_unit": {"table": "inventory_units", "operations": ["GetItem"], "user_facing": True},
+    "query_usable_units": {
+        "table": "inventory_units", "operations": ["Query"], "index": "available_group-expires_on-index", "user_facing": True,
+    },
+    "query_expired_units": {
+        "table": "inventory_units", "operations": ["Query"], "index": "available_group-expires_on-index", "user_facing": True,
+    },
+    "query_units_near": {
+        "table": "inventory_units", "operations": ["Query"], "index": "available_cell-geohash-index", "user_facing": True,
+    },
+    # Donation slots
+    "query_slot_month": {"table": "donation_slots", "operations": ["Query"], "user_facing": True},
+    "adjust_slot_booking": {"table": "donation_slots", "operations": ["UpdateItem"], "user_facing": True},
+    "set_slot_capacity": {"table": "donation_slots", "operations": ["UpdateItem"], "user_facing": False},
+    "set_slot_booked": {"table": "donation_slots", "operations": ["UpdateItem"], "user_facing": False},
+    # Notification outbox (background workers only)
+    "query_due_notifications": {
+        "table": "notification_outbox", "operations": ["Query"], "index": "outbox_state-due_at-index", "user_facing": False,
+    },
+    "claim_notification": {"table": "notification_outbox", "operations": ["UpdateItem"], "user_facing": False},
+    "record_notification_progress": {"table": "notification_outbox", "operations": ["UpdateItem"], "user_facing": False},
+    "retry_notification": {"table": "notification_outbox", "operations": ["UpdateItem"], "user_facing": False},
+    "finish_notification": {"table": "notification_outbox", "operations": ["UpdateItem"], "user_facing": False},
+    "get_notification": {"table": "notification_outbox", "operations": ["GetItem"], "user_facing": False},
+}
+
+# database_service helpers taking (db, "<table>", ...) -> DynamoDB API operation
+_HELPER_OPERATIONS = {
+    "_tx_put": "TransactWriteItems",
+    "_tx_update": "TransactWriteItems",
+    "_batch_get": "BatchGetItem",
+}
+
+# boto3 Table method -> DynamoDB API operation
+_METHOD_OPERATIONS = {
+    "get_item": "GetItem",
+    "put_item": "PutItem",
+    "update_item": "UpdateItem",
+    "delete_item": "DeleteItem",
+    "query": "Query",
+    "scan": "Scan",
+}
+
+
+# ---------- Table definitions ----------
+def _key_schema(key):
+    types = ["HASH", "RANGE"]
+    return [{"AttributeName": name, "KeyType": types[i]} for i, (name, _) in enumerate(key)]
+
+
+def _gsi_params(index_name, index):
+    return {
+        "IndexName": index_name,
+        "KeySchema": _key_schema(index["key"]),
+        "Projection": {"ProjectionType": index.get("projection", "ALL")},
+    }
+
+
+def _attribute_definitions(keys):
+    seen = {}
+    for name, attr_type in keys:
+        seen.setdefault(name, attr_type)
+    return [{"AttributeName": n, "AttributeType": t} for n, t in seen.items()]
+
+
+def create_table_params(table_key):
+    """CreateTable kwargs for TABLES[table_key]."""
+    table = TABLES[table_key]
+    keys = list(table["key"])
+    for index in table["indexes"].values():
+        keys.extend(index["key"])
+    params = {
+        "TableName": table["name"],
+        "KeySchema": _key_schema(table["key"]),
+        "AttributeDefinitions": _attribute_definitions(keys),
+        "BillingMode": "PAY_PER_REQUEST",
+    }
+    if table["indexes"]:
+        params["GlobalSecondaryIndexes"] = [
+            _gsi_params(name, index) for name, index in table["indexes"].items()
+        ]
+    return params
+
+
+def plan_table_updates(table_key, description):
+    """UpdateTable kwargs creating each GSI declared in TABLES but missing from describe_table output.
+
+    DynamoDB accepts one GSI creation per UpdateTable call, so one dict per index.
+    """
+    table = TABLES[table_key]
+    existing = {g["IndexName"] for g in description.get("GlobalSecondaryIndexes", [])}
+    updates = []
+    for name, index in table["indexes"].items():
+        if name in existing:
+            continue
+        updates.append({
+            "TableName": table["name"],
+            "AttributeDefinitions": _attribute_definitions(index["key"]),
+            "GlobalSecondaryIndexUpdates": [{"Create": _gsi_params(name, index)}],
+        })
+    return updates
+
+
+# ---------- Access-pattern planner ----------
+def _module_functions(module):
+    """Map qualified name -> ast.FunctionDef for top-level functions and class methods."""
+    tree = ast.parse(inspect.getsource(module))
+    out = {}
+    for node in tree.body:
+        if isinstance(node, ast.FunctionDef):
+            out[node.name] = node
+        elif isinstance(node, ast.ClassDef):
+            for item in node.body:
+                if isinstance(item, ast.FunctionDef):
+                    out[f"{node.name}.{item.name}"] = item
+    return out
+
+
+def _table_method(node):
+    """For an expression like db.users.query return ("users", "query"), else None."""
+    if (
+        isinstance(node, ast.Attribute)
+        and node.attr in _METHOD_OPERATIONS
+        and isinstance(node.value, ast.Attribute)
+        and node.value.attr in TABLES
+    ):
+        return node.value.attr, node.attr
+    return None
+
+
+def _call_name(call):
+    if isinstance(call.func, ast.Name):
+        return call.func.id
+    if isinstance(call.func, ast.Attribute) and isinstance(call.func.value, ast.Name):
+        return f"{call.func.value.id}.{call.func.attr}"
+    return None
+
+
+def _direct_access(func):
+    """Return (accesses, callees): accesses are (table, operation, index) issued in func's body."""
+    accesses = set()
+    callees = set()
+    for call in ast.walk(func):
+        if not isinstance(call, ast.Call):
+            continue
+        index = None
+        for kw in call.keywords:
+            if kw.arg == "IndexName" and isinstance(kw.value, ast.Constant):
+                index = kw.value.value
+        for node in [call.func] + list(call.args):
+            found = _table_method(node)
+            if found:
+                accesses.add((found[0], _METHOD_OPERATIONS[found[1]], index))
+        name = _call_name(call)
+        if name in _HELPER_OPERATIONS and len(call.args) > 1:
+            table = call.args[1]
+            if isinstance(table, ast.Constant) and table.value in TABLES:
+                accesses.add((table.value, _HELPER_OPERATIONS[name], None))
+        if name:
+            callees.add(name)
+    return accesses, callees
+
+
+def analyze_data_access(modules):
+    """Map function name -> set of (table, operation, index), following calls between analyzed functions."""
+    functions = {}
+    for module in modules:
+        functions.update(_module_functions(module))
+    direct = {name: _direct_access(fn) for name, fn in functions.items()}
+
+    def resolve(name, seen):
+        accesses, callees = direct[name]
+        out = set(accesses)
+        for callee in callees:
+            if callee in direct and callee not in seen:
+                out |= resolve(callee, seen | {callee})
+        return out
+
+    # Private helpers are reported through their public callers.
+    return {name: resolve(name, {name}) for name in direct if "." not in name and not name.startswith("_")}
+
+
+def access_pattern_report(modules=None):
+    """Return (rows, failures) for every data-access function.
+
+    A row is {function, table, operations, indexes, user_facing, declared}. Failures list
+    undeclared functions, operations that differ from the declaration, unknown indexes,
+    and user-facing patterns that Scan.
+    """
+    if modules is None:
+        from app.models import user as user_model
+        from app.services import database_service
+        modules = [database_service, user_model]
+    detected = analyze_data_access(modules)
+    rows = []
+    failures = []
+    for name, accesses in sorted(detected.items()):
+        if not accesses:
+            continue
+        pattern = ACCESS_PATTERNS.get(name)
+        operations = sorted({op for _, op, _ in accesses})
+        indexes = sorted({idx for _, _, idx in accesses if idx})
+        tables = sorted({t for t, _, _ in accesses})
+        rows.append({
+            "function": name,
+            "table": ", ".join(tables),
+            "operations": operations,
+            "indexes": indexes,
+            "user_facing": bool(pattern and pattern.get("user_facing")),
+            "declared": pattern is not None,
+        })
+        if pattern is None:
+            failures.append(f"{name}: not declared in ACCESS_PATTERNS")
+            continue
+        if set(operations) != set(pattern["operations"]):
+            failures.append(f"{name}: declared {pattern['operations']} but issues {operations}")
+        for table, op, idx in accesses:
+            if idx and idx not in TABLES[table]["indexes"]:
+                failures.append(f"{name}: {op} on unknown index {table}.{idx}")
+        if pattern.get("user_facing") and "Scan" in operations:
+            failures.append(f"{name}: user-facing pattern falls back to Scan")
+    for name in sorted(set(ACCESS_PATTERNS) - set(n for n, a in detected.items() if a)):
+        failures.append(f"{name}: declared in ACCESS_PATTERNS but no data access found")
+    return rows, failures
@@ -0,0 +1,168 @@
+"""
+Shortage alerts evaluated as requests and units are written.
+
+The supply-demand gap per blood group (pending requested units vs usable units)
+comes from two incrementally maintained views: the pending_demand counter and
+the sharded inventory counter. ShortageMonitor consumes request and unit change
+events; for each blood group an event touches, it reads the gap and the group's
+thresholds (one BatchGetItem) and classifies the group:
+  - "shortage": pending demand is at least demand_percent % of supply
+  - "low": supply is below min_units
+  - "ok": otherwise
+When a group's level changes, a conditional write on the stored level lets
+exactly one worker fire the alert. Alerts are logged, kept in a recent list in
+the stats table and passed to any registered listeners.
+
+Default thresholds come from config; per-group overrides are stored in the
+stats table (admin API) and take effect on the next event.
+"""
+import logging
+import uuid
+from datetime import datetime
+
+from app.services.change_stream import REMOVE
+from app.services.database_service import get_stat_item, put_stat_item, set_stat_attribute_if
+from app.services.derived_views import SHORTAGE_THRESHOLDS, supply_demand_view
+from config import BLOOD_GROUPS, SHORTAGE_DEMAND_PERCENT, SHORTAGE_MIN_UNITS
+
+logger = logging.getLogger(__name__)
+
+# Stats item ids (SHORTAGE_THRESHOLDS lives in derived_views so rebuilds keep it)
+SHORTAGE_LEVELS = "shortage_levels"
+SHORTAGE_ALERTS = "shortage_alerts"
+
+OK = "ok"
+LOW = "low"
+SHORTAGE = "shortage"
+LEVELS = (OK, LOW, SHORTAGE)
+RECENT_ALERTS = 50
+
+
+def default_thresholds():
+    return {"demand_percent": SHORTAGE_DEMAND_PERCENT, "min_units": SHORTAGE_MIN_UNITS}
+
+
+def thresholds_for(blood_group, overrides):
+    """Thresholds of blood_group: config defaults updated with its stored override."""
+    out = default_thresholds()
+    out.update({k: int(v) for k, v in ((overrides or {}).get(blood_group) or {}).items() if k in out})
+    return out
+
+
+def shortage_level(demand, supply, thresholds):
+    """Classify a group's gap as "shortage", "low" or "ok"."""
+    if demand > 0 and demand * 100 >= thresholds["demand_percent"] * supply:
+        return SHORTAGE
+    if supply < thresholds["min_units"]:
+        return LOW
+    return OK
+
+
+def _affected_groups(event):
+    images = [event.old_image, None if event.event_name == REMOVE else event.new_image]
+    return {img.get("blood_group") for img in images if img} & set(BLOOD_GROUPS)
+
+
+class ShortageMonitor:
+    """Change-stream consumer that fires an alert whenever a group's shortage level changes."""
+
+    name = "shortage_alerts"
+    tables = ("blood_requests", "inventory_units")
+
+    def __init__(self, db):
+        self.db = db
+        self._listeners = []
+
+    def add_listener(self, listener):
+        """Call listener(alert) for every alert fired by this process."""
+        self._listeners.append(listener)
+
+    def apply(self, event):
+        groups = _affected_groups(event)
+        if groups:
+            self.evaluate(sorted(groups))
+
+    def evaluate(self, blood_groups=None):
+        """Re-evaluate blood_groups (all by default); returns the alerts fired."""
+        gaps, extra = supply_demand_view(
+            self.db, blood_groups=blood_groups, extra_items=(SHORTAGE_THRESHOLDS, SHORTAGE_LEVELS)
+        )
+        overrides = extra[SHORTAGE_THRESHOLDS].get("groups") or {}
+        stored = extra[SHORTAGE_LEVELS]
+        fired = []
+        for bg, gap in gaps.items():
+            thresholds = thresholds_for(bg, overrides)
+            level = shortage_level(gap["demand"], gap["supply"], thresholds)
+            previous = stored.get(bg)
+            if level == (previous or OK):
+                continue
+            # Only the worker that moves the stored level fires the alert.
+            if not set_stat_attribute_if(self.db, SHORTAGE_LEVELS, bg, level, previous):
+                continue
+            alert = dict(
+                gap,
+                id=str(uuid.uuid4()),
+                blood_group=bg,
+                level=level,
+                previous=previous or OK,
+                thresholds=thresholds,
+                at=datetime.utcnow().isoformat() + "Z",
+            )
+            self._record(alert)
+            fired.append(alert)
+        return fired
+
+    def _record(self, alert):
+        log = logger.info if alert["level"] == OK else logger.warning
+        log(
+            "Blood group %s: %s -> %s (demand %s, supply %s)",
+            alert["blood_group"], alert["previous"], alert["level"], alert["demand"], alert["supply"],
+        )
+        for _ in range(5):
+            current = get_stat_item(self.db, SHORTAGE_ALERTS)
+            alerts = ([alert] + current.get("items", []))[:RECENT_ALERTS]
+            if put_stat_item(self.db, {"id": SHORTAGE_ALERTS, "items": alerts}, current.get("version")):
+                break
+        for listener in self._listeners:
+            try:
+                listener(alert)
+            except Exception:
+                logger.exception("Shortage alert listener failed")
+
+
+def register_shortage_monitor(db):
+    """Subscribe the monitor to request and unit events (after the derived views)."""
+    monitor = ShortageMonitor(db)
+    for table in monitor.tables:
+        db.events.subscribe(table, monitor.apply, name=monitor.name)
+    return monitor
+
+
+def shortage_status(db, site_id=None):
+    """Gap, thresholds and current level per blood group, plus recent (network) alerts, newest first.
+
+    With site_id the gap is that site's, and its level is classified on read
+    against the same thresholds; alerts only fire for the network roll-up.
+    """
+    gaps, extra = supply_demand_view(
+        db, extra_items=(SHORTAGE_THRESHOLDS, SHORTAGE_LEVELS, SHORTAGE_ALERTS), site_id=site_id
+    )
+    overrides = extra[SHORTAGE_THRESHOLDS].get("groups") or {}
+    groups = {}
+    for bg, gap in gaps.items():
+        thresholds = thresholds_for(bg, overrides)
+        if site_id is None:
+            level = extra[SHORTAGE_LEVELS].get(bg) or OK
+        else:
+            level = shortage_level(gap["demand"], gap["supply"], thresholds)
+        groups[bg] = dict(gap, level=level, thresholds=thresholds)
+    return {"groups": groups, "alerts": extra[SHORTAGE_ALERTS].get("items", []), "site_id": site_id}
+
+
+def set_shortage_thresholds(db, overrides, max_attempts=5):
+    """Replace per-group threshold overrides ({group: {demand_percent, min_units}}). Returns True on success."""
+    for _ in range(max_attempts):
+        current = get_stat_item(db, SHORTAGE_THRESHOLDS)
+        if put_stat_item(db, {"id": SHORTAGE_THRESHOLDS, "groups": overrides}, current.get("version")):
+            return True
+    return False
@@ -0,0 +1,176 @@
+"""
+Request coalescing (singleflight) for expensive computations, e.g. dashboard payloads.
+
+SingleFlight.do(key, fn) runs fn once for every caller with the same key:
+  - in a process: the first caller (leader) computes; callers arriving while it
+    runs wait for it and get the same result, or the same exception. The
+    result is then reused for result_ttl seconds, so a burst of page loads (a
+    shift change) computes it once.
+  - across worker processes (shared=True): the leader also takes a lease on a
+    stats item ("flight#<key hash>") and stores the result there as JSON, for
+    result_ttl. A worker that finds the lease held polls the item for the
+    result instead of computing; if none comes within wait_seconds (the holder
+    died, or the result is too large to store) it computes on its own. Shared
+    results must be JSON-serializable, and come back as JSON (tuples as lists).
+
+Keys must change whenever the result may: callers include the data versions
+(see etags.versions_etag), so a reused result is never older than its key.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+import uuid
+
+from app.services.database_service import claim_flight, finish_flight, get_stat_item
+from config import (
+    SINGLEFLIGHT_RESULT_TTL_SECONDS,
+    SINGLEFLIGHT_WAIT_SECONDS,
+    SINGLEFLIGHT_POLL_SECONDS,
+    SINGLEFLIGHT_LEASE_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+FLIGHT_PREFIX = "flight#"
+# Shared results above this are not stored (items are limited to 400 KB).
+MAX_SHARED_RESULT_BYTES = 350 * 1024
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+class _Call:
+    """One in-process computation and its outcome."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        self.expires_at = 0.0
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one computation."""
+
+    def __init__(
+        self,
+        db=None,
+        shared=False,
+        result_ttl=SINGLEFLIGHT_RESULT_TTL_SECONDS,
+        wait_seconds=SINGLEFLIGHT_WAIT_SECONDS,
+        poll_seconds=SINGLEFLIGHT_POLL_SECONDS,
+        lease_seconds=SINGLEFLIGHT_LEASE_SECONDS,
+    ):
+        self.db = db
+        self.shared = bool(shared and db is not None)
+        self.result_ttl = result_ttl
+        self.wait_seconds = wait_seconds
+        self.poll_seconds = poll_seconds
+        self.lease_seconds = lease_seconds
+        self.holder = uuid.uuid4().hex
+        self.computed = 0
+        self.coalesced = 0
+        self.shared_hits = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, reusable=None):
+        """fn() once for all concurrent (and recent) callers of key; returns its result.
+
+        reusable(result) False keeps a result from outliving its computation (e.g. partial reads).
+        """
+        key = json.dumps(key, default=str, separators=(",", ":"))
+        now = time.monotonic()
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None and call.done.is_set() and call.expires_at <= now:
+                call = None
+            leader = call is None
+            if leader:
+                self._prune(now)
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+        if not leader:
+            if not call.done.wait(self.wait_seconds):
+                # The leader is stuck; do not hold this request hostage to it.
+                return fn()
+            if call.error is not None:
+                raise call.error
+            return call.value
+        try:
+            call.value = self._shared_do(key, fn, reusable) if self.shared else self._compute(fn)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            keep = call.error is None and (reusable is None or reusable(call.value))
+            call.expires_at = time.monotonic() + (self.result_ttl if keep else 0)
+            call.done.set()
+        return call.value
+
+    def _compute(self, fn):
+        with self._lock:
+            self.computed += 1
+        return fn()
+
+    def _prune(self, now):
+        """Drop finished calls whose result has expired (lock held)."""
+        for key in [k for k, c in self._calls.items() if c.done.is_set() and c.expires_at <= now]:
+            del self._calls[key]
+
+    # ----- across workers -----
+    def _shared_do(self, key, fn, reusable):
+        item_id = FLIGHT_PREFIX + hashlib.sha256(key.encode()).hexdigest()[:32]
+        value = self._fresh_result(get_stat_item(self.db, item_id))
+        if value is not None:
+            return value
+        if claim_flight(self.db, item_id, self.holder, _now_ms(), int(self.lease_seconds * 1000)):
+            return self._lead(item_id, fn, reusable)
+        # Another worker holds the lease: wait for its result.
+        give_up = time.monotonic() + self.wait_seconds
+        while time.monotonic() < give_up:
+            time.sleep(self.poll_seconds)
+            value = self._fresh_result(get_stat_item(self.db, item_id))
+            if value is not None:
+                return value
+        return self._compute(fn)
+
+    def _fresh_result(self, item):
+        if item.get("result") is None or int(item.get("fresh_until") or 0) <= _now_ms():
+            return None
+        with self._lock:
+            self.shared_hits += 1
+        return json.loads(item["result"])
+
+    def _lead(self, item_id, fn, reusable):
+        result = None
+        try:
+            value = self._compute(fn)
+            if reusable is None or reusable(value):
+                result = json.dumps(value, default=str, separators=(",", ":"))
+                if len(result.encode()) > MAX_SHARED_RESULT_BYTES:
+                    result = None
+            return value
+        finally:
+            now = _now_ms()
+            # Keep the result at least a couple of polls, so waiting workers see it.
+            ttl_ms = int(max(self.result_ttl, 2 * self.poll_seconds) * 1000) if result else 0
+            try:
+                finish_flight(self.db, item_id, self.holder, result, now + ttl_ms, now)
+            except Exception:
+                # Waiting workers time out and compute on their own.
+                logger.exception("Could not release flight %s", item_id)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "shared": self.shared,
+                "computed": self.computed,
+                "coalesced": self.coalesced,
+                "shared_hits": self.shared_hits,
+                "in_flight": sum(1 for c in self._calls.values() if not c.done.is_set()),
+            }
@@ -0,0 +1,131 @@
+"""
+Streamed JSON list responses for large exports (admin users, requests, donations).
+
+The body is the usual {"success", "message", "data"} envelope, with data holding
+one list plus "partial" and "cursor", but it is written a chunk at a time from
+a generator over the paged reads: each item is serialized as it comes and
+about STREAM_CHUNK_BYTES are sent together. Only one page per reader and one
+chunk are in memory at a time, however large the table, and the first bytes
+leave as soon as the first page is read.
+
+The body is compressed on the fly when the client accepts it: brotli when the
+optional brotli package is installed, else gzip. Each chunk is flushed through
+the compressor so the client can decode it as it arrives.
+
+Streams are not cut off by the request deadline (a partial export is of no
+use). If a read fails after the first bytes have gone out, the list is closed
+early and "partial" is true, so the body is still valid JSON.
+"""
+import json
+import logging
+import zlib
+
+from flask import Response, request, stream_with_context
+
+from app.services.deadline import clear_request_deadline
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+STREAM_CHUNK_BYTES = 16 * 1024
+
+_EMPTY = object()
+
+
+class _Gzip:
+    encoding = "gzip"
+
+    def __init__(self):
+        self._z = zlib.compressobj(6, zlib.DEFLATED, 31)
+
+    def chunk(self, data):
+        return self._z.compress(data) + self._z.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._z.flush()
+
+
+class _Brotli:
+    encoding = "br"
+
+    def __init__(self):
+        self._z = brotli.Compressor(quality=5)
+
+    def chunk(self, data):
+        return self._z.process(data) + self._z.flush()
+
+    def finish(self):
+        return self._z.finish()
+
+
+def _compressor():
+    """Compressor for the encoding the client prefers among those available, or None."""
+    offered = {"gzip": _Gzip}
+    if brotli is not None:
+        offered["br"] = _Brotli
+    encoding = request.accept_encodings.best_match(list(offered))
+    return offered[encoding]() if encoding else None
+
+
+def _encode(item):
+    return json.dumps(item, separators=(",", ":"), default=str)
+
+
+def _body(key, first, items, message):
+    head = json.dumps({"success": True, "message": message})[:-1]
+    buffer = [f'{head},"data":{{"{key}":[']
+    size = len(buffer[0])
+    partial = False
+    if first is not _EMPTY:
+        buffer.append(_encode(first))
+        try:
+            for item in items:
+                text = "," + _encode(item)
+                buffer.append(text)
+                size += len(text)
+                if size >= STREAM_CHUNK_BYTES:
+                    yield "".join(buffer).encode()
+                    buffer, size = [], 0
+        except Exception:
+            # Headers are gone: end the list early and say so.
+            logger.exception("Streaming %s failed", key)
+            partial = True
+    buffer.append(f'],"partial":{json.dumps(partial)},"cursor":null}}}}')
+    yield "".join(buffer).encode()
+
+
+def _compressed(body, compressor):
+    for data in body:
+        out = compressor.chunk(data)
+        if out:
+            yield out
+    yield compressor.finish()
+
+
+def streamed(view):
+    """Mark a view whose response is streamed (exports, live feeds); the batch API refuses it."""
+    view.streamed = True
+    return view
+
+
+def stream_list(key, items, message="OK"):
+    """Response streaming {"success", "message", "data": {key: [...items], "partial", "cursor"}}.
+
+    items is any iterable of JSON-serializable values. The first one is read
+    here, so a failing first read still becomes the usual error response.
+    """
+    clear_request_deadline()
+    items = iter(items)
+    first = next(items, _EMPTY)
+    body = _body(key, first, items, message)
+    headers = {"Vary": "Accept-Encoding"}
+    compressor = _compressor() if first is not _EMPTY else None
+    if compressor:
+        body = _compressed(body, compressor)
+        headers["Content-Encoding"] = compressor.encoding
+    response = Response(stream_with_context(body), mimetype="application/json", headers=headers)
+    return response, 200
@@ -3,7 +3,19 @@ All validation logic for Blood Bridge.
 Used by routes and services; no validation in routes.
 """
 import re
-from config import BLOOD_GROUPS, USER_CHOOSABLE_ROLES
+from datetime import datetime
+
+from app.services.geo import parse_coordinates
+from config import (
+    BLOOD_GROUPS,
+    USER_CHOOSABLE_ROLES,
+    DONATION_STATUSES,
+    MAX_DONATION_TRANSITIONS,
+    BATCH_MAX_REQUESTS,
+    REQUEST_URGENCIES,
+    SITE_IDS,
+    DONATION_TIME_SLOTS,
+)
 
 
 def _error(message):
@@ -14,6 +26,36 @@ def _ok():
     return {"valid": True, "error": None}
 
 
+def _coordinates_error(data):
+    """Optional lat/lon: both or neither, within range. Returns an error message or None."""
+    lat = str(data.get("lat") if data.get("lat") is not None else "").strip()
+    lon = str(data.get("lon") if data.get("lon") is not None else "").strip()
+    if not lat and not lon:
+        return None
+    if not lat or not lon:
+        return "Provide both latitude and longitude, or neither"
+    if parse_coordinates(lat, lon) is None:
+        return "Latitude must be -90 to 90 and longitude -180 to 180"
+    return None
+
+
+def _date_error(value, fmt="%Y-%m-%d", label="Date must be YYYY-MM-DD"):
+    """Returns an error message unless value parses with fmt, else None."""
+    try:
+        datetime.strptime(str(value), fmt)
+    except ValueError:
+        return label
+    return None
+
+
+def _site_error(data):
+    """Optional site_id: one of SITE_IDS. Returns an error message or None."""
+    site_id = (data.get("site_id") or "").strip()
+    if site_id and site_id not in SITE_IDS:
+        return "Site must be one of: " + ", ".join(SITE_IDS)
+    return None
+
+
 def validate_email(email):
     if not email or not isinstance(email, str):
         return False
@@ -73,13 +115,14 @@ def validate_choose_role(data):
 
 
 def validate_blood_request(data):
-    """Validate blood request: patient_name, blood_group, units, hospital."""
+    """Validate blood request: patient_name, blood_group, units, hospital, optional urgency, site and hospital lat/lon."""
     if not data:
         return _error("Missing request data")
     patient_name = (data.get("patient_name") or "").strip()
     blood_group = (data.get("blood_group") or "").strip()
     units = data.get("units")
     hospital = (data.get("hospital") or "").strip()
+    urgency = (data.get("urgency") or "").strip().lower()
 
     if not patient_name or len(patient_name) < 2:
         return _error("Patient name must be at least 2 characters")
@@ -93,12 +136,27 @@ def validate_blood_request(data):
         return _error("Units must be a number (1-100)")
     if not hospital or len(hospital) < 5:
         return _error("Hospital name/address must be at least 5 characters")
+    if urgency and urgency not in REQUEST_URGENCIES:
+        return _error("Urgency must be one of: " + ", ".join(REQUEST_URGENCIES))
+    site_error = _site_error(data)
+    if site_error:
+        return _error(site_error)
+    coordinates_error = _coordinates_error(data)
+    if coordinates_error:
+        return _error(coordinates_error)
 
     return _ok()
 
 
+def _time_slot_error(time_slot):
+    """time_slot must be one of DONATION_TIME_SLOTS (capacity is counted per slot). Returns an error message or None."""
+    if time_slot not in DONATION_TIME_SLOTS:
+        return "Time slot must be one of: " + ", ".join(DONATION_TIME_SLOTS)
+    return None
+
+
 def validate_donation_slot(data):
-    """Validate donation slot: blood_group, donation_date, location, time_slot optional."""
+    """Validate donation slot: blood_group, donation_date, location, time_slot; site and lat/lon optional."""
     if not data:
         return _error("Missing donation data")
     blood_group = (data.get("blood_group") or "").strip()
@@ -110,9 +168,142 @@ def validate_donation_slot(data):
         return _error("Please select a valid blood group")
     if not donation_date:
         return _error("Donation date is required")
+    date_error = _date_error(donation_date)
+    if date_error:
+        return _error(date_error)
+    if not location or len(location) < 2:
+        return _error("Location is required")
+    time_slot_error = _time_slot_error(time_slot)
+    if time_slot_error:
+        return _error(time_slot_error)
+    site_error = _site_error(data)
+    if site_error:
+        return _error(site_error)
+    coordinates_error = _coordinates_error(data)
+    if coordinates_error:
+        return _error(coordinates_error)
+
+    return _ok()
+
+
+def validate_donation_status(data):
+    """Validate donation status change: status in DONATION_STATUSES."""
+    if not data:
+        return _error("Missing status data")
+    status = (data.get("status") or "").strip()
+    if status not in DONATION_STATUSES:
+        return _error("Status must be one of: " + ", ".join(DONATION_STATUSES))
+    return _ok()
+
+
+def validate_donation_transitions(data):
+    """Validate a bulk status change: {"updates": [{"donation_id", "status"}]}, each donation once."""
+    updates = (data or {}).get("updates")
+    if not isinstance(updates, list) or not updates:
+        return _error("updates must be a non-empty list")
+    if len(updates) > MAX_DONATION_TRANSITIONS:
+        return _error(f"At most {MAX_DONATION_TRANSITIONS} updates per request")
+    seen = set()
+    for i, update in enumerate(updates):
+        if not isinstance(update, dict) or not isinstance(update.get("donation_id"), str) or not update["donation_id"].strip():
+            return _error(f"Update {i + 1}: donation_id is required")
+        donation_id = update["donation_id"].strip()
+        if donation_id in seen:
+            return _error(f"Update {i + 1}: donation {donation_id} is listed twice")
+        seen.add(donation_id)
+        if update.get("status") not in DONATION_STATUSES:
+            return _error(f"Update {i + 1}: status must be one of: " + ", ".join(DONATION_STATUSES))
+    return _ok()
+
+
+def validate_batch(data):
+    """Validate a batch: {"requests": [{"path", "method"?, "id"?, "body"?, "headers"?}]}, ids unique.
+
+    Fills in the defaults (method GET, id = position) on valid input.
+    """
+    subs = (data or {}).get("requests")
+    if not isinstance(subs, list) or not subs:
+        return _error("requests must be a non-empty list")
+    if len(subs) > BATCH_MAX_REQUESTS:
+        return _error(f"At most {BATCH_MAX_REQUESTS} requests per batch")
+    seen = set()
+    for i, sub in enumerate(subs):
+        if not isinstance(sub, dict):
+            return _error(f"Request {i + 1}: must be an object")
+        path = sub.get("path")
+        if not isinstance(path, str) or not path.startswith("/api/"):
+            return _error(f"Request {i + 1}: path must start with /api/")
+        if path.rstrip("/").split("?")[0] == "/api/batch":
+            return _error(f"Request {i + 1}: batches cannot be nested")
+        method = str(sub.get("method") or "GET").upper()
+        if method not in ("GET", "POST", "PUT", "DELETE"):
+            return _error(f"Request {i + 1}: method must be GET, POST, PUT or DELETE")
+        if sub.get("headers") is not None and not isinstance(sub["headers"], dict):
+            return _error(f"Request {i + 1}: headers must be an object")
+        sub_id = str(sub.get("id") if sub.get("id") is not None else i)
+        if sub_id in seen:
+            return _error(f"Request {i + 1}: id {sub_id} is used twice")
+        seen.add(sub_id)
+        sub["method"], sub["id"] = method, sub_id
+    return _ok()
+
+
+def validate_slot_month(data):
+    """Validate a slot heatmap query: location and month (YYYY-MM)."""
+    location = ((data or {}).get("location") or "").strip()
+    if not location or len(location) < 2:
+        return _error("Location is required")
+    month_error = _date_error((data or {}).get("month") or "", "%Y-%m", "Month must be YYYY-MM")
+    return _error(month_error) if month_error else _ok()
+
+
+def validate_slot_capacity(data):
+    """Validate a slot capacity override: location, date, optional time_slot, capacity 0-1000."""
+    if not data:
+        return _error("Missing capacity data")
+    location = (data.get("location") or "").strip()
     if not location or len(location) < 2:
         return _error("Location is required")
+    date_error = _date_error(data.get("date") or "")
+    if date_error:
+        return _error(date_error)
+    time_slot = (data.get("time_slot") or "").strip()
+    if time_slot and _time_slot_error(time_slot):
+        return _error(_time_slot_error(time_slot))
+    try:
+        capacity = int(data.get("capacity"))
+    except (TypeError, ValueError):
+        return _error("Capacity must be a whole number")
+    if capacity < 0 or capacity > 1000:
+        return _error("Capacity must be between 0 and 1000")
+    return _ok()
+
+
+def validate_site_assignment(data):
+    """Validate a blood bank's site assignment: site_id in SITE_IDS."""
+    if not (data or {}).get("site_id"):
+        return _error("site_id is required")
+    site_error = _site_error(data)
+    return _error(site_error) if site_error else _ok()
+
 
+def validate_shortage_thresholds(data):
+    """Validate shortage threshold overrides: {"groups": {blood_group: {demand_percent, min_units}}}."""
+    groups = (data or {}).get("groups")
+    if not isinstance(groups, dict):
+        return _error("groups must be an object keyed by blood group")
+    for blood_group, thresholds in groups.items():
+        if blood_group not in BLOOD_GROUPS:
+            return _error(f"Invalid blood group: {blood_group}")
+        if not isinstance(thresholds, dict) or not set(thresholds) <= {"demand_percent", "min_units"}:
+            return _error("Each group takes demand_percent and/or min_units")
+        for name, value in thresholds.items():
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                return _error(f"{blood_group} {name} must be a whole number")
+            if value < 0 or value > 10000 or (name == "demand_percent" and value < 1):
+                return _error(f"{blood_group} {name} is out of range")
     return _ok()
 
 
@@ -65,6 +65,21 @@ const AdminAPI = {
       return adminRequest('GET', '/api/admin/inventory');
     },
   },
+  /**
+   * Several calls in one round trip: calls is [{ id, method, path, body }].
+   * Resolves to { id: { ok, status, data } }, like separate adminRequest() calls.
+   */
+  batch(calls) {
+    return adminRequest('POST', '/api/batch', { requests: calls }).then(res => {
+      if (!res.ok || !res.data.success) {
+        return Object.fromEntries(calls.map((c, i) => [c.id != null ? c.id : String(i), res]));
+      }
+      return Object.fromEntries(res.data.data.responses.map(r => [
+        r.id,
+        { ok: r.status >= 200 && r.status < 300, status: r.status, data: r.body },
+      ]));
+    });
+  },
 };
 
 window.BloodBridgeAdminAPI = AdminAPI;
@@ -54,6 +54,10 @@ const api = {
         schedule(payload) {
             return request('POST', '/api/donors/schedule', payload);
         },
+        slots(location, month) {
+            const q = new URLSearchParams({ location, month });
+            return request('GET', `/api/donors/slots?${q}`);
+        },
     },
     requests: {
         create(payload) {
@@ -82,6 +86,21 @@ const api = {
             return request('POST', '/api/contact', payload);
         },
     },
+    /**
+     * Several calls in one round trip: calls is [{ id, method, path, body }].
+     * Resolves to { id: { ok, status, data } }, like separate request() calls.
+     */
+    batch(calls) {
+        return request('POST', '/api/batch', { requests: calls }).then(res => {
+            if (!res.ok || !res.data.success) {
+                return Object.fromEntries(calls.map((c, i) => [c.id != null ? c.id : String(i), res]));
+            }
+            return Object.fromEntries(res.data.data.responses.map(r => [
+                r.id,
+                { ok: r.status >= 200 && r.status < 300, status: r.status, data: r.body },
+            ]));
+        });
+    },
 };
 
 window.BloodBridgeAPI = api;
@@ -116,6 +116,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 blood_group: bloodRequestForm.querySelector('[name="blood_group"]')?.value?.trim() || '',
                 units: bloodRequestForm.querySelector('[name="units"]')?.value || '',
                 hospital: bloodRequestForm.querySelector('[name="hospital"]')?.value?.trim() || '',
+                urgency: bloodRequestForm.querySelector('[name="urgency"]')?.value || 'routine',
             };
             const res = await window.BloodBridgeAPI.requests.create(payload);
             if (res.ok && res.data.success) {
@@ -130,6 +131,47 @@ document.addEventListener('DOMContentLoaded', () => {
     // Schedule donation form
     const scheduleForm = document.getElementById('schedule-donation-form');
     if (scheduleForm) {
+        // Slot occupancy heatmap: one request per location and month; full slots are disabled.
+        const heatmap = document.getElementById('slot-heatmap');
+        const field = (name) => scheduleForm.querySelector(`[name="${name}"]`);
+        let loaded = null;
+        const renderSlots = () => {
+            const date = field('donation_date')?.value || '';
+            const day = loaded?.days.find(d => d.date === date);
+            field('time_slot')?.querySelectorAll('option').forEach(opt => {
+                const slot = day?.slots.find(s => s.time_slot === opt.value);
+                opt.disabled = !!slot && slot.available === 0;
+                opt.textContent = opt.value + (slot ? (slot.available ? ` (${slot.available} left)` : ' (full)') : '');
+            });
+            if (!heatmap || !loaded) return;
+            heatmap.innerHTML = '';
+            loaded.days.forEach(d => {
+                const cell = document.createElement('span');
+                cell.className = 'slot-day' + (d.date === date ? ' selected' : '');
+                cell.textContent = String(Number(d.date.slice(8)));
+                cell.title = `${d.date}: ${d.booked}/${d.capacity} booked`;
+                cell.style.background = d.occupancy >= 1 ? '#bdc3c7' : `rgba(231, 76, 60, ${0.1 + 0.8 * d.occupancy})`;
+                cell.addEventListener('click', () => {
+                    field('donation_date').value = d.date;
+                    renderSlots();
+                });
+                heatmap.appendChild(cell);
+            });
+        };
+        const loadSlots = async () => {
+            const date = field('donation_date')?.value || '';
+            const location = field('location')?.value || '';
+            if (!date || !location) return;
+            const month = date.slice(0, 7);
+            if (!loaded || loaded.month !== month || loaded.location !== location) {
+                const res = await window.BloodBridgeAPI.donors.slots(location, month);
+                loaded = res.ok && res.data.success ? res.data.data : null;
+            }
+            renderSlots();
+        };
+        field('donation_date')?.addEventListener('change', loadSlots);
+        field('location')?.addEventListener('change', loadSlots);
+
         scheduleForm.addEventListener('submit', async (e) => {
             e.preventDefault();
             const payload = {
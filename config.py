@@ -29,6 +29,93 @@ DONATIONS_TABLE = _get_env("DONATIONS_TABLE", "bloodbridge-donations")
 BLOOD_REQUESTS_TABLE = _get_env("BLOOD_REQUESTS_TABLE", "bloodbridge-blood-requests")
 MESSAGES_TABLE = _get_env("MESSAGES_TABLE", "bloodbridge-messages")
 ADMINS_TABLE = _get_env("ADMINS_TABLE", "bloodbridge-admins")
+STATS_TABLE = _get_env("STATS_TABLE", "bloodbridge-stats")
+DONOR_ELIGIBILITY_TABLE = _get_env("DONOR_ELIGIBILITY_TABLE", "bloodbridge-donor-eligibility")
+INVENTORY_UNITS_TABLE = _get_env("INVENTORY_UNITS_TABLE", "bloodbridge-inventory-units")
+DONATION_SLOTS_TABLE = _get_env("DONATION_SLOTS_TABLE", "bloodbridge-donation-slots")
+NOTIFICATION_OUTBOX_TABLE = _get_env("NOTIFICATION_OUTBOX_TABLE", "bloodbridge-notification-outbox")
+
+# DynamoDB call guard: retries, latency budget, circuit breaker, client-side rate limit
+DDB_CONNECT_TIMEOUT = int(_get_env("DDB_CONNECT_TIMEOUT", "2"))
+DDB_READ_TIMEOUT = int(_get_env("DDB_READ_TIMEOUT", "5"))
+DDB_MAX_ATTEMPTS = int(_get_env("DDB_MAX_ATTEMPTS", "4"))
+DDB_RETRY_BUDGET_MS = int(_get_env("DDB_RETRY_BUDGET_MS", "2000"))
+DDB_RETRY_BASE_MS = int(_get_env("DDB_RETRY_BASE_MS", "25"))
+DDB_BREAKER_FAILURE_THRESHOLD = int(_get_env("DDB_BREAKER_FAILURE_THRESHOLD", "5"))
+DDB_BREAKER_RESET_SECONDS = int(_get_env("DDB_BREAKER_RESET_SECONDS", "30"))
+DDB_RATE_LIMIT_INITIAL = int(_get_env("DDB_RATE_LIMIT_INITIAL", "200"))
+DDB_RATE_LIMIT_MIN = int(_get_env("DDB_RATE_LIMIT_MIN", "5"))
+DDB_RATE_LIMIT_MAX = int(_get_env("DDB_RATE_LIMIT_MAX", "1000"))
+
+# Per-request deadline; paging loops stop early and return partial results past it
+REQUEST_DEADLINE_MS = int(_get_env("REQUEST_DEADLINE_MS", "5000"))
+
+# Change-data-capture bus feeding derived views: "local" (worker pool) or "inline"
+EVENT_BUS = _get_env("EVENT_BUS", "local")
+EVENT_BUS_WORKERS = int(_get_env("EVENT_BUS_WORKERS", "4"))
+
+# Reconciler for derived views: parallel scan throttled to a read-capacity budget
+RECONCILE_READ_CAPACITY_PER_SECOND = int(_get_env("RECONCILE_READ_CAPACITY_PER_SECOND", "50"))
+RECONCILE_SEGMENTS = int(_get_env("RECONCILE_SEGMENTS", "4"))
+RECONCILE_PAGE_SIZE = int(_get_env("RECONCILE_PAGE_SIZE", "100"))
+
+# Donor notifications for new blood requests: an outbox entry is written with the
+# request and drained by background workers (0 = no workers; drain from a script).
+# Channel "local" keeps messages in memory (dev/tests), "smtp" sends through SMTP_*.
+# Recipients: eligible compatible donors within NOTIFY_RADIUS_KM of the hospital (or
+# the longest-eligible ones when it has no coordinates), at most NOTIFY_MAX_DONORS,
+# sent NOTIFY_BATCH_SIZE per message and at most NOTIFY_RATE_PER_SECOND recipients/s
+NOTIFY_CHANNEL = _get_env("NOTIFY_CHANNEL", "local")
+NOTIFY_WORKERS = int(_get_env("NOTIFY_WORKERS", "2"))
+NOTIFY_BATCH_SIZE = int(_get_env("NOTIFY_BATCH_SIZE", "50"))
+NOTIFY_RATE_PER_SECOND = int(_get_env("NOTIFY_RATE_PER_SECOND", "20"))
+NOTIFY_MAX_ATTEMPTS = int(_get_env("NOTIFY_MAX_ATTEMPTS", "5"))
+NOTIFY_RETRY_BASE_SECONDS = int(_get_env("NOTIFY_RETRY_BASE_SECONDS", "30"))
+NOTIFY_LEASE_SECONDS = int(_get_env("NOTIFY_LEASE_SECONDS", "120"))
+NOTIFY_POLL_SECONDS = int(_get_env("NOTIFY_POLL_SECONDS", "30"))
+NOTIFY_RADIUS_KM = int(_get_env("NOTIFY_RADIUS_KM", "25"))
+NOTIFY_MAX_DONORS = int(_get_env("NOTIFY_MAX_DONORS", "200"))
+SMTP_HOST = _get_env("SMTP_HOST", "localhost")
+SMTP_PORT = int(_get_env("SMTP_PORT", "587"))
+SMTP_USERNAME = _get_env("SMTP_USERNAME", "")
+SMTP_PASSWORD = _get_env("SMTP_PASSWORD", "")
+SMTP_SENDER = _get_env("SMTP_SENDER", "no-reply@bloodbridge.local")
+SMTP_USE_TLS = _get_env("SMTP_USE_TLS", "1").lower() in ("1", "true", "yes")
+
+# Web server (Dockerfile): gunicorn gthread workers with WEB_THREADS request threads each
+WEB_THREADS = int(_get_env("WEB_THREADS", "32"))
+
+# Live updates (SSE) for blood bank screens, fed from the shared stats table: the
+# write counters are polled every LIVE_POLL_SECONDS (sooner after a local write, then
+# settling for LIVE_MIN_INTERVAL_SECONDS), each listened scope's first LIVE_PENDING_LIMIT
+# pending requests are diffed; each subscriber buffers LIVE_QUEUE_SIZE messages (slower
+# clients are dropped and reconnect), the last LIVE_HISTORY messages are replayed on
+# reconnect (Last-Event-ID). A stream holds a thread: at most LIVE_MAX_SUBSCRIBERS per
+# worker, by default a quarter of WEB_THREADS short so regular requests still get served
+LIVE_MIN_INTERVAL_SECONDS = float(_get_env("LIVE_MIN_INTERVAL_SECONDS", "0.5"))
+LIVE_POLL_SECONDS = float(_get_env("LIVE_POLL_SECONDS", "1"))
+LIVE_PENDING_LIMIT = int(_get_env("LIVE_PENDING_LIMIT", "50"))
+LIVE_HEARTBEAT_SECONDS = int(_get_env("LIVE_HEARTBEAT_SECONDS", "15"))
+LIVE_QUEUE_SIZE = int(_get_env("LIVE_QUEUE_SIZE", "100"))
+LIVE_HISTORY = int(_get_env("LIVE_HISTORY", "200"))
+LIVE_MAX_SUBSCRIBERS = int(_get_env("LIVE_MAX_SUBSCRIBERS", str(max(1, WEB_THREADS * 3 // 4))))
+
+# Batch API (/api/batch): most sub-requests per call, and threads per process that run
+# independent (GET) sub-requests in parallel
+BATCH_MAX_REQUESTS = int(_get_env("BATCH_MAX_REQUESTS", "20"))
+BATCH_WORKERS = int(_get_env("BATCH_WORKERS", "4"))
+
+# Request coalescing (singleflight) for expensive dashboard payloads: concurrent callers
+# share one computation, whose result is reused for SINGLEFLIGHT_RESULT_TTL_SECONDS (keys
+# include the data versions, so a reused result is never stale). SINGLEFLIGHT_SHARED=1
+# also coalesces across worker processes through a lease item in the stats table; callers
+# wait up to SINGLEFLIGHT_WAIT_SECONDS for another worker's result, checking every
+# SINGLEFLIGHT_POLL_SECONDS, and a lease older than SINGLEFLIGHT_LEASE_SECONDS is taken over
+SINGLEFLIGHT_SHARED = _get_env("SINGLEFLIGHT_SHARED", "0").lower() in ("1", "true", "yes")
+SINGLEFLIGHT_RESULT_TTL_SECONDS = float(_get_env("SINGLEFLIGHT_RESULT_TTL_SECONDS", "2"))
+SINGLEFLIGHT_WAIT_SECONDS = float(_get_env("SINGLEFLIGHT_WAIT_SECONDS", "10"))
+SINGLEFLIGHT_POLL_SECONDS = float(_get_env("SINGLEFLIGHT_POLL_SECONDS", "0.05"))
+SINGLEFLIGHT_LEASE_SECONDS = float(_get_env("SINGLEFLIGHT_LEASE_SECONDS", "15"))
 
 # App
 DEBUG = _get_env("FLASK_DEBUG", "0").lower() in ("1", "true", "yes")
@@ -40,7 +127,79 @@ BLOOD_GROUPS = ["A+", "A-", "B+", "B-", "AB+", "AB-", "O+", "O-"]
 
 # Donation statuses
 DONATION_STATUSES = ["Scheduled", "Completed", "Cancelled"]
-REQUEST_STATUSES = ["pending", "fulfilled", "cancelled"]
+# Status changes the bulk check-in API accepts (from -> allowed targets); a completed
+# donation can only be cancelled as a correction, which discards its unit if unused
+DONATION_TRANSITIONS = {
+    "Scheduled": ["Completed", "Cancelled"],
+    "Completed": ["Cancelled"],
+    "Cancelled": ["Scheduled"],
+}
+# Most donations one bulk status request may change
+MAX_DONATION_TRANSITIONS = int(_get_env("MAX_DONATION_TRANSITIONS", "500"))
+
+# Donation slots: bookings allowed per location, date and time slot (per-slot overrides
+# via the admin API); the schedule page offers these time slots
+DONATION_SLOT_CAPACITY = int(_get_env("DONATION_SLOT_CAPACITY", "20"))
+DONATION_TIME_SLOTS = [
+    "Morning (09:00 AM - 12:00 PM)",
+    "Afternoon (12:00 PM - 04:00 PM)",
+    "Evening (04:00 PM - 07:00 PM)",
+]
+
+# Minimum days between whole-blood donations (next eligible = last donation + deferral)
+DONATION_DEFERRAL_DAYS = int(_get_env("DONATION_DEFERRAL_DAYS", "56"))
+REQUEST_STATUSES = ["pending", "reserved", "fulfilled", "cancelled"]
+# Request urgency, most urgent first; pending requests are queued by urgency, then age
+REQUEST_URGENCIES = ["emergency", "urgent", "routine"]
+DEFAULT_REQUEST_URGENCY = "routine"
+
+# Inventory units (one per completed donation); only "available" units count as stock
+UNIT_STATUSES = ["available", "reserved", "issued", "expired", "discarded"]
+UNIT_SHELF_LIFE_DAYS = int(_get_env("UNIT_SHELF_LIFE_DAYS", "42"))
+# Usable-inventory counter is split across N stats items per group, summed on read
+# (changing N requires python scripts/rebuild_derived_views.py)
+INVENTORY_COUNTER_SHARDS = int(_get_env("INVENTORY_COUNTER_SHARDS", "8"))
+
+# Request availability: "compatible" (ABO/Rh-compatible stock counts) or "exact" (same group only)
+AVAILABILITY_MODE = _get_env("AVAILABILITY_MODE", "compatible")
+
+# Allocation of inventory across pending requests, computed on a background thread:
+# full resync from the tables every N seconds, shared version counters polled every
+# ALLOCATION_POLL_SECONDS (changes from other workers), a partial read retried after
+# ALLOCATION_PARTIAL_RETRY_SECONDS; the first request waits up to ALLOCATION_WAIT_SECONDS
+ALLOCATION_RESYNC_SECONDS = int(_get_env("ALLOCATION_RESYNC_SECONDS", "60"))
+ALLOCATION_POLL_SECONDS = float(_get_env("ALLOCATION_POLL_SECONDS", "2"))
+ALLOCATION_PARTIAL_RETRY_SECONDS = float(_get_env("ALLOCATION_PARTIAL_RETRY_SECONDS", "5"))
+ALLOCATION_WAIT_SECONDS = float(_get_env("ALLOCATION_WAIT_SECONDS", "3"))
+
+# Proximity search: items with coordinates are indexed by the first N geohash characters
+# (3 = cells of roughly 150 km); radius searches are capped at MAX_PROXIMITY_RADIUS_KM
+GEO_CELL_PRECISION = int(_get_env("GEO_CELL_PRECISION", "3"))
+MAX_PROXIMITY_RADIUS_KM = int(_get_env("MAX_PROXIMITY_RADIUS_KM", "50"))
+# Only blood banks see individual donors near a point; everyone else gets counts per
+# blood group over at least this radius, so repeated small searches cannot locate a donor
+DONOR_COUNT_MIN_RADIUS_KM = int(_get_env("DONOR_COUNT_MIN_RADIUS_KM", "5"))
+
+# Donor ranking for outreach: eligible candidates read per compatible donor group
+DONOR_RANK_CANDIDATES = int(_get_env("DONOR_RANK_CANDIDATES", "5000"))
+
+# Shortage alerts per blood group, evaluated as requests and units are written:
+# "shortage" when pending units >= N% of usable units, "low" when usable units < N
+# (per-group overrides via the admin API)
+SHORTAGE_DEMAND_PERCENT = int(_get_env("SHORTAGE_DEMAND_PERCENT", "100"))
+SHORTAGE_MIN_UNITS = int(_get_env("SHORTAGE_MIN_UNITS", "5"))
+
+# Blood bank sites (comma-separated ids). Donations, requests and units belong to one
+# site (the first is the default); counters are kept per site plus a network roll-up
+SITE_IDS = [s.strip() for s in _get_env("SITE_IDS", "main").split(",") if s.strip()]
+DEFAULT_SITE_ID = SITE_IDS[0]
+
+# Demand forecasting (admin API): days of daily rollups kept in memory, days ahead to
+# forecast, and the exponential smoothing factors for level and trend
+FORECAST_HISTORY_DAYS = int(_get_env("FORECAST_HISTORY_DAYS", "84"))
+FORECAST_HORIZON_DAYS = int(_get_env("FORECAST_HORIZON_DAYS", "7"))
+FORECAST_ALPHA = float(_get_env("FORECAST_ALPHA", "0.3"))
+FORECAST_BETA = float(_get_env("FORECAST_BETA", "0.1"))
 
 # Roles
 ROLES = ["donor", "recipient", "bloodbank", "admin"]
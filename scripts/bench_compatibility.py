@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Benchmark the ABO/Rh compatibility engine: availability for N requests at once.
+Run from project root: python scripts/bench_compatibility.py [N ...]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.compatibility import (
+    COMPATIBLE,
+    EXACT,
+    encode_requests,
+    evaluate_availability,
+    evaluate_encoded,
+    supply_by_recipient_group,
+)
+from config import BLOOD_GROUPS
+
+
+def best_of(fn, repeat=50):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main(sizes):
+    rng = random.Random(42)
+    inventory = {bg: rng.randint(0, 40) for bg in BLOOD_GROUPS}
+    print(f"{'requests':>9}  {'mode':<10}  {'evaluate (ms)':>13}  {'end-to-end (ms)':>15}")
+    for n in sizes:
+        requests = [{"blood_group": rng.choice(BLOOD_GROUPS), "units": rng.randint(1, 10)} for _ in range(n)]
+        groups, units = encode_requests(requests)
+        for mode in (EXACT, COMPATIBLE):
+            # evaluate: supply vector + vectorized check on pre-encoded requests.
+            evaluate = best_of(lambda: evaluate_encoded(groups, units, supply_by_recipient_group(inventory, mode)))
+            # end-to-end: from request dicts to per-request result dicts.
+            end_to_end = best_of(lambda: evaluate_availability(requests, inventory, mode=mode), repeat=10)
+            print(f"{n:>9}  {mode:<10}  {evaluate:>13.3f}  {end_to_end:>15.3f}")
+
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or [1000, 5000, 20000])
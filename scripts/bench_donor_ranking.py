@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Benchmark the donor ranking engine: score and top-k N candidate donors.
+Run from project root: python scripts/bench_donor_ranking.py [N ...]
+"""
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.donor_ranking import DonorFeatures, DonorRanker
+from config import BLOOD_GROUPS
+
+
+def best_of(fn, repeat=20):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main(sizes, k=20):
+    rng = random.Random(42)
+    today = date.today()
+    ranker = DonorRanker()
+    scarcity = [rng.random() for _ in BLOOD_GROUPS]
+    origin = (51.5, -0.12)
+    print(f"{'donors':>9}  {'features (ms)':>13}  {'top-k (ms)':>10}")
+    for n in sizes:
+        donors = []
+        for i in range(n):
+            booked = rng.randint(1, 12)
+            donors.append({
+                "donor_id": f"d{i}",
+                "blood_group": rng.choice(BLOOD_GROUPS),
+                "last_donation": (today - timedelta(days=rng.randint(56, 1500))).isoformat(),
+                "lat": origin[0] + rng.uniform(-0.5, 0.5) if rng.random() < 0.8 else None,
+                "lon": origin[1] + rng.uniform(-0.5, 0.5),
+                "booked": booked,
+                "completed": rng.randint(0, booked),
+            })
+        # features: dicts -> columnar arrays (once per candidate set).
+        features_ms = best_of(lambda: DonorFeatures(donors), repeat=5)
+        features = DonorFeatures(donors)
+        # top-k: vectorized scoring + argpartition over the arrays.
+        top_k_ms = best_of(lambda: ranker.top_k(features, k, origin=origin, scarcity=scarcity))
+        print(f"{n:>9}  {features_ms:>13.3f}  {top_k_ms:>10.3f}")
+
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or [1000, 10000, 50000])
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Benchmark response formats: encode time and payload size, JSON vs MessagePack,
+for admin list responses (users, requests, donations) of N items.
+Sizes are also shown gzip-compressed, as sent to clients that accept gzip.
+Run from project root: python scripts/bench_response_formats.py [N ...]
+"""
+import gzip
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+
+from app.models.donor import Donation
+from app.models.request import BloodRequest
+from app.models.user import User
+from app.services.responses import JSON, MSGPACK, encode, envelope
+from config import BLOOD_GROUPS, DONATION_STATUSES, REQUEST_STATUSES, REQUEST_URGENCIES, SITE_IDS
+
+
+def best_of(fn, repeat=10):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def _coords(rng):
+    return (round(51.5 + rng.uniform(-0.5, 0.5), 6), round(-0.12 + rng.uniform(-0.5, 0.5), 6))
+
+
+def users(rng, n):
+    return [User.to_serializable({
+        "id": str(uuid.UUID(int=rng.getrandbits(128))),
+        "name": f"User {i}",
+        "email": f"user{i}@example.com",
+        "role": rng.choice(["user", "user", "user", "bloodbank"]),
+        "current_role": rng.choice(["donor", "recipient"]),
+        "blood_group": rng.choice(BLOOD_GROUPS),
+        "site_id": rng.choice(SITE_IDS),
+    }) for i in range(n)]
+
+
+def requests(rng, n):
+    today = date.today()
+    out = []
+    for i in range(n):
+        lat, lon = _coords(rng)
+        out.append(BloodRequest.to_serializable({
+            "id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "requester_id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "patient_name": f"Patient {i}",
+            "blood_group": rng.choice(BLOOD_GROUPS),
+            "units": rng.randint(1, 6),
+            "hospital": f"General Hospital {rng.randint(1, 40)}",
+            "status": rng.choice(REQUEST_STATUSES),
+            "urgency": rng.choice(REQUEST_URGENCIES),
+            "site_id": rng.choice(SITE_IDS),
+            "timestamp": (today - timedelta(days=rng.randint(0, 365))).isoformat() + "T10:00:00",
+            "lat": lat,
+            "lon": lon,
+        }))
+    return out
+
+
+def donations(rng, n):
+    today = date.today()
+    out = []
+    for i in range(n):
+        lat, lon = _coords(rng)
+        out.append(Donation.to_serializable({
+            "id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "donor_id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "donor_name": f"Donor {i}",
+            "blood_group": rng.choice(BLOOD_GROUPS),
+            "date": (today - timedelta(days=rng.randint(0, 365))).isoformat(),
+            "location": f"Centre {rng.randint(1, 20)}",
+            "time_slot": rng.choice(["09:00", "11:00", "14:00", "16:00"]),
+            "status": rng.choice(DONATION_STATUSES),
+            "site_id": rng.choice(SITE_IDS),
+            "lat": lat,
+            "lon": lon,
+        }))
+    return out
+
+
+def main(sizes):
+    rng = random.Random(42)
+    print(f"{'list':>9}  {'items':>6}  {'format':>7}  {'encode (ms)':>11}  {'bytes':>9}  {'gzip bytes':>10}")
+    for name, build in (("users", users), ("requests", requests), ("donations", donations)):
+        for n in sizes:
+            payload = envelope(True, "OK", {name: build(rng, n), "partial": False, "cursor": None})
+            for label, media_type in (("json", JSON), ("msgpack", MSGPACK)):
+                encode_ms = best_of(lambda: encode(payload, media_type))
+                body = encode(payload, media_type)
+                print(
+                    f"{name:>9}  {n:>6}  {label:>7}  {encode_ms:>11.3f}  {len(body):>9}  {len(gzip.compress(body)):>10}"
+                )
+
+
+if __name__ == "__main__":
+    # encode() uses the app's JSON provider (and its default for dates / Decimals).
+    with Flask(__name__).app_context():
+        main([int(a) for a in sys.argv[1:]] or [100, 1000, 10000])
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+Report how every data-access function reaches DynamoDB (GetItem/Query/Scan/...).
+Exits non-zero when a user-facing access pattern falls back to a Scan or the code
+disagrees with app/services/schema.py.
+Run from project root: python scripts/check_access_patterns.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.schema import access_pattern_report
+
+
+def main():
+    rows, failures = access_pattern_report()
+    width = max(len(r["function"]) for r in rows)
+    for r in rows:
+        scope = "user" if r["user_facing"] else "admin"
+        index = f" via {', '.join(r['indexes'])}" if r["indexes"] else ""
+        print(f"{r['function']:<{width}}  {scope:<5}  {r['table']:<15}  {'/'.join(r['operations'])}{index}")
+    if failures:
+        print()
+        print(f"{len(failures)} problem(s):")
+        for f in failures:
+            print(f"  - {f}")
+        return 1
+    print()
+    print("All access patterns OK.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
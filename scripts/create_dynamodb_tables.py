@@ -1,11 +1,13 @@
 #!/usr/bin/env python3
 """
-Create DynamoDB tables for Blood Bridge.
+Create DynamoDB tables for Blood Bridge from the declarative schema
+(app/services/schema.py). Existing tables get any missing GSIs added.
 Run from project root: python scripts/create_dynamodb_tables.py
 Requires: AWS credentials (env or ~/.aws/credentials), boto3.
 """
 import os
 import sys
+import time
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
@@ -16,14 +18,12 @@ except ImportError:
     pass
 
 import boto3
-from config import (
-    AWS_REGION,
-    USERS_TABLE,
-    DONATIONS_TABLE,
-    BLOOD_REQUESTS_TABLE,
-    MESSAGES_TABLE,
-    ADMINS_TABLE,
-)
+from config import AWS_REGION
+from app.services.schema import TABLES, create_table_params, plan_table_updates
+
+# How often, and for how long, to poll a new index until it is ACTIVE.
+INDEX_POLL_SECONDS = 10
+INDEX_WAIT_SECONDS = 30 * 60
 
 
 def get_client():
@@ -34,123 +34,53 @@ def get_client():
     return boto3.client("dynamodb", **kwargs)
 
 
-def create_tables(client):
-    # Users: PK id (S), GSI email-index (email as PK for login lookup)
-    try:
-        client.create_table(
-            TableName=USERS_TABLE,
-            KeySchema=[{"AttributeName": "id", "KeyType": "HASH"}],
-            AttributeDefinitions=[
-                {"AttributeName": "id", "AttributeType": "S"},
-                {"AttributeName": "email", "AttributeType": "S"},
-            ],
-            GlobalSecondaryIndexes=[
-                {
-                    "IndexName": "email-index",
-                    "KeySchema": [{"AttributeName": "email", "KeyType": "HASH"}],
-                    "Projection": {"ProjectionType": "ALL"},
-                }
-            ],
-            BillingMode="PAY_PER_REQUEST",
-        )
-        print(f"Created table: {USERS_TABLE}")
-    except client.exceptions.ResourceInUseException:
-        print(f"Table {USERS_TABLE} already exists.")
+def wait_for_table(client, name):
+    """Block until table name exists and is ACTIVE."""
+    client.get_waiter("table_exists").wait(TableName=name)
 
-    # Donations: PK id (S), GSI donor_id-date-index
-    try:
-        client.create_table(
-            TableName=DONATIONS_TABLE,
-            KeySchema=[{"AttributeName": "id", "KeyType": "HASH"}],
-            AttributeDefinitions=[
-                {"AttributeName": "id", "AttributeType": "S"},
-                {"AttributeName": "donor_id", "AttributeType": "S"},
-                {"AttributeName": "date", "AttributeType": "S"},
-            ],
-            GlobalSecondaryIndexes=[
-                {
-                    "IndexName": "donor_id-date-index",
-                    "KeySchema": [
-                        {"AttributeName": "donor_id", "KeyType": "HASH"},
-                        {"AttributeName": "date", "KeyType": "RANGE"},
-                    ],
-                    "Projection": {"ProjectionType": "ALL"},
-                }
-            ],
-            BillingMode="PAY_PER_REQUEST",
-        )
-        print(f"Created table: {DONATIONS_TABLE}")
-    except client.exceptions.ResourceInUseException:
-        print(f"Table {DONATIONS_TABLE} already exists.")
 
-    # Blood requests: PK id (S), GSIs requester_id-timestamp-index, status-timestamp-index
-    try:
-        client.create_table(
-            TableName=BLOOD_REQUESTS_TABLE,
-            KeySchema=[{"AttributeName": "id", "KeyType": "HASH"}],
-            AttributeDefinitions=[
-                {"AttributeName": "id", "AttributeType": "S"},
-                {"AttributeName": "requester_id", "AttributeType": "S"},
-                {"AttributeName": "status", "AttributeType": "S"},
-                {"AttributeName": "timestamp", "AttributeType": "S"},
-            ],
-            GlobalSecondaryIndexes=[
-                {
-                    "IndexName": "requester_id-timestamp-index",
-                    "KeySchema": [
-                        {"AttributeName": "requester_id", "KeyType": "HASH"},
-                        {"AttributeName": "timestamp", "KeyType": "RANGE"},
-                    ],
-                    "Projection": {"ProjectionType": "ALL"},
-                },
-                {
-                    "IndexName": "status-timestamp-index",
-                    "KeySchema": [
-                        {"AttributeName": "status", "KeyType": "HASH"},
-                        {"AttributeName": "timestamp", "KeyType": "RANGE"},
-                    ],
-                    "Projection": {"ProjectionType": "ALL"},
-                },
-            ],
-            BillingMode="PAY_PER_REQUEST",
-        )
-        print(f"Created table: {BLOOD_REQUESTS_TABLE}")
-    except client.exceptions.ResourceInUseException:
-        print(f"Table {BLOOD_REQUESTS_TABLE} already exists.")
+def wait_for_index(client, name, index_name):
+    """Block until index_name on name is ACTIVE (backfill done), and the table too.
 
-    # Messages: PK id (S)
-    try:
-        client.create_table(
-            TableName=MESSAGES_TABLE,
-            KeySchema=[{"AttributeName": "id", "KeyType": "HASH"}],
-            AttributeDefinitions=[{"AttributeName": "id", "AttributeType": "S"}],
-            BillingMode="PAY_PER_REQUEST",
-        )
-        print(f"Created table: {MESSAGES_TABLE}")
-    except client.exceptions.ResourceInUseException:
-        print(f"Table {MESSAGES_TABLE} already exists.")
+    DynamoDB rejects an index create while another is still being built on the same table.
+    """
+    give_up = time.monotonic() + INDEX_WAIT_SECONDS
+    while True:
+        wait_for_table(client, name)
+        description = client.describe_table(TableName=name)["Table"]
+        statuses = {
+            gsi["IndexName"]: gsi.get("IndexStatus")
+            for gsi in description.get("GlobalSecondaryIndexes", [])
+        }
+        if statuses.get(index_name) == "ACTIVE" and description.get("TableStatus") == "ACTIVE":
+            return
+        if time.monotonic() > give_up:
+            raise TimeoutError(f"Index {index_name} on {name} is still {statuses.get(index_name)}")
+        time.sleep(INDEX_POLL_SECONDS)
 
-    # Admins: PK id (S), GSI admin-email-index (email as PK for admin login)
-    try:
-        client.create_table(
-            TableName=ADMINS_TABLE,
-            KeySchema=[{"AttributeName": "id", "KeyType": "HASH"}],
-            AttributeDefinitions=[
-                {"AttributeName": "id", "AttributeType": "S"},
-                {"AttributeName": "email", "AttributeType": "S"},
-            ],
-            GlobalSecondaryIndexes=[
-                {
-                    "IndexName": "admin-email-index",
-                    "KeySchema": [{"AttributeName": "email", "KeyType": "HASH"}],
-                    "Projection": {"ProjectionType": "ALL"},
-                }
-            ],
-            BillingMode="PAY_PER_REQUEST",
-        )
-        print(f"Created table: {ADMINS_TABLE}")
-    except client.exceptions.ResourceInUseException:
-        print(f"Table {ADMINS_TABLE} already exists.")
+
+def create_tables(client):
+    """Create every table in app.services.schema.TABLES; add GSIs missing from existing tables."""
+    for table_key in TABLES:
+        params = create_table_params(table_key)
+        name = params["TableName"]
+        try:
+            client.create_table(**params)
+            print(f"Created table: {name}")
+            wait_for_table(client, name)
+            continue
+        except client.exceptions.ResourceInUseException:
+            print(f"Table {name} already exists.")
+        # It may still be CREATING (or UPDATING), and would reject index updates.
+        wait_for_table(client, name)
+        description = client.describe_table(TableName=name)["Table"]
+        for update in plan_table_updates(table_key, description):
+            index_name = update["GlobalSecondaryIndexUpdates"][0]["Create"]["IndexName"]
+            client.update_table(**update)
+            print(f"  Creating index {index_name} on {name}")
+            # One index build at a time: wait for it to finish before the next.
+            wait_for_index(client, name, index_name)
+            print(f"  Index {index_name} on {name} is ACTIVE")
 
 
 if __name__ == "__main__":